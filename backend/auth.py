@@ -1,23 +1,156 @@
+import asyncio
 import bcrypt
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import Deque, Dict, Optional
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
 
-# JWT settings
-SECRET_KEY = "your-secret-key-change-this-in-production-2026"
+from utils import LazyModule
+
+# jose.jwt pulls in the cryptography backends; load it with the first token
+jwt = LazyModule("jose.jwt")
+
+# JWT settings. Without SECRET_KEY a random key is generated: tokens then
+# stop working on restart and are only valid on the worker that issued them
+SECRET_KEY = os.getenv("SECRET_KEY") or secrets.token_urlsafe(32)
+SECRET_KEY_GENERATED = not os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt cost factor for new hashes; stored hashes with another cost are
+# rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hashing runs on its own threads so login bursts cannot take over the
+# request threadpool. At most HASH_WORKERS hashes run at once and at most
+# HASH_QUEUE_LIMIT more wait; beyond that callers get HashPoolBusy.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "16"))
+
+# Login attempts allowed per username and per client IP in each window
+LOGIN_ATTEMPTS_PER_USERNAME = int(os.getenv("LOGIN_ATTEMPTS_PER_USERNAME", "5"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "20"))
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+
+# Proxies in front of the app that append to X-Forwarded-For (1 on Render);
+# 0 uses the address of the TCP peer
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Verified tokens remembered until they expire; 0 verifies every request
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "256"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing pool already has HASH_QUEUE_LIMIT jobs waiting."""
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash."""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password: str) -> str:
     """Hash a password."""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash uses a different cost than BCRYPT_ROUNDS."""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
+def _submit(fn, *args):
+    """Queue fn on the hashing pool, or raise HashPoolBusy if it is full."""
+    if not _hash_slots.acquire(blocking=False):
+        raise HashPoolBusy()
+    future = _hash_executor.submit(fn, *args)
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return future
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the hashing pool."""
+    return await asyncio.wrap_future(_submit(verify_password, plain_password, hashed_password))
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the hashing pool."""
+    return await asyncio.wrap_future(_submit(get_password_hash, password))
+
+def hash_password_in_pool(password: str) -> str:
+    """get_password_hash on the hashing pool, for sync callers."""
+    return _submit(get_password_hash, password).result()
+
+class LoginRateLimiter:
+    """Sliding-window limit on login attempts per username and per client IP."""
+    
+    def __init__(self, per_username: int = LOGIN_ATTEMPTS_PER_USERNAME,
+                 per_ip: int = LOGIN_ATTEMPTS_PER_IP, window: float = LOGIN_WINDOW_SECONDS):
+        self.limits = {"user": per_username, "ip": per_ip}
+        self.window = window
+        self._attempts: Dict[tuple, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+    
+    def hit(self, username: str, ip: Optional[str]) -> Optional[float]:
+        """
+        Record an attempt. Returns None if it is allowed, otherwise the number
+        of seconds until the client may try again (the attempt is not recorded).
+        """
+        now = time.monotonic()
+        keys = [("user", username.lower())]
+        if ip:
+            keys.append(("ip", ip))
+        
+        with self._lock:
+            if now - self._last_sweep > self.window:
+                self._sweep(now)
+            
+            retry_after = None
+            for key in keys:
+                attempts = self._attempts.setdefault(key, deque())
+                while attempts and attempts[0] <= now - self.window:
+                    attempts.popleft()
+                if len(attempts) >= self.limits[key[0]]:
+                    wait = attempts[0] + self.window - now
+                    retry_after = max(retry_after or 0.0, wait)
+            
+            if retry_after is not None:
+                return retry_after
+            for key in keys:
+                self._attempts[key].append(now)
+            return None
+    
+    def _sweep(self, now: float):
+        """Forget keys without attempts in the current window."""
+        self._attempts = {
+            key: attempts for key, attempts in self._attempts.items()
+            if attempts and attempts[-1] > now - self.window
+        }
+        self._last_sweep = now
+
+login_rate_limiter = LoginRateLimiter()
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    Address of the client for rate limiting. Behind TRUSTED_PROXY_HOPS
+    proxies it is the X-Forwarded-For entry added by the outermost one;
+    entries before it come from the client and are ignored.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [host.strip() for host in request.headers.get("x-forwarded-for", "").split(",") if host.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -28,3 +161,79 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+class TokenCache:
+    """
+    LRU of tokens that already passed signature verification.
+    
+    Entries are keyed by the whole token, not only its signature, so a cached
+    signature cannot be replayed with a different header or payload. Each
+    entry is dropped once the token's exp has passed.
+    """
+    
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (exp, payload)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+    
+    def set(self, token: str, payload: dict):
+        if self.max_entries <= 0 or "exp" not in payload:
+            return
+        with self._lock:
+            self._entries[token] = (float(payload["exp"]), payload)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
+def decode_access_token(token: str) -> dict:
+    """Verify a token and return its claims, using token_cache for repeat calls."""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.set(token, payload)
+    return payload
+
+_bearer = HTTPBearer(auto_error=False)
+
+async def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> str:
+    """Dependency for admin routes: returns the username from a valid bearer token."""
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="يجب تسجيل الدخول",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    try:
+        username = decode_access_token(credentials.credentials).get("sub")
+    except JWTError:
+        username = None
+    if not username:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="رمز الدخول غير صالح أو منتهي الصلاحية",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return username
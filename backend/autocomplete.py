@@ -0,0 +1,231 @@
+"""
+In-memory prefix index for name autocomplete.
+
+Doctor and clinic names are stored in their normalize_arabic() form in
+sorted arrays, per kind: one keyed by the full name and one keyed by every
+later word of the name ("احمد علي" for "محمد احمد علي"), so typing any word
+finds the name. A lookup is a bisect to the first key with the typed prefix
+and a scan of at most limit entries past it. Full-name matches come before
+word matches, and doctors before clinics.
+
+Writes update the arrays in place through reload(); like the spatial
+index, the whole index is also rebuilt in the background every
+AUTOCOMPLETE_INDEX_TTL seconds so multiple workers converge.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import database
+from utils import normalize_arabic
+
+# Seconds before the index is rebuilt from the database
+AUTOCOMPLETE_INDEX_TTL = float(os.getenv("AUTOCOMPLETE_INDEX_TTL", "300"))
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+DOCTOR = "doctor"
+CLINIC = "clinic"
+
+KINDS = (DOCTOR, CLINIC)
+
+Key = Tuple[str, int]  # (normalized key, id)
+
+def _keys(normalized: str) -> Tuple[str, List[str]]:
+    """The full-name key and one key per later word."""
+    words = normalized.split()
+    return normalized, [" ".join(words[i:]) for i in range(1, len(words))]
+
+class PrefixIndex:
+    """Sorted arrays of normalized doctor and clinic names, searchable by prefix."""
+
+    def __init__(self, ttl: float = AUTOCOMPLETE_INDEX_TTL):
+        self.ttl = ttl
+        self._names: Dict[str, List[Key]] = {kind: [] for kind in KINDS}
+        self._words: Dict[str, List[Key]] = {kind: [] for kind in KINDS}
+        self._entries: Dict[Tuple[str, int], Tuple[str, str, int]] = {}  # (kind, id) -> (name, normalized, ref)
+        self._doctor_specialty: Dict[int, int] = {}
+        self._specialties: Dict[int, str] = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.RLock()
+        # Held by the background refresh, so at most one runs at a time
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def needs_build(self) -> bool:
+        """True until the index is first built; later rebuilds run in the background."""
+        return self._built_at is None
+
+    # ---------- maintenance ----------
+
+    def rebuild(self, db: Session):
+        """Load every specialty, doctor and clinic name from the database."""
+        specialties = db.query(database.Specialty.id, database.Specialty.name).all()
+        doctors = db.query(
+            database.Doctor.id, database.Doctor.name, database.Doctor.name_normalized, database.Doctor.specialty_id
+        ).all()
+        clinics = db.query(database.Clinic.id, database.Clinic.name, database.Clinic.doctor_id).all()
+
+        names: Dict[str, List[Key]] = {kind: [] for kind in KINDS}
+        words: Dict[str, List[Key]] = {kind: [] for kind in KINDS}
+        entries = {}
+        for doctor_id, name, normalized, specialty_id in doctors:
+            normalized = normalized if normalized is not None else normalize_arabic(name)
+            entries[(DOCTOR, doctor_id)] = (name, normalized, specialty_id)
+        for clinic_id, name, doctor_id in clinics:
+            entries[(CLINIC, clinic_id)] = (name, normalize_arabic(name), doctor_id)
+        for (kind, item_id), (_, normalized, _) in entries.items():
+            full, later = _keys(normalized)
+            names[kind].append((full, item_id))
+            words[kind].extend((key, item_id) for key in later)
+        for kind in KINDS:
+            names[kind].sort()
+            words[kind].sort()
+
+        with self._lock:
+            self._names = names
+            self._words = words
+            self._entries = entries
+            self._specialties = dict(specialties)
+            self._doctor_specialty = {doctor_id: specialty_id for doctor_id, _, _, specialty_id in doctors}
+            self._built_at = time.monotonic()
+
+    def ensure_built(self, db: Session):
+        """Build the index on first use, later see refresh_if_stale()."""
+        if self.needs_build:
+            self.rebuild(db)
+        else:
+            self.refresh_if_stale()
+
+    def refresh_if_stale(self):
+        """
+        Once the index is older than the TTL, rebuild it on a single
+        background thread; suggestions keep coming from the current index.
+        """
+        built_at = self._built_at
+        if built_at is None or time.monotonic() - built_at <= self.ttl:
+            return
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                database.run_in_background("autocomplete-refresh", self._refresh)
+            except BaseException:
+                self._refresh_lock.release()
+                raise
+
+    def _refresh(self, db: Session):
+        try:
+            self.rebuild(db)
+        finally:
+            self._refresh_lock.release()
+
+    def clear(self):
+        """Drop all entries and force a rebuild on the next query."""
+        with self._lock:
+            self._names = {kind: [] for kind in KINDS}
+            self._words = {kind: [] for kind in KINDS}
+            self._entries = {}
+            self._doctor_specialty = {}
+            self._specialties = {}
+            self._built_at = None
+
+    def reload(self, db: Session, doctor_ids: Iterable[int] = (), clinic_ids: Iterable[int] = (),
+               specialty_ids: Iterable[int] = ()):
+        """
+        Re-read the given rows after a write: rows that still exist are
+        updated, missing ones are removed. No-op until the index is built.
+        """
+        if self._built_at is None:
+            return
+        doctor_ids, clinic_ids, specialty_ids = set(doctor_ids), set(clinic_ids), set(specialty_ids)
+        specialties = doctors = clinics = []
+        if specialty_ids:
+            specialties = db.query(database.Specialty.id, database.Specialty.name).filter(
+                database.Specialty.id.in_(specialty_ids)
+            ).all()
+        if doctor_ids:
+            doctors = db.query(
+                database.Doctor.id, database.Doctor.name, database.Doctor.name_normalized, database.Doctor.specialty_id
+            ).filter(database.Doctor.id.in_(doctor_ids)).all()
+        if clinic_ids:
+            clinics = db.query(database.Clinic.id, database.Clinic.name, database.Clinic.doctor_id).filter(
+                database.Clinic.id.in_(clinic_ids)
+            ).all()
+
+        with self._lock:
+            self._specialties.update(specialties)
+            for doctor_id in doctor_ids:
+                self._remove(DOCTOR, doctor_id)
+                self._doctor_specialty.pop(doctor_id, None)
+            for doctor_id, name, normalized, specialty_id in doctors:
+                normalized = normalized if normalized is not None else normalize_arabic(name)
+                self._insert(DOCTOR, doctor_id, name, normalized, specialty_id)
+                self._doctor_specialty[doctor_id] = specialty_id
+            for clinic_id in clinic_ids:
+                self._remove(CLINIC, clinic_id)
+            for clinic_id, name, doctor_id in clinics:
+                self._insert(CLINIC, clinic_id, name, normalize_arabic(name), doctor_id)
+
+    def _insert(self, kind: str, item_id: int, name: str, normalized: str, ref: int):
+        self._entries[(kind, item_id)] = (name, normalized, ref)
+        full, later = _keys(normalized)
+        insort(self._names[kind], (full, item_id))
+        for key in later:
+            insort(self._words[kind], (key, item_id))
+
+    def _remove(self, kind: str, item_id: int):
+        entry = self._entries.pop((kind, item_id), None)
+        if entry is None:
+            return
+        full, later = _keys(entry[1])
+        _discard(self._names[kind], (full, item_id))
+        for key in later:
+            _discard(self._words[kind], (key, item_id))
+
+    # ---------- queries ----------
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS, kind: Optional[str] = None) -> List[dict]:
+        """Up to limit names starting with prefix (already normalized)."""
+        kinds = (kind,) if kind else KINDS
+        results = []
+        seen = set()
+        with self._lock:
+            arrays = [(self._names[k], k) for k in kinds] + [(self._words[k], k) for k in kinds]
+            for keys, entry_kind in arrays:
+                position = bisect_left(keys, (prefix,))
+                while position < len(keys) and len(results) < limit:
+                    key, item_id = keys[position]
+                    if not key.startswith(prefix):
+                        break
+                    position += 1
+                    if (entry_kind, item_id) not in seen:
+                        seen.add((entry_kind, item_id))
+                        results.append(self._suggestion(entry_kind, item_id))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _suggestion(self, kind: str, item_id: int) -> dict:
+        name, _, ref = self._entries[(kind, item_id)]
+        specialty_id = ref if kind == DOCTOR else self._doctor_specialty.get(ref)
+        return {
+            "type": kind,
+            "id": item_id,
+            "name": name,
+            "specialty": self._specialties.get(specialty_id),
+        }
+
+def _discard(keys: List[Key], key: Key):
+    position = bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+# Shared index used by the API
+index = PrefixIndex()
@@ -0,0 +1,457 @@
+"""
+Streaming database export and import.
+
+Rows are read table by table with yield_per (server-side cursors on
+PostgreSQL) and written out in small chunks, so memory use does not depend
+on the size of the tables. Two formats are supported:
+
+- json: the same document /api/admin/export-database has always returned,
+  {"export_date", "version", "data": {table: [rows]}, "stats"}
+- ndjson: a header line, one {"table": ..., "row": ...} line per row and a
+  final {"stats": ...} line
+
+Either format can be gzip-compressed on the fly.
+
+Imports read the same files incrementally, validate each row, and insert
+batches of IMPORT_BATCH_SIZE rows with one executemany per batch and one
+transaction per batch. Invalid rows are reported and skipped.
+"""
+import gzip
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+import database
+import schemas
+
+EXPORT_VERSION = "1.0"
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Bytes buffered before a chunk is sent to the client
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Exported tables and columns, in dependency order (password hashes are never exported)
+EXPORT_TABLES = [
+    ("admins", database.Admin, ["id", "username", "email", "created_at"]),
+    ("specialties", database.Specialty, ["id", "name", "icon_url"]),
+    ("doctors", database.Doctor, ["id", "name", "specialty_id", "phone", "email", "photo_url", "bio", "rating", "created_at"]),
+    ("clinics", database.Clinic, ["id", "doctor_id", "name", "address", "latitude", "longitude", "phone", "working_hours", "created_at"]),
+]
+
+FORMATS = ("json", "ndjson")
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=_default)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+def _rows(session, model, columns) -> Iterator[dict]:
+    """Rows of one table as dicts, fetched EXPORT_BATCH_SIZE at a time."""
+    query = (
+        select(*(getattr(model, name) for name in columns))
+        .order_by(model.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE, stream_results=True)
+    )
+    for row in session.execute(query):
+        yield dict(zip(columns, row))
+
+def _json_parts(session) -> Iterator[str]:
+    stats = {}
+    yield '{"export_date": %s, "version": %s, "data": {' % (
+        _dumps(datetime.utcnow().isoformat()), _dumps(EXPORT_VERSION)
+    )
+    for index, (table, model, columns) in enumerate(EXPORT_TABLES):
+        yield ("" if index == 0 else ", ") + _dumps(table) + ": ["
+        count = 0
+        for row in _rows(session, model, columns):
+            yield ("" if count == 0 else ", ") + _dumps(row)
+            count += 1
+        yield "]"
+        stats[f"total_{table}"] = count
+    yield "}, \"stats\": " + _dumps(stats) + "}"
+
+def _ndjson_parts(session) -> Iterator[str]:
+    stats = {}
+    yield _dumps({
+        "export_date": datetime.utcnow().isoformat(),
+        "version": EXPORT_VERSION,
+        "format": "ndjson",
+    }) + "\n"
+    for table, model, columns in EXPORT_TABLES:
+        count = 0
+        for row in _rows(session, model, columns):
+            yield _dumps({"table": table, "row": row}) + "\n"
+            count += 1
+        stats[f"total_{table}"] = count
+    yield _dumps({"stats": stats}) + "\n"
+
+def stream_export(fmt: str = "json", compress: bool = False) -> Iterator[bytes]:
+    """
+    Generate the export as byte chunks.
+
+    The generator opens its own session because it keeps running after the
+    request's dependencies have been closed.
+    """
+    parts = _ndjson_parts if fmt == "ndjson" else _json_parts
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 = gzip container
+    session = database.SessionLocal()
+    try:
+        buffer = []
+        size = 0
+        for part in parts(session):
+            data = part.encode("utf-8")
+            buffer.append(data)
+            size += len(data)
+            if size >= EXPORT_CHUNK_BYTES:
+                chunk = b"".join(buffer)
+                buffer, size = [], 0
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        chunk = b"".join(buffer)
+        if compressor is not None:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        session.close()
+
+def export_filename(fmt: str, compress: bool) -> str:
+    name = f"my_doctor_export_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return name + ".gz" if compress else name
+
+# ==================== Import ====================
+
+# Rows inserted per executemany and per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Row errors listed in the report (all of them are counted)
+IMPORT_MAX_ERRORS = 100
+
+# Characters read from the input per step of the JSON reader
+READ_CHUNK_CHARS = 64 * 1024
+
+# Imported tables; admins are skipped because exports carry no password hashes
+IMPORT_TABLES = {
+    "specialties": (database.Specialty, schemas.SpecialtyImport),
+    "doctors": (database.Doctor, schemas.DoctorImport),
+    "clinics": (database.Clinic, schemas.ClinicImport),
+}
+
+class ImportFormatError(ValueError):
+    """The input is not a readable export file."""
+
+def format_for(filename: Optional[str]) -> str:
+    """Guess the import format from a file name (.ndjson or .ndjson.gz)."""
+    if filename and ".ndjson" in filename.lower():
+        return "ndjson"
+    return "json"
+
+class ImportReport:
+    """Counts and row errors collected during an import."""
+
+    def __init__(self):
+        self.imported = {table: 0 for table in IMPORT_TABLES}
+        self.skipped: Dict[str, int] = {}
+        self.errors: List[dict] = []
+        self.error_count = 0
+        self.aborted: Optional[str] = None
+
+    def error(self, message: str, table: Optional[str] = None,
+              index: Optional[int] = None, row_id=None, line: Optional[int] = None):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            entry = {"table": table, "index": index, "id": row_id}
+            if line is not None:
+                entry = {"line": line}
+            entry["error"] = message
+            self.errors.append(entry)
+
+    def as_dict(self, elapsed: float) -> dict:
+        if self.aborted:
+            status = "aborted"
+        elif self.error_count:
+            status = "completed_with_errors"
+        else:
+            status = "success"
+        report = {
+            "status": status,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+        if self.aborted:
+            report["detail"] = self.aborted
+        return report
+
+class _Prefixed(io.RawIOBase):
+    """Raw stream that returns already-read bytes before the rest of a stream."""
+
+    def __init__(self, prefix: bytes, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            data, self._prefix = self._prefix[:len(buffer)], self._prefix[len(buffer):]
+        else:
+            data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def _open_text(stream) -> io.TextIOBase:
+    """Text view of a binary input, decompressing it if it is gzip."""
+    head = stream.read(2)
+    raw = io.BufferedReader(_Prefixed(head, stream))
+    if head == b"\x1f\x8b":
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding="utf-8-sig")
+
+class _JsonReader:
+    """
+    Pull parser for the json export document.
+
+    Only the structure around the rows is walked by hand; every row (and
+    every other value) is decoded with JSONDecoder.raw_decode, so the whole
+    document is never held in memory.
+    """
+
+    def __init__(self, text: io.TextIOBase):
+        self._text = text
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._text.read(READ_CHUNK_CHARS)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ImportFormatError(f"expected one of {chars!r}, found {char or 'end of file'!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A value that ends with the buffer may be a truncated number
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as exc:
+                if self._eof:
+                    raise ImportFormatError(str(exc))
+            self._fill()
+
+    def records(self) -> Iterator[Tuple[str, object]]:
+        """(table, row) for every row under "data"; other keys are skipped."""
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "data":
+                self._expect("{")
+                if self._peek() == "}":
+                    self._expect("}")
+                else:
+                    while True:
+                        table = self._value()
+                        self._expect(":")
+                        self._expect("[")
+                        if self._peek() == "]":
+                            self._expect("]")
+                        else:
+                            while True:
+                                yield table, self._value()
+                                if self._expect(",]") == "]":
+                                    break
+                        if self._expect(",}") == "}":
+                            break
+            else:
+                self._value()
+            if self._expect(",}") == "}":
+                return
+
+def _ndjson_records(text: io.TextIOBase, report: ImportReport) -> Iterator[Tuple[str, object]]:
+    """(table, row) for every row line; the header and stats lines are skipped."""
+    for line_number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            report.error("سطر JSON غير صالح", line=line_number)
+            continue
+        if isinstance(record, dict) and "table" in record:
+            yield record["table"], record.get("row")
+
+class _Importer:
+    """Validates rows and inserts them in batches, one table at a time."""
+
+    def __init__(self, session, report: ImportReport, batch_size: int):
+        self.session = session
+        self.report = report
+        self.batch_size = max(1, batch_size)
+        self.positions = {table: 0 for table in IMPORT_TABLES}
+        # Ids present in the database or accepted so far, for duplicate and reference checks
+        self.known = {
+            table: set(session.execute(select(model.id)).scalars())
+            for table, (model, _) in IMPORT_TABLES.items()
+        }
+        self.specialty_names = set(session.execute(select(database.Specialty.name)).scalars())
+        self.pending_table: Optional[str] = None
+        self.pending: List[Tuple[int, dict]] = []
+
+    def add(self, table: str, row):
+        if table not in IMPORT_TABLES:
+            self.report.skipped[table] = self.report.skipped.get(table, 0) + 1
+            return
+        self.positions[table] += 1
+        index = self.positions[table]
+        row_id = row.get("id") if isinstance(row, dict) else None
+
+        item, message = self._validate(table, row)
+        if message:
+            self.report.error(message, table, index, row_id)
+            return
+
+        self.known[table].add(item["id"])
+        if table == "specialties":
+            self.specialty_names.add(item["name"])
+        if table != self.pending_table:
+            self.flush()
+            self.pending_table = table
+        self.pending.append((index, item))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _validate(self, table: str, row) -> Tuple[Optional[dict], Optional[str]]:
+        if not isinstance(row, dict):
+            return None, "الصف ليس كائن JSON"
+        try:
+            item = IMPORT_TABLES[table][1](**row).dict()
+        except ValidationError as exc:
+            first = exc.errors()[0]
+            field = ".".join(str(part) for part in first["loc"])
+            return None, f"{field}: {first['msg']}"
+
+        if item["id"] in self.known[table]:
+            return None, "المعرف موجود مسبقاً"
+        if table == "specialties" and item["name"] in self.specialty_names:
+            return None, "التخصص موجود مسبقاً"
+        if table == "doctors" and item["specialty_id"] not in self.known["specialties"]:
+            return None, "التخصص غير موجود"
+        if table == "clinics" and item["doctor_id"] not in self.known["doctors"]:
+            return None, "الطبيب غير موجود"
+        if "created_at" in item and item["created_at"] is None:
+            item["created_at"] = datetime.utcnow()
+        return item, None
+
+    def flush(self):
+        """Insert the pending batch in one transaction, falling back to row by row on failure."""
+        if not self.pending:
+            return
+        table, pending = self.pending_table, self.pending
+        self.pending = []
+        model = IMPORT_TABLES[table][0]
+        try:
+            self._insert(model, [item for _, item in pending])
+            self.session.commit()
+            self.report.imported[table] += len(pending)
+            return
+        except SQLAlchemyError:
+            self.session.rollback()
+
+        # Find the rows the database rejected
+        for index, item in pending:
+            try:
+                self._insert(model, [item])
+                self.session.commit()
+                self.report.imported[table] += 1
+            except SQLAlchemyError as exc:
+                self.session.rollback()
+                self.known[table].discard(item["id"])
+                self.report.error(str(getattr(exc, "orig", exc)), table, index, item["id"])
+
+    def _insert(self, model, items: List[dict]):
+        self.session.execute(insert(model), items)
+        if model is database.Clinic:
+            database.store_clinic_hours(
+                self.session, [(item["id"], item.get("working_hours")) for item in items], replace=False
+            )
+
+    def finish(self):
+        self.flush()
+        database.refresh_doctor_counts(self.session)
+        database.reset_id_sequences(self.session, [model for model, _ in IMPORT_TABLES.values()])
+        self.session.commit()
+
+def import_stream(stream, fmt: str = "json", batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Import an export file from a binary stream (plain or gzip) and return a report.
+
+    Batches committed before a fatal format error are kept; the report then
+    has status "aborted" and a detail message.
+    """
+    start = time.perf_counter()
+    report = ImportReport()
+    session = database.SessionLocal()
+    try:
+        importer = _Importer(session, report, batch_size)
+        try:
+            text_stream = _open_text(stream)
+            if fmt == "ndjson":
+                records = _ndjson_records(text_stream, report)
+            else:
+                records = _JsonReader(text_stream).records()
+            for table, row in records:
+                importer.add(table, row)
+        except (ValueError, OSError, EOFError) as exc:
+            report.aborted = f"ملف الاستيراد غير صالح: {exc}"
+        importer.finish()
+    finally:
+        session.close()
+    return report.as_dict(time.perf_counter() - start)
@@ -0,0 +1,299 @@
+"""
+Batch create, update and delete for doctors and clinics.
+
+Each function checks the whole list against the database with one IN query
+per referenced table, applies every valid item with bulk statements and
+commits once. Invalid items are skipped and reported: the result holds one
+entry per input item, in input order.
+"""
+import os
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+import database
+import schemas
+from utils import normalize_arabic
+
+# Largest list a batch endpoint accepts
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# Columns that an update may not set to null
+DOCTOR_REQUIRED = ("name", "specialty_id")
+CLINIC_REQUIRED = ("name", "address", "latitude", "longitude")
+
+class BatchResult:
+    """Per-item outcome of a batch, plus the clinics whose location changed."""
+
+    def __init__(self, size: int):
+        self.results: List[Optional[dict]] = [None] * size
+        self.upserted_clinics: List[Tuple[int, float, float]] = []
+        self.removed_clinics: List[int] = []
+
+    def ok(self, index: int, status: str, item_id: int):
+        self.results[index] = {"index": index, "id": item_id, "status": status, "error": None}
+
+    def fail(self, index: int, message: str, item_id: Optional[int] = None):
+        self.results[index] = {"index": index, "id": item_id, "status": "error", "error": message}
+
+    @property
+    def succeeded_ids(self) -> List[int]:
+        return [result["id"] for result in self.results if result and result["status"] != "error"]
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for result in self.results if result and result["status"] != "error")
+
+    def as_dict(self) -> dict:
+        return {
+            "results": self.results,
+            "succeeded": self.succeeded,
+            "failed": len(self.results) - self.succeeded,
+        }
+
+def check_size(items: list):
+    """Reject empty or oversized batches."""
+    if not items:
+        raise HTTPException(status_code=400, detail="القائمة فارغة")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"الحد الأقصى {BATCH_MAX_ITEMS} عنصر في الطلب الواحد")
+
+def _existing(db, column, values) -> set:
+    """Which of values exist in column, in one IN query."""
+    values = {value for value in values if value is not None}
+    if not values:
+        return set()
+    return set(db.execute(select(column).where(column.in_(values))).scalars())
+
+def _commit(db):
+    try:
+        db.commit()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"تعذر تطبيق الدفعة: {getattr(exc, 'orig', exc)}")
+
+def _null_required(updates: dict, required) -> Optional[str]:
+    for field in required:
+        if field in updates and updates[field] is None:
+            return f"{field}: لا يمكن أن يكون فارغاً"
+    return None
+
+def _adjust_doctor_counts(db, deltas: Counter):
+    for specialty_id, delta in deltas.items():
+        if delta:
+            database.adjust_doctor_count(db, specialty_id, delta)
+
+# ==================== Doctors ====================
+
+def create_doctors(db, items: List[schemas.DoctorCreate]) -> BatchResult:
+    result = BatchResult(len(items))
+    specialties = _existing(db, database.Specialty.id, (item.specialty_id for item in items))
+
+    created = []
+    for index, item in enumerate(items):
+        if item.specialty_id not in specialties:
+            result.fail(index, "التخصص غير موجود")
+            continue
+        created.append((index, database.Doctor(**item.dict())))
+
+    if created:
+        db.add_all([doctor for _, doctor in created])
+        db.flush()
+        _adjust_doctor_counts(db, Counter(doctor.specialty_id for _, doctor in created))
+        ids = [(index, doctor.id) for index, doctor in created]
+        _commit(db)
+        for index, doctor_id in ids:
+            result.ok(index, "created", doctor_id)
+    return result
+
+def update_doctors(db, items: List[schemas.DoctorBatchUpdate]) -> BatchResult:
+    result = BatchResult(len(items))
+    current = dict(db.execute(
+        select(database.Doctor.id, database.Doctor.specialty_id)
+        .where(database.Doctor.id.in_({item.id for item in items}))
+    ).all())
+    specialties = _existing(db, database.Specialty.id, (item.specialty_id for item in items))
+
+    rows = []
+    seen = set()
+    deltas = Counter()
+    for index, item in enumerate(items):
+        updates = item.dict(exclude_unset=True)
+        doctor_id = updates.pop("id")
+        if doctor_id in seen:
+            result.fail(index, "المعرف مكرر في الطلب", doctor_id)
+            continue
+        seen.add(doctor_id)
+        if doctor_id not in current:
+            result.fail(index, "الطبيب غير موجود", doctor_id)
+            continue
+        message = _null_required(updates, DOCTOR_REQUIRED)
+        if message is None and "specialty_id" in updates and updates["specialty_id"] not in specialties:
+            message = "التخصص غير موجود"
+        if message:
+            result.fail(index, message, doctor_id)
+            continue
+
+        if "name" in updates:
+            # Bulk UPDATE skips the ORM validator that keeps this column in sync
+            updates["name_normalized"] = normalize_arabic(updates["name"])
+        new_specialty_id = updates.get("specialty_id", current[doctor_id])
+        if new_specialty_id != current[doctor_id]:
+            deltas[current[doctor_id]] -= 1
+            deltas[new_specialty_id] += 1
+        rows.append((index, doctor_id, updates))
+
+    changes = [dict(updates, id=doctor_id) for _, doctor_id, updates in rows if updates]
+    if changes:
+        # ORM bulk UPDATE by primary key: one executemany per set of columns
+        db.execute(update(database.Doctor), changes)
+        _adjust_doctor_counts(db, deltas)
+        _commit(db)
+    for index, doctor_id, _ in rows:
+        result.ok(index, "updated", doctor_id)
+    return result
+
+def delete_doctors(db, ids: List[int]) -> BatchResult:
+    """Delete doctors and their clinics."""
+    result = BatchResult(len(ids))
+    current = dict(db.execute(
+        select(database.Doctor.id, database.Doctor.specialty_id)
+        .where(database.Doctor.id.in_(set(ids)))
+    ).all())
+
+    deleted = []
+    seen = set()
+    for index, doctor_id in enumerate(ids):
+        if doctor_id in seen:
+            result.fail(index, "المعرف مكرر في الطلب", doctor_id)
+        elif doctor_id not in current:
+            result.fail(index, "الطبيب غير موجود", doctor_id)
+        else:
+            deleted.append((index, doctor_id))
+        seen.add(doctor_id)
+
+    if deleted:
+        doctor_ids = [doctor_id for _, doctor_id in deleted]
+        result.removed_clinics = list(db.execute(
+            select(database.Clinic.id).where(database.Clinic.doctor_id.in_(doctor_ids))
+        ).scalars())
+        database.delete_clinic_hours(db, result.removed_clinics)
+        db.execute(
+            delete(database.Clinic).where(database.Clinic.doctor_id.in_(doctor_ids)),
+            execution_options={"synchronize_session": False},
+        )
+        db.execute(
+            delete(database.Doctor).where(database.Doctor.id.in_(doctor_ids)),
+            execution_options={"synchronize_session": False},
+        )
+        _adjust_doctor_counts(db, Counter({
+            specialty_id: -count
+            for specialty_id, count in Counter(current[doctor_id] for doctor_id in doctor_ids).items()
+        }))
+        _commit(db)
+        for index, doctor_id in deleted:
+            result.ok(index, "deleted", doctor_id)
+    return result
+
+# ==================== Clinics ====================
+
+def create_clinics(db, items: List[schemas.ClinicCreate]) -> BatchResult:
+    result = BatchResult(len(items))
+    doctors = _existing(db, database.Doctor.id, (item.doctor_id for item in items))
+
+    created = []
+    for index, item in enumerate(items):
+        if item.doctor_id not in doctors:
+            result.fail(index, "الطبيب غير موجود")
+            continue
+        created.append((index, database.Clinic(**item.dict())))
+
+    if created:
+        db.add_all([clinic for _, clinic in created])
+        db.flush()
+        rows = [(index, clinic.id, clinic.latitude, clinic.longitude) for index, clinic in created]
+        database.store_clinic_hours(db, [(clinic.id, clinic.working_hours) for _, clinic in created], replace=False)
+        _commit(db)
+        for index, clinic_id, latitude, longitude in rows:
+            result.ok(index, "created", clinic_id)
+            result.upserted_clinics.append((clinic_id, latitude, longitude))
+    return result
+
+def update_clinics(db, items: List[schemas.ClinicBatchUpdate]) -> BatchResult:
+    result = BatchResult(len(items))
+    current = {
+        clinic_id: (latitude, longitude)
+        for clinic_id, latitude, longitude in db.execute(
+            select(database.Clinic.id, database.Clinic.latitude, database.Clinic.longitude)
+            .where(database.Clinic.id.in_({item.id for item in items}))
+        )
+    }
+
+    rows = []
+    seen = set()
+    for index, item in enumerate(items):
+        updates = item.dict(exclude_unset=True)
+        clinic_id = updates.pop("id")
+        if clinic_id in seen:
+            result.fail(index, "المعرف مكرر في الطلب", clinic_id)
+            continue
+        seen.add(clinic_id)
+        if clinic_id not in current:
+            result.fail(index, "العيادة غير موجودة", clinic_id)
+            continue
+        message = _null_required(updates, CLINIC_REQUIRED)
+        if message:
+            result.fail(index, message, clinic_id)
+            continue
+        rows.append((index, clinic_id, updates))
+
+    changes = [dict(updates, id=clinic_id) for _, clinic_id, updates in rows if updates]
+    if changes:
+        db.execute(update(database.Clinic), changes)
+        database.store_clinic_hours(db, [
+            (clinic_id, updates["working_hours"])
+            for _, clinic_id, updates in rows
+            if "working_hours" in updates
+        ])
+        _commit(db)
+    for index, clinic_id, updates in rows:
+        result.ok(index, "updated", clinic_id)
+        if "latitude" in updates or "longitude" in updates:
+            latitude, longitude = current[clinic_id]
+            result.upserted_clinics.append((
+                clinic_id,
+                updates.get("latitude", latitude),
+                updates.get("longitude", longitude),
+            ))
+    return result
+
+def delete_clinics(db, ids: List[int]) -> BatchResult:
+    result = BatchResult(len(ids))
+    existing = _existing(db, database.Clinic.id, ids)
+
+    deleted = []
+    seen = set()
+    for index, clinic_id in enumerate(ids):
+        if clinic_id in seen:
+            result.fail(index, "المعرف مكرر في الطلب", clinic_id)
+        elif clinic_id not in existing:
+            result.fail(index, "العيادة غير موجودة", clinic_id)
+        else:
+            deleted.append((index, clinic_id))
+        seen.add(clinic_id)
+
+    if deleted:
+        clinic_ids = [clinic_id for _, clinic_id in deleted]
+        database.delete_clinic_hours(db, clinic_ids)
+        db.execute(
+            delete(database.Clinic).where(database.Clinic.id.in_(clinic_ids)),
+            execution_options={"synchronize_session": False},
+        )
+        _commit(db)
+        result.removed_clinics = clinic_ids
+        for index, clinic_id in deleted:
+            result.ok(index, "deleted", clinic_id)
+    return result
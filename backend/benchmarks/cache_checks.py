@@ -0,0 +1,110 @@
+"""
+Check that responses served by the response cache behave like fresh ones.
+
+Runs against a temporary SQLite database with the in-memory cache enabled
+and exits with status 1 if any check fails:
+- a cached catalogue GET with an Origin header (miss, hit and 304) carries
+  the CORS headers, including the exposed X-Next-Cursor
+- with a read replica that never receives the writes, an admin who has
+  just written reads their own changes, even after an anonymous request
+  read the stale replica (response cache and fragment cache)
+
+Usage (from the backend directory, requires httpx for the test client):
+    python benchmarks/cache_checks.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+TEMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/cache_checks.db"
+os.environ["CACHE_BACKEND"] = "memory"
+# A snapshot of the primary taken by populate(), so it lags every later write
+os.environ["READ_REPLICA_URLS"] = f"sqlite:///{TEMP_DIR}/replica.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import cache
+import database
+import main
+import pagination
+
+ORIGIN = "https://app.mydoctor.example"
+CACHED_URLS = ["/api/specialties", "/api/doctors?limit=1", "/api/clinics?limit=1"]
+
+def populate():
+    db = database.SessionLocal()
+    specialty = database.Specialty(name="طب عام")
+    db.add(specialty)
+    db.flush()
+    for i in range(2):
+        doctor = database.Doctor(name=f"د. طبيب {i}", specialty_id=specialty.id)
+        db.add(doctor)
+        db.flush()
+        db.add(database.Clinic(
+            doctor_id=doctor.id, name=f"عيادة {i}", address="غزة",
+            latitude=31.5, longitude=34.45, working_hours="8:00 ص - 4:00 م",
+        ))
+    db.commit()
+    db.close()
+    shutil.copy(f"{TEMP_DIR}/cache_checks.db", f"{TEMP_DIR}/replica.db")
+
+def check_cors(client: TestClient) -> list:
+    """Failures for cached GETs that lose the CORS headers."""
+    failures = []
+    for url in CACHED_URLS:
+        miss = client.get(url, headers={"Origin": ORIGIN})
+        hit = client.get(url, headers={"Origin": ORIGIN})
+        not_modified = client.get(url, headers={"Origin": ORIGIN, "If-None-Match": hit.headers.get("etag", "")})
+        for label, response, status in (("miss", miss, 200), ("hit", hit, 200), ("304", not_modified, 304)):
+            if response.status_code != status:
+                failures.append(f"{url} ({label}): status {response.status_code}, expected {status}")
+            elif "access-control-allow-origin" not in response.headers:
+                failures.append(f"{url} ({label}): no Access-Control-Allow-Origin")
+        exposed = miss.headers.get("access-control-expose-headers", "").lower()
+        if pagination.NEXT_CURSOR_HEADER.lower() not in exposed:
+            failures.append(f"{url}: {pagination.NEXT_CURSOR_HEADER} is not exposed")
+    return failures
+
+def check_replica_reads(client: TestClient) -> list:
+    """Failures for admins who do not see their own writes while the replica lags."""
+    failures = []
+    login = client.post("/api/admin/login", json={"username": "admin", "password": "admin123"})
+    admin = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    clinic_id = client.get("/api/clinics").json()[0]["id"]
+
+    writes = [
+        ("POST", "/api/specialties", {"name": "قلب"}),
+        ("PUT", f"/api/clinics/{clinic_id}", {"name": "عيادة محدثة"}),
+    ]
+    for method, url, body in writes:
+        response = client.request(method, url, json=body, headers=admin)
+        if response.status_code != 200:
+            failures.append(f"{method} {url}: status {response.status_code}")
+
+    for url, expected in (("/api/specialties", "قلب"), ("/api/clinics", "عيادة محدثة")):
+        client.get(url)  # Anonymous, served by the stale replica
+        if expected not in client.get(url, headers=admin).text:
+            failures.append(f"{url}: the admin does not see their own write")
+    if database.read_router.primary_sessions == 0:
+        failures.append("no read was routed to the primary")
+    return failures
+
+def main_check() -> int:
+    failures = []
+    with TestClient(main.app) as client:
+        populate()
+        failures += check_cors(client)
+        failures += check_replica_reads(client)
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print(f"✅ Cached responses keep CORS headers and read-your-writes ({cache.response_cache.stats()['hits']} hits)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main_check())
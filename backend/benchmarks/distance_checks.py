@@ -0,0 +1,94 @@
+"""
+Check that the vectorized haversine agrees with the scalar one.
+
+calculate_distances is compared with calculate_distance over random points
+all over the globe, antipodal points, identical points and points across
+the antimeridian and near the poles, with and without max_distance. The
+script exits with status 1 if any case disagrees.
+
+Usage (from the backend directory):
+    python benchmarks/distance_checks.py [--points 20000] [--seed 1]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import calculate_distance, calculate_distances, EARTH_RADIUS_KM
+
+Point = Tuple[float, float]
+
+def _wrap(longitude: float) -> float:
+    return (longitude + 180.0) % 360.0 - 180.0
+
+def _random_point(rng: random.Random) -> Point:
+    # Uniform over the sphere, so the poles are not over-represented
+    return math.degrees(math.asin(rng.uniform(-1.0, 1.0))), rng.uniform(-180.0, 180.0)
+
+def cases(rng: random.Random, count: int) -> List[Tuple[str, Point, List[Point], float]]:
+    """(name, origin, points, expected distance or nan) per case."""
+    origins = [_random_point(rng) for _ in range(20)] + [
+        (31.5017, 34.4668), (0.0, 179.99), (0.0, -179.99), (89.9, 0.0), (-89.9, 45.0), (90.0, 0.0),
+    ]
+    result = []
+    for origin in origins:
+        points = [_random_point(rng) for _ in range(count // len(origins))]
+        result.append((f"random points from {origin}", origin, points, math.nan))
+        latitude, longitude = origin
+        result.append((f"antipode of {origin}", origin, [(-latitude, _wrap(longitude + 180.0))], math.pi * EARTH_RADIUS_KM))
+        result.append((f"same point {origin}", origin, [origin], 0.0))
+        nearby = [
+            (max(-90.0, min(90.0, latitude + rng.uniform(-0.5, 0.5))), _wrap(longitude + rng.uniform(-0.5, 0.5)))
+            for _ in range(200)
+        ]
+        result.append((f"nearby points of {origin}", origin, nearby, math.nan))
+    return result
+
+def check(name: str, origin: Point, points: List[Point], expected: float,
+          max_distance: Optional[float]) -> List[str]:
+    scalar = np.array([calculate_distance(*origin, *point) for point in points])
+    vector = calculate_distances(*origin, np.array(points), max_distance)
+    failures = []
+    # Haversine loses precision near the antipode (about 0.1 m), hence 1 m here
+    if max_distance is None and not math.isnan(expected) and not np.allclose(scalar, expected, rtol=0, atol=1e-3):
+        failures.append(f"{name}: calculate_distance gave {scalar[0]}, expected {expected}")
+    if max_distance is None:
+        if not np.allclose(vector, scalar, rtol=1e-9, atol=1e-6):
+            worst = int(np.argmax(np.abs(vector - scalar)))
+            failures.append(f"{name}: {points[worst]} is {vector[worst]} km, scalar {scalar[worst]} km")
+        return failures
+
+    within = scalar <= max_distance
+    if not np.allclose(vector[within], scalar[within], rtol=1e-9, atol=1e-6):
+        failures.append(f"{name} (max_distance={max_distance}): distances within the radius differ")
+    if np.any(vector[~within] <= max_distance):
+        failures.append(f"{name} (max_distance={max_distance}): a point outside the radius was kept")
+    return failures
+
+def main_check() -> int:
+    parser = argparse.ArgumentParser(description="Compare calculate_distances with calculate_distance")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    failures = []
+    checked = 0
+    for name, origin, points, expected in cases(random.Random(args.seed), args.points):
+        for max_distance in (None, 1.0, 50.0, 5000.0):
+            failures += check(name, origin, points, expected, max_distance)
+            checked += len(points)
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print(f"✅ calculate_distances matches calculate_distance on {checked} distances")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -0,0 +1,235 @@
+"""
+Fill the database with a synthetic catalogue for benchmarks and load tests.
+
+Clinics are clustered around Palestinian cities in proportion to their
+population, with a few spread over the countryside. Each doctor practises
+in one city, doctors are skewed towards common specialties (general
+practice and dentistry far outnumber rarer ones), and names, addresses and
+working hours are written the way real entries are, in Arabic. Rows are
+inserted in batches through database.SessionLocal, so a million clinics take
+minutes rather than the hours seed.py's one-request-per-row path would.
+
+Uses DATABASE_URL like the server. New rows get ids after the existing ones.
+
+Usage (from the backend directory):
+    python benchmarks/generate_data.py 1000000
+    python benchmarks/generate_data.py 50000 --doctors 5000 --seed 7
+"""
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select
+
+import database
+import text_search
+
+# (name, latitude, longitude, relative population, spread in km)
+CITIES = [
+    ("غزة", 31.5017, 34.4668, 60, 4.0),
+    ("خانيونس", 31.3462, 34.3063, 24, 3.0),
+    ("جباليا", 31.5280, 34.4831, 20, 2.0),
+    ("رفح", 31.2969, 34.2455, 18, 2.5),
+    ("دير البلح", 31.4171, 34.3500, 10, 2.0),
+    ("الخليل", 31.5326, 35.0998, 22, 3.5),
+    ("نابلس", 32.2211, 35.2544, 15, 3.0),
+    ("رام الله", 31.9038, 35.2034, 14, 3.0),
+    ("جنين", 32.4607, 35.2956, 8, 2.5),
+    ("بيت لحم", 31.7054, 35.2024, 8, 2.0),
+    ("طولكرم", 32.3104, 35.0286, 6, 2.0),
+    ("قلقيلية", 32.1896, 34.9706, 5, 1.5),
+    ("أريحا", 31.8611, 35.4618, 2, 2.0),
+    ("سلفيت", 32.0833, 35.1806, 1, 1.5),
+]
+
+# Share of clinics placed anywhere in the region instead of near a city
+RURAL_SHARE = 0.03
+REGION = ((31.22, 32.55), (34.22, 35.57))
+
+# Most common first, weighted by 1 / rank ** SPECIALTY_SKEW
+SPECIALTIES = [
+    "طب عام", "أسنان", "أطفال", "نساء وولادة", "باطنية", "عيون", "عظام",
+    "جلدية", "أنف وأذن وحنجرة", "قلب", "مسالك بولية", "نفسية", "أعصاب",
+    "علاج طبيعي", "تغذية",
+]
+SPECIALTY_SKEW = 1.1
+
+FIRST_NAMES = [
+    "محمد", "أحمد", "محمود", "خالد", "عمر", "يوسف", "إبراهيم", "علي", "حسن", "سامي",
+    "رامي", "طارق", "ناصر", "وليد", "باسل", "إياد", "فادي", "مصطفى", "عبد الله", "زياد",
+    "فاطمة", "مريم", "عائشة", "سارة", "نور", "هبة", "ريم", "دعاء", "آمنة", "ليلى",
+    "إسراء", "رنا", "سماح", "منى", "هالة", "ياسمين", "أسماء", "لينا", "جنى", "بيسان",
+]
+FAMILY_NAMES = [
+    "الأسطل", "أبو شعبان", "الشوا", "حلس", "الريس", "عاشور", "الفرا", "النجار", "أبو حسنة",
+    "التميمي", "الجعبري", "القواسمي", "النتشة", "المصري", "الشكعة", "عرفات", "البرغوثي",
+    "جرار", "السعدي", "عبد الهادي", "حمدان", "الخطيب", "سلامة", "عودة", "الزعانين",
+]
+STREETS = [
+    "شارع عمر المختار", "شارع الجلاء", "شارع النصر", "شارع الوحدة", "شارع صلاح الدين",
+    "شارع الشهداء", "شارع الجامعة", "شارع القدس", "شارع المستشفى", "دوار الساعة",
+    "شارع الملك فيصل", "شارع السوق", "شارع البلدية", "شارع المدارس",
+]
+CLINIC_NAME_PATTERNS = [
+    "عيادة د. {doctor}", "عيادة {specialty} - {city}", "مركز {family} الطبي",
+    "مجمع {city} الطبي", "عيادة الشفاء لل{specialty}", "مركز الرعاية - {street}",
+]
+
+# (working hours, weight): the forms clinics actually write, plus some missing
+WORKING_HOURS = [
+    ("8:00 ص - 4:00 م", 30),
+    ("9:00 ص - 5:00 م", 15),
+    ("السبت - الخميس 9:00 AM - 5:00 PM، الجمعة مغلق", 15),
+    ("8:00 ص - 2:00 م، 5:00 م - 9:00 م", 10),
+    ("4 - 9 م", 8),
+    ("السبت - الخميس 8:30 ص - 3:30 م", 8),
+    ("24 ساعة", 3),
+    ("10:00-18:00", 5),
+    ("Sat-Thu 8 AM - 8 PM, Fri closed", 3),
+    (None, 3),
+]
+
+BATCH_SIZE = 5000
+
+def weighted_index(weights: List[float]):
+    """Function drawing an index with the given relative weights."""
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return lambda rng: min(len(cumulative) - 1, bisect.bisect_right(cumulative, rng.random() * total))
+
+def _location(rng: random.Random, city: int) -> Tuple[float, float]:
+    if rng.random() < RURAL_SHARE:
+        (south, north), (west, east) = REGION
+        return rng.uniform(south, north), rng.uniform(west, east)
+    _, latitude, longitude, _, spread_km = CITIES[city]
+    latitude += rng.gauss(0, spread_km) / 111.0
+    longitude += rng.gauss(0, spread_km) / (111.0 * math.cos(math.radians(latitude)))
+    return round(latitude, 6), round(longitude, 6)
+
+def _phone(rng: random.Random) -> str:
+    return f"+97059{rng.randrange(10 ** 7):07d}"
+
+def _insert(session, model, rows: List[dict]):
+    session.execute(insert(model), rows)
+    if model is database.Clinic:
+        database.store_clinic_hours(
+            session, [(row["id"], row["working_hours"]) for row in rows], replace=False
+        )
+    session.commit()
+
+def generate(clinic_count: int, doctor_count: int = 0, seed: int = 1, progress: bool = True) -> dict:
+    """
+    Insert the specialties (if missing), doctor_count doctors (clinic_count / 3
+    by default) and clinic_count clinics. Returns the number of rows inserted.
+    """
+    rng = random.Random(seed)
+    doctor_count = doctor_count or max(1, clinic_count // 3)
+    now = datetime.utcnow()
+    session = database.SessionLocal()
+    try:
+        existing = dict(session.execute(select(database.Specialty.name, database.Specialty.id)).all())
+        new_specialties = [name for name in SPECIALTIES if name not in existing]
+        if new_specialties:
+            session.execute(insert(database.Specialty), [{"name": name} for name in new_specialties])
+            session.commit()
+            existing = dict(session.execute(select(database.Specialty.name, database.Specialty.id)).all())
+        specialty_ids = [existing[name] for name in SPECIALTIES]
+
+        pick_specialty = weighted_index([1 / rank ** SPECIALTY_SKEW for rank in range(1, len(SPECIALTIES) + 1)])
+        pick_city = weighted_index([city[3] for city in CITIES])
+        pick_hours = weighted_index([weight for _, weight in WORKING_HOURS])
+
+        first_doctor = (session.execute(select(func.max(database.Doctor.id))).scalar() or 0) + 1
+        doctors = []  # (name, family, specialty index, city index) per new doctor
+        rows = []
+        start = time.perf_counter()
+        for offset in range(doctor_count):
+            first, family = rng.choice(FIRST_NAMES), rng.choice(FAMILY_NAMES)
+            specialty, city = pick_specialty(rng), pick_city(rng)
+            doctors.append((f"{first} {family}", family, specialty, city))
+            rows.append({
+                "id": first_doctor + offset,
+                "name": f"د. {first} {family}",
+                "specialty_id": specialty_ids[specialty],
+                "phone": _phone(rng),
+                "email": f"doctor{first_doctor + offset}@mydoctor.ps",
+                "bio": f"أخصائي {SPECIALTIES[specialty]} في {CITIES[city][0]}",
+                "rating": round(rng.triangular(2.5, 5.0, 4.3), 1),
+                "created_at": now,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(session, database.Doctor, rows)
+                rows = []
+        if rows:
+            _insert(session, database.Doctor, rows)
+            rows = []
+        if progress:
+            print(f"  ✅ {doctor_count} doctors ({time.perf_counter() - start:.1f}s)")
+
+        first_clinic = (session.execute(select(func.max(database.Clinic.id))).scalar() or 0) + 1
+        start = time.perf_counter()
+        for offset in range(clinic_count):
+            doctor = rng.randrange(doctor_count)
+            doctor_name, family, specialty, city = doctors[doctor]
+            latitude, longitude = _location(rng, city)
+            street = rng.choice(STREETS)
+            name = rng.choice(CLINIC_NAME_PATTERNS).format(
+                doctor=doctor_name, specialty=SPECIALTIES[specialty], city=CITIES[city][0],
+                family=family, street=street,
+            )
+            rows.append({
+                "id": first_clinic + offset,
+                "doctor_id": first_doctor + doctor,
+                "name": name,
+                "address": f"{street}، {CITIES[city][0]}",
+                "latitude": latitude,
+                "longitude": longitude,
+                "phone": _phone(rng),
+                "working_hours": WORKING_HOURS[pick_hours(rng)][0],
+                "created_at": now,
+            })
+            if len(rows) >= BATCH_SIZE:
+                _insert(session, database.Clinic, rows)
+                rows = []
+                if progress and (offset + 1) % (BATCH_SIZE * 20) == 0:
+                    print(f"  ⏳ {offset + 1} clinics...")
+        if rows:
+            _insert(session, database.Clinic, rows)
+        if progress:
+            print(f"  ✅ {clinic_count} clinics ({time.perf_counter() - start:.1f}s)")
+
+        database.refresh_doctor_counts(session)
+        database.reset_id_sequences(session, [database.Specialty, database.Doctor, database.Clinic])
+        session.commit()
+    finally:
+        session.close()
+    return {"specialties": len(new_specialties), "doctors": doctor_count, "clinics": clinic_count}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalogue")
+    parser.add_argument("clinics", type=int, nargs="?", default=100000)
+    parser.add_argument("--doctors", type=int, default=0, help="Defaults to one doctor per 3 clinics")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    database.init_db()
+    text_search.setup()
+    print(f"🌱 Generating {args.clinics} clinics into {database.engine.url.render_as_string(hide_password=True)}...")
+    start = time.perf_counter()
+    counts = generate(args.clinics, args.doctors, args.seed)
+    print(f"\n✅ Done in {time.perf_counter() - start:.1f}s")
+    print("\n📊 Summary:")
+    for table, count in counts.items():
+        print(f"  - {table}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare bulk import throughput with the one-request-per-row seed path.
+
+Creates clinics through POST /api/clinics (what seed.py does) for a sample,
+then imports a generated export file through /api/admin/import-database,
+and prints rows per second for both.
+
+Usage (from the backend directory, requires httpx for the test client):
+    python benchmarks/import_throughput.py [clinics] [sample]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Point the app at a throwaway database before it is imported
+TEMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/import_throughput.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import main
+
+DOCTORS = 1000
+
+def export_file(clinic_count: int, first_id: int) -> bytes:
+    """NDJSON export with 10 specialties, DOCTORS doctors and clinic_count clinics."""
+    random.seed(clinic_count)
+    lines = [json.dumps({"export_date": "2026-01-01T00:00:00", "version": "1.0", "format": "ndjson"})]
+    for i in range(10):
+        lines.append(json.dumps({"table": "specialties", "row": {"id": first_id + i, "name": f"تخصص {first_id + i}"}}))
+    for i in range(DOCTORS):
+        lines.append(json.dumps({"table": "doctors", "row": {
+            "id": first_id + i, "name": f"د. طبيب {i}", "specialty_id": first_id + i % 10,
+        }}))
+    for i in range(clinic_count):
+        lines.append(json.dumps({"table": "clinics", "row": {
+            "id": first_id + i, "doctor_id": first_id + i % DOCTORS, "name": f"عيادة {i}",
+            "address": "غزة", "latitude": random.uniform(31.2, 31.6),
+            "longitude": random.uniform(34.2, 34.6), "working_hours": "8:00 ص - 4:00 م",
+        }}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def run_benchmark():
+    clinic_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    
+    with TestClient(main.app) as client:
+        token = client.post("/api/admin/login", json={"username": "admin", "password": "admin123"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        specialty = client.post("/api/specialties", json={"name": "عام"}, headers=headers).json()["id"]
+        doctor = client.post("/api/doctors", json={"name": "د. طبيب", "specialty_id": specialty}, headers=headers).json()["id"]
+        start = time.perf_counter()
+        for i in range(sample):
+            client.post("/api/clinics", json={
+                "doctor_id": doctor, "name": f"عيادة {i}", "address": "غزة",
+                "latitude": 31.5, "longitude": 34.45,
+            }, headers=headers)
+        per_row = sample / (time.perf_counter() - start)
+        
+        data = export_file(clinic_count, first_id=sample + 10)
+        start = time.perf_counter()
+        report = client.post(
+            "/api/admin/import-database",
+            files={"file": ("bench.ndjson", data)},
+            headers=headers,
+        ).json()
+        rows = sum(report["imported"].values())
+        bulk = rows / (time.perf_counter() - start)
+    
+    print(f"per-row POST: {per_row:10.0f} rows/s ({sample} clinics)")
+    print(f"bulk import:  {bulk:10.0f} rows/s ({rows} rows, {report['status']})")
+    print(f"speed-up:     {bulk / per_row:10.1f}x")
+
+if __name__ == "__main__":
+    run_benchmark()
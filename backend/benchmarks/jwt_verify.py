@@ -0,0 +1,56 @@
+"""
+Measure the cost of verifying an admin token with and without the token cache.
+
+Times auth.decode_access_token on its own, then a full request to an admin
+route through the test client, first with TOKEN_CACHE_SIZE disabled and then
+with the cache enabled.
+
+Usage (from the backend directory, requires httpx for the test client):
+    python benchmarks/jwt_verify.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+# Point the app at a throwaway database before it is imported
+TEMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/jwt_verify.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import auth
+import main
+
+def per_call_us(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def run_benchmark():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    token = auth.create_access_token({"sub": "admin"}, expires_delta=timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    results = []
+    
+    with TestClient(main.app) as client:
+        for label, size in (("no cache", 0), ("cache", auth.TOKEN_CACHE_SIZE or 256)):
+            auth.token_cache = auth.TokenCache(size)
+            decode = per_call_us(lambda: auth.decode_access_token(token), iterations)
+            request = per_call_us(
+                lambda: client.get("/api/admin/cache-stats", headers=headers),
+                max(1, iterations // 10),
+            )
+            results.append((label, decode, request))
+    
+    print(f"{'':<10} {'decode (us)':>12} {'request (us)':>13}")
+    for label, decode, request in results:
+        print(f"{label:<10} {decode:>12.1f} {request:>13.1f}")
+    saved = results[0][1] - results[1][1]
+    print(f"\nThe cache saves {saved:.1f} us of verification per admin request.")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,336 @@
+"""
+In-process load test of every endpoint in main.py.
+
+Each scenario sends requests from --concurrency concurrent clients for
+--seconds through httpx's ASGI transport, without a server or sockets. It
+reports requests, errors, requests per second and p50/p95/p99 latency.
+Reads use random ids, coordinates near the generated cities and name
+prefixes, so most of them miss the response cache the way real traffic
+does. Writes create, update and then delete their own rows.
+/api/admin/reset-database is left out because it wipes the data the other
+scenarios need.
+
+Runs against DATABASE_URL if it is set (writes included unless
+--read-only), otherwise against a temporary SQLite database filled by
+generate_data.py.
+
+--save writes the results to a JSON file. --baseline compares the run with
+such a file and exits with status 1 when a scenario's p95 latency is more
+than --tolerance worse, so a regression shows up before deploying.
+
+Usage (from the backend directory, requires httpx):
+    python benchmarks/load_test.py --save baseline.json
+    python benchmarks/load_test.py --baseline baseline.json --filter nearby
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+if "DATABASE_URL" not in os.environ:
+    # Point the app at a throwaway database before it is imported
+    TEMP_DIR = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/load_test.db"
+    GENERATE = True
+else:
+    GENERATE = False
+# The login scenario would otherwise be answered with 429 after a few attempts
+os.environ.setdefault("LOGIN_ATTEMPTS_PER_USERNAME", "1000000")
+os.environ.setdefault("LOGIN_ATTEMPTS_PER_IP", "1000000")
+# Write scenarios contend for SQLite's lock; keep the slow-query log from burying the table
+os.environ.setdefault("SLOW_QUERY_MS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import database
+import generate_data
+import main
+import text_search
+
+IMPORT_FIRST_ID = 50_000_000
+
+class Scenario:
+    """
+    One endpoint under load. request(rng, state) returns the arguments for
+    httpx.AsyncClient.request; record(response, state) may keep ids the
+    response created for later scenarios, and needs is the number of rows
+    a delete scenario consumes from a state list, created beforehand
+    (untimed) if the list runs short.
+    """
+
+    def __init__(self, name: str, request: Callable[[random.Random, dict], dict], admin: bool = False,
+                 write: bool = False, record: Optional[Callable[[httpx.Response, dict], None]] = None,
+                 needs: Optional[Tuple[str, int]] = None):
+        self.name = name
+        self.request = request
+        self.admin = admin
+        self.write = write
+        self.record = record
+        self.needs = needs
+
+def _near_city(rng: random.Random) -> Dict[str, float]:
+    _, latitude, longitude, _, spread_km = rng.choice(generate_data.CITIES)
+    return {"latitude": round(latitude + rng.gauss(0, spread_km) / 111, 4),
+            "longitude": round(longitude + rng.gauss(0, spread_km) / 111, 4)}
+
+def _clinic(rng: random.Random, state: dict) -> dict:
+    return {"doctor_id": rng.choice(state["doctors"]), "name": "عيادة اختبار الحمل", "address": "شارع الاختبار، غزة",
+            "working_hours": "8:00 ص - 4:00 م", **_near_city(rng)}
+
+def _doctor(rng: random.Random, state: dict) -> dict:
+    return {"name": f"د. {rng.choice(generate_data.FIRST_NAMES)} اختبار", "specialty_id": rng.choice(state["specialties"])}
+
+def _pop(state: dict, key: str, count: int = 1) -> List[int]:
+    ids = state[key][-count:]
+    del state[key][-count:]
+    return ids
+
+async def _create(client: httpx.AsyncClient, rng: random.Random, state: dict, headers: dict, key: str, count: int):
+    """Create count doctors or clinics for a delete scenario."""
+    make, url = (_doctor, "/api/doctors/batch") if key == "new_doctors" else (_clinic, "/api/clinics/batch")
+    response = await client.post(url, json=[make(rng, state) for _ in range(count)], headers=headers)
+    _keep_batch(key)(response, state)
+
+def _keep(key: str):
+    def record(response: httpx.Response, state: dict):
+        if response.status_code == 200:
+            state[key].append(response.json()["id"])
+    return record
+
+def _keep_batch(key: str):
+    def record(response: httpx.Response, state: dict):
+        if response.status_code == 200:
+            state[key].extend(item["id"] for item in response.json()["results"] if item["status"] == "created")
+    return record
+
+def _import_file(rng: random.Random, state: dict) -> dict:
+    first = IMPORT_FIRST_ID + next(state["imports"]) * 100
+    lines = [json.dumps({"export_date": "2026-01-01T00:00:00", "version": "1.0", "format": "ndjson"})]
+    for offset in range(20):
+        lines.append(json.dumps({"table": "clinics", "row": {
+            "id": first + offset, "doctor_id": rng.choice(state["doctors"]), "name": "عيادة مستوردة",
+            "address": "غزة", **_near_city(rng),
+        }}))
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    return {"method": "POST", "url": "/api/admin/import-database", "files": {"file": ("load.ndjson", data)}}
+
+SCENARIOS = [
+    Scenario("GET /", lambda rng, state: {"method": "GET", "url": "/"}),
+    Scenario("GET /health", lambda rng, state: {"method": "GET", "url": "/health"}),
+    Scenario("GET /api/specialties", lambda rng, state: {"method": "GET", "url": "/api/specialties"}),
+    Scenario("GET /api/doctors", lambda rng, state: {
+        "method": "GET", "url": "/api/doctors", "params": {"specialty_id": rng.choice(state["specialties"])}}),
+    Scenario("GET /api/doctors?search", lambda rng, state: {
+        "method": "GET", "url": "/api/doctors", "params": {"search": rng.choice(generate_data.FIRST_NAMES)}}),
+    Scenario("GET /api/doctors/{id}", lambda rng, state: {
+        "method": "GET", "url": f"/api/doctors/{rng.choice(state['doctors'])}"}),
+    Scenario("GET /api/clinics", lambda rng, state: {
+        "method": "GET", "url": "/api/clinics", "params": {"doctor_id": rng.choice(state["doctors"])}}),
+    Scenario("GET /api/clinics/nearby", lambda rng, state: {
+        "method": "GET", "url": "/api/clinics/nearby", "params": {**_near_city(rng), "max_distance": 10}}),
+    Scenario("GET /api/clinics/nearby?open_now", lambda rng, state: {
+        "method": "GET", "url": "/api/clinics/nearby",
+        "params": {**_near_city(rng), "max_distance": 10, "open_now": "true"}}),
+    Scenario("GET /api/autocomplete", lambda rng, state: {
+        "method": "GET", "url": "/api/autocomplete", "params": {"q": rng.choice(generate_data.FIRST_NAMES)[:2]}}),
+    Scenario("POST /api/search (name, location)", lambda rng, state: {
+        "method": "POST", "url": "/api/search",
+        "json": {"doctor_name": rng.choice(generate_data.FIRST_NAMES), "max_distance": 20, **_near_city(rng)}}),
+    Scenario("POST /api/search (specialty)", lambda rng, state: {
+        "method": "POST", "url": "/api/search", "json": {"specialty_id": rng.choice(state["specialties"])}}),
+    Scenario("GET /metrics", lambda rng, state: {"method": "GET", "url": "/metrics"}),
+    Scenario("GET /api/admin/cache-stats", lambda rng, state: {"method": "GET", "url": "/api/admin/cache-stats"}, admin=True),
+    Scenario("GET /api/admin/pool-stats", lambda rng, state: {"method": "GET", "url": "/api/admin/pool-stats"}, admin=True),
+    Scenario("GET /api/admin/profiles", lambda rng, state: {"method": "GET", "url": "/api/admin/profiles"}, admin=True),
+    Scenario("POST /api/admin/login", lambda rng, state: {
+        "method": "POST", "url": "/api/admin/login", "json": {"username": "admin", "password": "admin123"}}),
+    Scenario("GET /api/admin/export-database", lambda rng, state: {
+        "method": "GET", "url": "/api/admin/export-database", "params": {"format": "ndjson"}}, admin=True),
+    Scenario("POST /api/specialties", lambda rng, state: {
+        "method": "POST", "url": "/api/specialties", "json": {"name": f"تخصص اختبار {next(state['names'])}"}},
+        admin=True, write=True),
+    Scenario("POST /api/doctors", lambda rng, state: {
+        "method": "POST", "url": "/api/doctors", "json": _doctor(rng, state)},
+        admin=True, write=True, record=_keep("new_doctors")),
+    Scenario("PUT /api/doctors/{id}", lambda rng, state: {
+        "method": "PUT", "url": f"/api/doctors/{rng.choice(state['new_doctors'] or [0])}", "json": {"bio": "محدث"}},
+        admin=True, write=True),
+    Scenario("POST /api/doctors/batch", lambda rng, state: {
+        "method": "POST", "url": "/api/doctors/batch", "json": [_doctor(rng, state) for _ in range(10)]},
+        admin=True, write=True, record=_keep_batch("new_doctors")),
+    Scenario("PUT /api/doctors/batch", lambda rng, state: {
+        "method": "PUT", "url": "/api/doctors/batch",
+        "json": [{"id": doctor_id, "bio": "محدث"} for doctor_id in rng.sample(state["new_doctors"], min(10, len(state["new_doctors"])))]},
+        admin=True, write=True),
+    Scenario("POST /api/clinics", lambda rng, state: {
+        "method": "POST", "url": "/api/clinics", "json": _clinic(rng, state)},
+        admin=True, write=True, record=_keep("new_clinics")),
+    Scenario("PUT /api/clinics/{id}", lambda rng, state: {
+        "method": "PUT", "url": f"/api/clinics/{rng.choice(state['new_clinics'] or [0])}", "json": _near_city(rng)},
+        admin=True, write=True),
+    Scenario("POST /api/clinics/batch", lambda rng, state: {
+        "method": "POST", "url": "/api/clinics/batch", "json": [_clinic(rng, state) for _ in range(10)]},
+        admin=True, write=True, record=_keep_batch("new_clinics")),
+    Scenario("PUT /api/clinics/batch", lambda rng, state: {
+        "method": "PUT", "url": "/api/clinics/batch",
+        "json": [{"id": clinic_id, **_near_city(rng)} for clinic_id in rng.sample(state["new_clinics"], min(10, len(state["new_clinics"])))]},
+        admin=True, write=True),
+    Scenario("POST /api/admin/import-database", _import_file, admin=True, write=True),
+    Scenario("POST /api/clinics/batch-delete", lambda rng, state: {
+        "method": "POST", "url": "/api/clinics/batch-delete", "json": {"ids": _pop(state, "new_clinics", 10)}},
+        admin=True, write=True, needs=("new_clinics", 10)),
+    Scenario("DELETE /api/clinics/{id}", lambda rng, state: {
+        "method": "DELETE", "url": f"/api/clinics/{_pop(state, 'new_clinics')[0]}"},
+        admin=True, write=True, needs=("new_clinics", 1)),
+    Scenario("POST /api/doctors/batch-delete", lambda rng, state: {
+        "method": "POST", "url": "/api/doctors/batch-delete", "json": {"ids": _pop(state, "new_doctors", 10)}},
+        admin=True, write=True, needs=("new_doctors", 10)),
+    Scenario("DELETE /api/doctors/{id}", lambda rng, state: {
+        "method": "DELETE", "url": f"/api/doctors/{_pop(state, 'new_doctors')[0]}"},
+        admin=True, write=True, needs=("new_doctors", 1)),
+]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, state: dict, headers: dict,
+                       concurrency: int, seconds: float) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    async def send(rng: random.Random) -> Tuple[httpx.Response, float]:
+        if scenario.needs:
+            key, count = scenario.needs
+            while len(state[key]) < count:
+                await _create(client, rng, state, headers, key, max(count, 50))
+        arguments = scenario.request(rng, state)
+        if scenario.admin:
+            arguments["headers"] = headers
+        start = time.perf_counter()
+        response = await client.request(**arguments)
+        await response.aread()
+        return response, time.perf_counter() - start
+
+    # Untimed first request: builds indexes and fills caches a running server would have
+    response, _ = await send(random.Random(-1))
+    if scenario.record:
+        scenario.record(response, state)
+
+    async def worker(seed: int):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            response, latency = await send(rng)
+            latencies.append(latency)
+            if response.status_code >= 400:
+                errors += 1
+            if scenario.record:
+                scenario.record(response, state)
+
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+async def run_load_test(args) -> Dict[str, dict]:
+    await main.app.router.startup()
+    transport = httpx.ASGITransport(app=main.app, client=("127.0.0.1", 50000))
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            response = await client.post("/api/admin/login", json={"username": "admin", "password": "admin123"})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            db = database.SessionLocal()
+            try:
+                state = {
+                    "specialties": [row[0] for row in db.query(database.Specialty.id)],
+                    "doctors": [row[0] for row in db.query(database.Doctor.id).limit(100000)],
+                    "new_doctors": [],
+                    "new_clinics": [],
+                    "names": itertools.count(int(time.time())),
+                    "imports": itertools.count(int(time.time()) % 100000),
+                }
+            finally:
+                db.close()
+
+            results = {}
+            print(f"\n{'scenario':<38} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+            for scenario in SCENARIOS:
+                if args.filter not in scenario.name or (scenario.write and args.read_only):
+                    continue
+                result = await run_scenario(client, scenario, state, headers, args.concurrency, args.seconds)
+                results[scenario.name] = result
+                print(
+                    f"{scenario.name:<38} {result['requests']:>8} {result['errors']:>6} {result['rps']:>8.1f} "
+                    f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+                )
+    finally:
+        await main.app.router.shutdown()
+    return results
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Scenarios whose p95 latency is more than tolerance worse than in baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']:.2f} ms -> {result['p95_ms']:.2f} ms, "
+                f"{before['rps']:.1f} -> {result['rps']:.1f} req/s"
+            )
+    return regressions
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="In-process load test")
+    parser.add_argument("--clinics", type=int, default=20000, help="Clinics generated into the temporary database")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per scenario")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of each scenario")
+    parser.add_argument("--filter", default="", help="Only run scenarios whose name contains this text")
+    parser.add_argument("--read-only", action="store_true", help="Skip the scenarios that write")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 increase over the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    database.init_db()
+    text_search.setup()
+    if GENERATE:
+        print(f"🌱 Generating {args.clinics} clinics...")
+        generate_data.generate(args.clinics, progress=False)
+
+    results = asyncio.run(run_load_test(args))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+        print(f"\n💾 Results saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} scenario(s) slower than the baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,159 @@
+"""
+Micro-benchmarks for the distance functions, response serialization and
+every read query behind the public endpoints.
+
+Each case runs for at least --seconds (and at least 5 calls) and reports
+calls, mean, p50 and p95 per call. Queries are called directly with a
+Session, bypassing HTTP; the fragment and nearby caches are emptied before
+every call so the numbers include loading and serializing the rows, while
+the clinic index and the name search index stay built as in a running
+server.
+
+Runs against DATABASE_URL if it is set, otherwise against a temporary
+SQLite database filled by generate_data.py.
+
+Usage (from the backend directory):
+    python benchmarks/micro.py [--clinics 20000] [--seconds 0.5] [--filter nearby]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+if "DATABASE_URL" not in os.environ:
+    # Point the app at a throwaway database before it is imported
+    TEMP_DIR = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/micro.db"
+    GENERATE = True
+else:
+    GENERATE = False
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import generate_data
+import main
+import schemas
+import serialization
+import spatial
+import text_search
+from utils import calculate_distance, calculate_distances
+
+CENTER = (31.5017, 34.4668)  # Gaza, the densest city in generate_data
+OPEN_MINUTE = 2 * 24 * 60 + 10 * 60  # Wednesday 10:00
+
+def measure(fn: Callable[[], object], seconds: float) -> List[float]:
+    """Per-call durations in seconds of fn, called for at least `seconds`."""
+    fn()  # Warm-up: builds indexes and fills the statement cache
+    durations = []
+    deadline = time.perf_counter() + seconds
+    while len(durations) < 5 or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def _report(name: str, durations: List[float], per: int = 1):
+    durations = sorted(duration / per for duration in durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    print(
+        f"{name:<50} {len(durations):>7} {statistics.fmean(durations) * 1e6:>11.2f} "
+        f"{statistics.median(durations) * 1e6:>11.2f} {p95 * 1e6:>11.2f}"
+    )
+
+def distance_cases(rng: random.Random) -> List[Tuple[str, Callable, int]]:
+    points = [(CENTER[0] + rng.uniform(-0.5, 0.5), CENTER[1] + rng.uniform(-0.5, 0.5)) for _ in range(10000)]
+    coordinates = np.array(points)
+
+    def scalar():
+        for latitude, longitude in points:
+            calculate_distance(CENTER[0], CENTER[1], latitude, longitude)
+
+    return [
+        ("calculate_distance (per point)", scalar, len(points)),
+        ("calculate_distances, 10k points (per point)", lambda: calculate_distances(*CENTER, coordinates), len(points)),
+        ("calculate_distances, 10k points, 5 km box", lambda: calculate_distances(*CENTER, coordinates, 5), len(points)),
+    ]
+
+def serialization_cases(db) -> List[Tuple[str, Callable, int]]:
+    clinics = db.query(database.Clinic).options(*database.clinic_load_options()).order_by(database.Clinic.id).limit(50).all()
+    doctors = db.query(database.Doctor).options(*database.doctor_load_options()).order_by(database.Doctor.id).limit(50).all()
+    rows = [(clinic.id, 1.25) for clinic in clinics]
+
+    def pydantic_clinics():
+        for clinic in clinics:
+            schemas.ClinicWithDoctorResponse.model_validate(clinic).model_dump_json()
+
+    def pydantic_doctors():
+        for doctor in doctors:
+            schemas.DoctorResponse.model_validate(doctor).model_dump_json()
+
+    def cold_list():
+        serialization.fragment_cache.clear()
+        serialization.clinic_list(db, rows)
+
+    return [
+        ("ClinicWithDoctorResponse validate+dump (per row)", pydantic_clinics, len(clinics)),
+        ("DoctorResponse validate+dump (per row)", pydantic_doctors, len(doctors)),
+        ("clinic_list 50 rows, cold (per row)", cold_list, len(rows)),
+        ("clinic_list 50 rows, warm (per row)", lambda: serialization.clinic_list(db, rows), len(rows)),
+    ]
+
+def query_cases(db) -> List[Tuple[str, Callable, int]]:
+    doctor_id = db.query(database.Doctor.id).order_by(database.Doctor.id).first()[0]
+    specialty_id = db.query(database.Specialty.id).order_by(database.Specialty.id).first()[0]
+    search = schemas.SearchRequest(doctor_name="محمد", latitude=CENTER[0], longitude=CENTER[1], max_distance=10)
+    search_by_specialty = schemas.SearchRequest(specialty_id=specialty_id)
+
+    def cold(fn, *args):
+        def call():
+            serialization.fragment_cache.clear()
+            spatial.nearby_cache.invalidate()
+            fn(db, *args)
+        return call
+
+    return [
+        ("specialties", cold(main._query_specialties), 1),
+        ("doctors page", cold(main._query_doctors, None, None, None, None), 1),
+        ("doctors by specialty", cold(main._query_doctors, specialty_id, None, None, None), 1),
+        ("doctors name search", cold(main._query_doctors, None, "محمد", None, None), 1),
+        ("doctor by id", cold(main._query_doctor, doctor_id), 1),
+        ("clinics page", cold(main._query_clinics, None, None, None), 1),
+        ("clinics of a doctor", cold(main._query_clinics, doctor_id, None, None), 1),
+        ("nearby 10 km", cold(main._query_nearby_clinics, *CENTER, None, 10, None, None, None), 1),
+        ("nearby 50 km, specialty", cold(main._query_nearby_clinics, *CENTER, specialty_id, 50, None, None, None), 1),
+        ("nearby 10 km, open at", cold(main._query_nearby_clinics, *CENTER, None, 10, OPEN_MINUTE, None, None), 1),
+        ("search name + location", cold(main._query_search_clinics, search, None), 1),
+        ("search specialty", cold(main._query_search_clinics, search_by_specialty, None), 1),
+    ]
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks")
+    parser.add_argument("--clinics", type=int, default=20000, help="Clinics generated into the temporary database")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Minimum time spent on each case")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this text")
+    args = parser.parse_args()
+
+    database.init_db()
+    text_search.setup()
+    if GENERATE:
+        print(f"🌱 Generating {args.clinics} clinics...")
+        generate_data.generate(args.clinics, progress=False)
+
+    db = database.SessionLocal()
+    try:
+        cases = distance_cases(random.Random(1)) + serialization_cases(db) + query_cases(db)
+        print(f"\n{'case':<50} {'calls':>7} {'mean (us)':>11} {'p50 (us)':>11} {'p95 (us)':>11}")
+        for name, fn, per in cases:
+            if args.filter in name:
+                _report(name, measure(fn, args.seconds), per)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,48 @@
+"""
+Compare radius-then-sort with the k-nearest-neighbour search of the clinic index.
+
+Fills a ClinicIndex with clinics spread over a dense city and times, for
+several radii, finding the k closest clinics by measuring every clinic in
+the radius and sorting (ClinicIndex.nearby) against ClinicIndex.nearest.
+
+Usage (from the backend directory):
+    python benchmarks/nearest_clinics.py [clinics] [k]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spatial import ClinicIndex
+
+CENTER = (31.5, 34.45)
+
+def per_call_ms(fn, iterations: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+def run_benchmark():
+    clinic_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    
+    random.seed(clinic_count)
+    index = ClinicIndex()
+    index._built_at = time.monotonic()
+    for clinic_id in range(clinic_count):
+        index.upsert(clinic_id, CENTER[0] + random.uniform(-1, 1), CENTER[1] + random.uniform(-1, 1))
+    
+    print(f"{clinic_count} clinics, k={k}")
+    print(f"{'radius (km)':>12} {'in radius':>10} {'radius+sort (ms)':>17} {'k-NN (ms)':>10}")
+    for radius in (5, 20, 50, 100):
+        within = len(index.nearby(*CENTER, radius))
+        assert index.nearby(*CENTER, radius)[:k] == index.nearest(*CENTER, k, radius)
+        full = per_call_ms(lambda: index.nearby(*CENTER, radius)[:k])
+        nearest = per_call_ms(lambda: index.nearest(*CENTER, k, radius))
+        print(f"{radius:>12} {within:>10} {full:>17.2f} {nearest:>10.2f}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,121 @@
+"""
+Check that list endpoints run a constant number of SQL statements.
+
+Each endpoint is called against a small and a large temporary SQLite
+database for every loading strategy. The script exits with status 1 if any
+endpoint issues more statements on the large dataset, which means rows are
+being loaded one by one (N+1 queries).
+
+Usage (from the backend directory, requires httpx for the test client):
+    python benchmarks/query_counts.py
+"""
+import os
+import random
+import sys
+import tempfile
+
+# Point the app at a throwaway database before it is imported
+TEMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/query_counts.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import cache
+import database
+import main
+import serialization
+import spatial
+import text_search
+
+STRATEGIES = ["joined", "selectin", "lazy"]
+SIZES = [10, 40]  # Doctors per dataset, each with 3 clinics
+
+ENDPOINTS = [
+    ("GET", "/api/specialties", None),
+    ("GET", "/api/doctors", None),
+    ("GET", "/api/doctors?specialty_id=1", None),
+    ("GET", "/api/doctors?search=طبيب", None),
+    ("GET", "/api/clinics", None),
+    ("GET", "/api/clinics/nearby?latitude=31.5&longitude=34.45&max_distance=100", None),
+    ("GET", "/api/clinics/nearby?latitude=31.5&longitude=34.45&max_distance=100&specialty_id=1", None),
+    ("GET", "/api/clinics/nearby?latitude=31.5&longitude=34.45&max_distance=100&open_at=2026-01-05T10:00:00", None),
+    ("POST", "/api/search", {"doctor_name": "د."}),
+    ("POST", "/api/search", {"doctor_name": "طبيب 1"}),
+    ("POST", "/api/search", {"specialty_id": 1, "latitude": 31.5, "longitude": 34.45}),
+    ("POST", "/api/search", {"specialty_id": 1, "latitude": 31.5, "longitude": 34.45, "open_at": "2026-01-05T10:00:00"}),
+]
+
+def populate(doctor_count: int):
+    """Replace the database contents with doctor_count doctors and 3 clinics each."""
+    random.seed(doctor_count)
+    database.Base.metadata.drop_all(bind=database.engine)
+    database.init_db()
+    text_search.setup()
+    spatial.clinic_index.clear()
+    
+    db = database.SessionLocal()
+    specialties = [database.Specialty(name=f"تخصص {i}") for i in range(5)]
+    db.add_all(specialties)
+    db.flush()
+    for i in range(doctor_count):
+        doctor = database.Doctor(name=f"د. طبيب {i}", specialty_id=specialties[i % 5].id)
+        db.add(doctor)
+        db.flush()
+        for j in range(3):
+            db.add(database.Clinic(
+                doctor_id=doctor.id,
+                name=f"عيادة {i}-{j}",
+                address="غزة",
+                latitude=31.5 + random.uniform(-0.3, 0.3),
+                longitude=34.45 + random.uniform(-0.3, 0.3),
+                working_hours="8:00 ص - 4:00 م" if j else "السبت - الخميس 4:00 - 9:00 م"
+            ))
+    database.refresh_doctor_counts(db)
+    database.refresh_clinic_hours(db)
+    db.commit()
+    db.close()
+    text_search.invalidate()
+
+def measure(client: TestClient) -> dict:
+    """Statement count per endpoint."""
+    counts = {}
+    for method, url, body in ENDPOINTS:
+        with database.count_queries() as counter:
+            response = client.request(method, url, json=body)
+        response.raise_for_status()
+        counts[(method, url, str(body))] = (counter.count, len(response.json()))
+    return counts
+
+def main_check() -> int:
+    # Measure the database path, not cache hits
+    cache.response_cache.backend = None
+    spatial.nearby_cache.precision = 0
+    serialization.fragment_cache.max_entries = 0
+    
+    failures = 0
+    with TestClient(main.app) as client:
+        for strategy in STRATEGIES:
+            if strategy == "lazy" and database.DB_MODE == "async":
+                continue
+            database.LOAD_STRATEGY = strategy
+            results = []
+            for size in SIZES:
+                populate(size)
+                results.append(measure(client))
+            
+            print(f"\n== LOAD_STRATEGY={strategy}")
+            for key in results[0]:
+                (small, small_rows), (large, large_rows) = results[0][key], results[1][key]
+                grows = large > small
+                # Lazy loading is expected to grow; it is reported but not a failure
+                if grows and strategy != "lazy":
+                    failures += 1
+                marker = "GROWS" if grows else "ok"
+                print(f"{marker:>5}  {small:>3} stmts/{small_rows:>3} rows -> "
+                      f"{large:>3} stmts/{large_rows:>3} rows  {key[0]} {key[1]} {key[2] if key[2] != 'None' else ''}")
+    
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -0,0 +1,117 @@
+"""
+Compare the old and the pre-serialized response paths for clinic lists.
+
+Loads a generated catalogue through the bulk importer, then serializes the
+same pages of clinics three ways and prints rows per second for each:
+- orm: ORM rows -> Pydantic models -> response_model validation -> JSON,
+  what FastAPI did before serialization.py
+- cold: serialization.clinic_list with an empty fragment cache
+- warm: serialization.clinic_list with every fragment cached
+It also times GET /api/clinics end to end with the fragment cache off and on.
+
+Usage (from the backend directory, requires httpx for the test client):
+    python benchmarks/serialization_throughput.py [clinics] [page_size]
+"""
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+
+# Point the app at a throwaway database before it is imported
+TEMP_DIR = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMP_DIR}/serialization_throughput.db"
+os.environ["CACHE_BACKEND"] = "none"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+import backup
+import database
+import main
+import schemas
+import serialization
+
+DOCTORS = 500
+
+def export_file(clinic_count: int) -> bytes:
+    """NDJSON export with 10 specialties, DOCTORS doctors and clinic_count clinics."""
+    random.seed(clinic_count)
+    lines = [json.dumps({"export_date": "2026-01-01T00:00:00", "version": "1.0", "format": "ndjson"})]
+    for i in range(1, 11):
+        lines.append(json.dumps({"table": "specialties", "row": {"id": i, "name": f"تخصص {i}"}}))
+    for i in range(1, DOCTORS + 1):
+        lines.append(json.dumps({"table": "doctors", "row": {
+            "id": i, "name": f"د. طبيب {i}", "specialty_id": i % 10 + 1, "bio": "طبيب عام",
+        }}))
+    for i in range(1, clinic_count + 1):
+        lines.append(json.dumps({"table": "clinics", "row": {
+            "id": i, "doctor_id": i % DOCTORS + 1, "name": f"عيادة {i}", "address": "غزة",
+            "latitude": random.uniform(31.2, 31.6), "longitude": random.uniform(34.2, 34.6),
+            "working_hours": "8:00 ص - 4:00 م",
+        }}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def orm_page(db, ids: List[int]) -> bytes:
+    rows = (
+        db.query(database.Clinic)
+        .options(*database.clinic_load_options())
+        .filter(database.Clinic.id.in_(ids))
+        .order_by(database.Clinic.id)
+        .all()
+    )
+    models = [schemas.ClinicWithDoctorResponse.model_validate(row) for row in rows]
+    adapter = TypeAdapter(List[schemas.ClinicWithDoctorResponse])
+    content = jsonable_encoder(adapter.validate_python(models))
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def rows_per_second(fn, pages: List[List[int]]) -> float:
+    start = time.perf_counter()
+    rows = 0
+    for ids in pages:
+        fn(ids)
+        rows += len(ids)
+    return rows / (time.perf_counter() - start)
+
+def run_benchmark():
+    clinic_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    
+    with TestClient(main.app) as client:
+        backup.import_stream(io.BytesIO(export_file(clinic_count)), "ndjson")
+        db = database.SessionLocal()
+        try:
+            pages = [list(range(first, min(first + size, clinic_count + 1))) for first in range(1, clinic_count + 1, size)]
+            
+            orm = rows_per_second(lambda ids: orm_page(db, ids), pages)
+            serialization.fragment_cache.max_entries = clinic_count + DOCTORS
+            serialization.fragment_cache.clear()
+            cold = rows_per_second(lambda ids: serialization.clinic_list(db, [(i, None) for i in ids]), pages)
+            warm = rows_per_second(lambda ids: serialization.clinic_list(db, [(i, None) for i in ids]), pages)
+        finally:
+            db.close()
+        
+        timings = {}
+        for label, entries in (("fragments off", 0), ("fragments on", clinic_count + DOCTORS)):
+            serialization.fragment_cache.max_entries = entries
+            serialization.fragment_cache.clear()
+            client.get("/api/clinics", params={"limit": size})
+            start = time.perf_counter()
+            for _ in range(50):
+                client.get("/api/clinics", params={"limit": size})
+            timings[label] = (time.perf_counter() - start) / 50 * 1000
+    
+    print(f"{clinic_count} clinics, pages of {size}")
+    print(f"{'orm + pydantic':<16} {orm:>10.0f} rows/s")
+    print(f"{'fragments cold':<16} {cold:>10.0f} rows/s ({cold / orm:.1f}x)")
+    print(f"{'fragments warm':<16} {warm:>10.0f} rows/s ({warm / orm:.1f}x)")
+    for label, ms in timings.items():
+        print(f"GET /api/clinics?limit={size} with {label}: {ms:.2f} ms")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,250 @@
+"""
+Response cache for the read-heavy catalogue endpoints.
+
+GET responses from CACHED_ROUTES are stored by path and query string. Every
+entity type (specialty, doctor, clinic) has a generation counter that is part
+of the cache key; write endpoints call invalidate() to bump it, so stale
+entries are simply never read again and age out of the backend.
+
+Every cached response carries an ETag, and a matching If-None-Match gets a
+304 straight from the cache, before any route or database session runs.
+
+With read replicas (database.ReadRouter), admins who have just written
+bypass the cache, and for REPLICA_STICKY_SECONDS after an invalidation the
+affected routes are not stored, so a read from a lagging replica cannot be
+cached under the new generation.
+
+Backends that block on the network (Redis) are called from the threadpool,
+and read all the counters of a lookup in one round trip.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+import database
+
+# "memory" (per-process LRU), "redis" (shared between workers) or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Entity types whose writes invalidate each cached route
+CACHED_ROUTES = [
+    (re.compile(r"^/api/specialties$"), ("specialty", "doctor")),
+    (re.compile(r"^/api/doctors$"), ("doctor", "specialty")),
+    (re.compile(r"^/api/doctors/\d+$"), ("doctor", "specialty")),
+    (re.compile(r"^/api/clinics$"), ("clinic", "doctor", "specialty")),
+]
+
+ENTITIES = ("specialty", "doctor", "clinic")
+
+# Response headers stored with the body (e.g. the pagination cursor)
+CACHED_HEADERS = ("x-next-cursor",)
+
+class MemoryBackend:
+    """In-process LRU cache with per-entry TTL."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counters(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+class RedisBackend:
+    """
+    Cache shared by all workers, stored in Redis.
+
+    Needs the redis package (see requirements.txt). Any client with the
+    redis-py get/mget/set/incr interface works, so a local stand-in such as
+    fakeredis can be passed as client in development.
+    """
+
+    name = "redis"
+    blocking = True
+
+    def __init__(self, url: str = CACHE_REDIS_URL, client=None, prefix: str = "mydoctor:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.client.mget([self.prefix + key for key in keys])
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_counters(self, keys: List[str]) -> List[int]:
+        return [int(value) if value is not None else 0 for value in self.get_many(keys)]
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+class ResponseCache:
+    """Caches whole GET responses for CACHED_ROUTES."""
+
+    def __init__(self, backend=None, ttl: int = CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def invalidate(self, *entities: str):
+        """Bump the generation of the given entity types (all of them if none given)."""
+        if not self.enabled:
+            return
+        for entity in entities or ENTITIES:
+            self.backend.incr(f"gen:{entity}")
+            if database.read_router.replicas:
+                # Shared with the other workers through the backend, expires with the sticky window
+                self.backend.set(f"lag:{entity}", b"1", math.ceil(database.read_router.sticky_seconds))
+
+    def _replicas_may_lag(self, entities: Tuple[str, ...]) -> bool:
+        if not database.read_router.replicas:
+            return False
+        return any(value is not None for value in self.backend.get_many([f"lag:{entity}" for entity in entities]))
+
+    def _key(self, request: Request, entities: Tuple[str, ...]) -> str:
+        counters = self.backend.get_counters([f"gen:{entity}" for entity in entities])
+        generations = ",".join(str(count) for count in counters)
+        query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+        return f"resp:{request.url.path}?{query}#{generations}"
+
+    def _lookup(self, request: Request, entities: Tuple[str, ...]) -> Tuple[str, Optional[bytes]]:
+        """The cache key of the request and the stored entry, if any."""
+        key = self._key(request, entities)
+        return key, self.backend.get(key)
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    @staticmethod
+    def _route_entities(request: Request) -> Optional[Tuple[str, ...]]:
+        if request.method != "GET":
+            return None
+        for pattern, entities in CACHED_ROUTES:
+            if pattern.match(request.url.path):
+                return entities
+        return None
+
+    async def handle(self, request: Request, call_next) -> Response:
+        """Serve the request from the cache, or run it and store the response."""
+        entities = self._route_entities(request) if self.enabled else None
+        if entities is None or database.read_router.is_sticky(request.headers.get("authorization")):
+            # Admins who just wrote read from the primary, not from responses cached off a replica
+            return await call_next(request)
+
+        key, cached = await self._call(self._lookup, request, entities)
+        if cached is not None:
+            self.hits += 1
+            meta, body = cached.split(b"\n", 1)
+            meta = json.loads(meta)
+            return self._respond(request, body, meta["etag"], meta["headers"])
+
+        self.misses += 1
+        response = await call_next(request)
+        if response.status_code != 200 or await self._call(self._replicas_may_lag, entities):
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers = {
+            name: response.headers[name]
+            for name in CACHED_HEADERS
+            if name in response.headers
+        }
+        meta = json.dumps({"etag": etag, "headers": headers}).encode("utf-8")
+        await self._call(self.backend.set, key, meta + b"\n" + body, self.ttl)
+        return self._respond(request, body, etag, headers)
+
+    def _respond(self, request: Request, body: bytes, etag: str, headers: Dict[str, str]) -> Response:
+        headers = dict(headers, ETag=etag)
+        if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name if self.enabled else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def _parse_if_none_match(value: Optional[str]) -> set:
+    if not value:
+        return set()
+    tags = set()
+    for tag in value.split(","):
+        tag = tag.strip()
+        tags.add(tag[2:] if tag.startswith("W/") else tag)
+    return tags
+
+def create_backend(name: str = CACHE_BACKEND):
+    """Backend for the CACHE_BACKEND setting (None disables caching)."""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend()
+    return None
+
+# Shared cache used by the API
+response_cache = ResponseCache(create_backend())
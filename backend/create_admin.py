@@ -0,0 +1,48 @@
+"""
+Create an admin account, or reset an existing admin's password.
+
+Run once per deployment instead of letting the server create admin/admin123
+at startup (FAST_START=1 or BOOTSTRAP_ADMIN=0). Uses DATABASE_URL like the
+server. The password is read from --password or prompted for.
+
+Usage:
+    python create_admin.py admin --email admin@mydoctor.com
+    python create_admin.py admin --reset-password
+"""
+import argparse
+import getpass
+import sys
+
+import database
+import startup
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update an admin account")
+    parser.add_argument("username", nargs="?", default=startup.DEFAULT_ADMIN_USERNAME)
+    parser.add_argument("--email", help="Stored for new admins, and for existing ones with --reset-password")
+    parser.add_argument("--password", help="Prompted for when omitted")
+    parser.add_argument("--reset-password", action="store_true", help="Replace the password of an existing admin")
+    args = parser.parse_args()
+
+    database.init_db()
+    password = args.password
+    if password is None:
+        password = getpass.getpass(f"Password for {args.username}: ")
+        if password != getpass.getpass("Repeat password: "):
+            print("❌ Passwords do not match")
+            return 1
+    if not password:
+        print("❌ Password must not be empty")
+        return 1
+
+    result = startup.ensure_admin(args.username, password, args.email, args.reset_password)
+    if result == "created":
+        print(f"✅ Admin created: username={args.username}")
+    elif result == "updated":
+        print(f"✅ Password updated: username={args.username}")
+    else:
+        print(f"⏭️  Admin {args.username} already exists (use --reset-password to change the password)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,310 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import bindparam, create_engine, delete, event, exists, insert, inspect, select, func, update, text, Column, Integer, String, Float, ForeignKey, DateTime, Index
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, joinedload, selectinload, validates
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, List, Optional
+import hashlib
 import os
+import threading
+import time
+from utils import calculate_distance, normalize_arabic, EARTH_RADIUS_KM
+from opening_hours import parse_working_hours
+import profiling
 
 # Database setup
 # Use PostgreSQL if DATABASE_URL is set (production), otherwise SQLite (local development)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./my_doctor.db")
 
-# Render provides DATABASE_URL with postgres:// but SQLAlchemy needs postgresql://
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def normalize_url(url: str) -> str:
+    # Render provides DATABASE_URL with postgres:// but SQLAlchemy needs postgresql://
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+DATABASE_URL = normalize_url(DATABASE_URL)
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_MEMORY_SQLITE = IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/") == "sqlite:")
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+# Connection pool settings (in-memory SQLite keeps SQLAlchemy's defaults)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this many seconds (-1 = never). On PostgreSQL
+# this drops connections before the server or a proxy does, which makes
+# pre-ping on every checkout largely unnecessary.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1" if IS_SQLITE else "1800"))
+# Test every connection with a round trip when it is checked out
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", not IS_SQLITE)
+
+class PoolWaitStats:
+    """Time spent waiting for a connection from the pool."""
+    
+    def __init__(self):
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - start)
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - start)
+
+def engine_options(pool_class) -> dict:
+    """Pool keyword arguments for create_engine / create_async_engine."""
+    if IS_MEMORY_SQLITE:
+        return {}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
 
 # Create engine with appropriate settings
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
+def create_sync_engine(url: str):
+    if url.startswith("sqlite"):
+        return create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            **engine_options(TimedQueuePool)
+        )
     # PostgreSQL doesn't need check_same_thread
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    return create_engine(url, **engine_options(TimedQueuePool))
+
+engine = create_sync_engine(DATABASE_URL)
+
+# "async" runs read endpoints on an async engine (aiosqlite / asyncpg) so a
+# worker can keep many queries in flight; "sync" keeps every endpoint on the
+# threadpool with the regular engine. Write endpoints always use the sync engine.
+DB_MODE = os.getenv("DB_MODE", "async")
+
+def async_database_url(url: str) -> str:
+    """The DATABASE_URL with the async driver for its database."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        # asyncpg spells libpq's sslmode as ssl
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1).replace("sslmode=", "ssl=")
+    return url
+
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL),
+        **engine_options(TimedAsyncAdaptedQueuePool)
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+# Read replicas for the read endpoints: comma-separated URLs in the same form
+# as DATABASE_URL. Writes, and admins who have just written, use the primary.
+READ_REPLICA_URLS = [url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()]
+# Seconds a replica that failed is skipped before it is tried again
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+# Seconds an admin token keeps reading from the primary after a write; longer than the replication lag
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+class Replica:
+    """Engines and session factories of one read replica, and its health."""
+    
+    def __init__(self, name: str, url: str):
+        url = normalize_url(url)
+        self.name = name
+        self.engine = create_sync_engine(url)
+        # session.info["replica"] marks sessions that may read stale rows (see reads_replica)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine, info={"replica": name})
+        if DB_MODE == "async":
+            self.async_engine = create_async_engine(
+                async_database_url(url),
+                **engine_options(TimedAsyncAdaptedQueuePool)
+            )
+            self.AsyncSessionLocal = async_sessionmaker(
+                self.async_engine, autoflush=False, expire_on_commit=False, info={"replica": name}
+            )
+        else:
+            self.async_engine = None
+            self.AsyncSessionLocal = None
+        self.down_until = 0.0
+        self.sessions = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+class ReadRouter:
+    """
+    Picks the database a read request uses.
+    
+    Healthy replicas take turns (round robin). A replica whose query fails
+    with a connection error is skipped for REPLICA_RETRY_SECONDS and the
+    request is retried on the primary; when every replica is down, reads go
+    to the primary. An admin token that wrote in the last
+    REPLICA_STICKY_SECONDS reads from the primary, so admins see their own
+    writes before they reach the replicas. For the same window after any
+    write, rows read from a replica are not cached (see replicas_may_lag).
+    """
+    
+    def __init__(self, replicas: List[Replica], retry_seconds: float = REPLICA_RETRY_SECONDS,
+                 sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.replicas = replicas
+        self.retry_seconds = retry_seconds
+        self.sticky_seconds = sticky_seconds
+        self.primary_sessions = 0
+        self.last_write = float("-inf")
+        self._next = 0
+        # Authorization header -> time.monotonic() until which it reads from the primary
+        self._sticky: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def remember_write(self, authorization: Optional[str]):
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.last_write = now
+            if not authorization:
+                return
+            if len(self._sticky) > 1000:
+                self._sticky = {key: until for key, until in self._sticky.items() if until > now}
+            self._sticky[authorization] = now + self.sticky_seconds
+    
+    def is_sticky(self, authorization: Optional[str]) -> bool:
+        """Whether this admin token wrote recently and reads from the primary."""
+        if not self.replicas or not authorization:
+            return False
+        with self._lock:
+            return self._sticky.get(authorization, 0.0) > time.monotonic()
+    
+    def replicas_may_lag(self) -> bool:
+        """Whether a write made by this process may not have reached the replicas yet."""
+        return bool(self.replicas) and time.monotonic() - self.last_write < self.sticky_seconds
+    
+    def choose(self, authorization: Optional[str] = None) -> Optional[Replica]:
+        """The replica for a read, or None for the primary."""
+        if not self.replicas:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if not (authorization and self._sticky.get(authorization, 0.0) > now):
+                for _ in range(len(self.replicas)):
+                    replica = self.replicas[self._next % len(self.replicas)]
+                    self._next += 1
+                    if replica.down_until <= now:
+                        replica.sessions += 1
+                        return replica
+            self.primary_sessions += 1
+        return None
+    
+    def mark_down(self, replica: Replica, error: Exception):
+        with self._lock:
+            replica.down_until = time.monotonic() + self.retry_seconds
+            replica.failures += 1
+            replica.last_error = str(getattr(error, "orig", error))
+    
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "primary_sessions": self.primary_sessions,
+            "replicas": [
+                {
+                    "name": replica.name,
+                    "healthy": replica.down_until <= now,
+                    "sessions": replica.sessions,
+                    "failures": replica.failures,
+                    "last_error": replica.last_error,
+                }
+                for replica in self.replicas
+            ],
+        }
+
+read_router = ReadRouter([Replica(f"replica{number}", url) for number, url in enumerate(READ_REPLICA_URLS, 1)])
+
+def all_engines():
+    """The sync engines behind every configured database connection."""
+    engines = [engine]
+    if async_engine is not None:
+        engines.append(async_engine.sync_engine)
+    for replica in read_router.replicas:
+        engines.append(replica.engine)
+        if replica.async_engine is not None:
+            engines.append(replica.async_engine.sync_engine)
+    return engines
+
+async def dispose_async_engines():
+    for pool_engine in [async_engine] + [replica.async_engine for replica in read_router.replicas]:
+        if pool_engine is not None:
+            await pool_engine.dispose()
+
+# SQLite has no trig functions, so expose the Haversine formula as haversine()
+# on every new connection. PostgreSQL gets an SQL function of the same name in init_db.
+def register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("haversine", 4, calculate_distance, deterministic=True)
+
+for sqlite_engine in all_engines():
+    if sqlite_engine.dialect.name == "sqlite":
+        event.listen(sqlite_engine, "connect", register_sqlite_functions)
+
+# Serve /api/specialties from the denormalized Specialty.doctor_count column
+# instead of counting doctors with a grouped query on every request
+USE_DOCTOR_COUNT_COLUMN = env_flag("USE_DOCTOR_COUNT_COLUMN", False)
+
+# How list endpoints load Clinic -> Doctor -> Specialty: "joined" (one query
+# with JOINs), "selectin" (one extra IN query per relationship) or "lazy"
+LOAD_STRATEGY = os.getenv("LOAD_STRATEGY", "joined")
+
+if DB_MODE == "async" and LOAD_STRATEGY == "lazy":
+    # Async responses are serialized outside the session, where lazy loads cannot run
+    raise ValueError("LOAD_STRATEGY=lazy requires DB_MODE=sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_commit(session):
+    # Read by get_db to keep the admin on the primary (ReadRouter.remember_write)
+    session.info["committed"] = True
+
 Base = declarative_base()
 
 # Database models
@@ -38,24 +323,36 @@ class Specialty(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)  # e.g., "طب عام", "أسنان"
     icon_url = Column(String, nullable=True)
+    doctor_count = Column(Integer, nullable=False, default=0, server_default="0")  # Kept in sync by adjust_doctor_count
     
     doctors = relationship("Doctor", back_populates="specialty")
 
+def _normalized_name(context):
+    """Column default for inserts that bypass the ORM (bulk import)."""
+    name = context.get_current_parameters().get("name")
+    return normalize_arabic(name) if name is not None else None
+
 class Doctor(Base):
     __tablename__ = "doctors"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
-    specialty_id = Column(Integer, ForeignKey("specialties.id"), nullable=False)
+    specialty_id = Column(Integer, ForeignKey("specialties.id"), nullable=False, index=True)
     phone = Column(String)
     email = Column(String)
     photo_url = Column(String, nullable=True)
     bio = Column(String, nullable=True)
     rating = Column(Float, default=0.0)
     created_at = Column(DateTime, default=datetime.utcnow)
+    name_normalized = Column(String, nullable=True, default=_normalized_name)  # normalize_arabic(name), used by text_search
     
     specialty = relationship("Specialty", back_populates="doctors")
     clinics = relationship("Clinic", back_populates="doctor", cascade="all, delete-orphan")
+    
+    @validates("name")
+    def _normalize_name(self, key, name):
+        self.name_normalized = normalize_arabic(name) if name is not None else None
+        return name
 
 class Clinic(Base):
     __tablename__ = "clinics"
@@ -71,15 +368,410 @@ class Clinic(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     doctor = relationship("Doctor", back_populates="clinics")
+    
+    __table_args__ = (
+        # Serves the bounding-box predicate of distance queries
+        Index("ix_clinics_lat_lon", "latitude", "longitude"),
+    )
+
+class ClinicHours(Base):
+    """One opening interval of a clinic, parsed from Clinic.working_hours by store_clinic_hours."""
+    __tablename__ = "clinic_hours"
+    
+    id = Column(Integer, primary_key=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id", ondelete="CASCADE"), nullable=False)
+    opens_at = Column(Integer, nullable=False)  # Minutes since Monday 00:00 clinic time
+    closes_at = Column(Integer, nullable=False)  # Exclusive, at most opening_hours.MINUTES_PER_WEEK
+    
+    __table_args__ = (
+        # Serves the correlated EXISTS of clinic_open_at
+        Index("ix_clinic_hours_clinic_open", "clinic_id", "opens_at", "closes_at"),
+    )
+
+class SchemaVersion(Base):
+    """Fingerprint of the schema init_db last brought the database up to."""
+    __tablename__ = "schema_version"
+    
+    version = Column(String, primary_key=True)
+
+# Inlinable SQL version of utils.calculate_distance for PostgreSQL
+POSTGRES_HAVERSINE = f"""
+CREATE OR REPLACE FUNCTION haversine(
+    lat1 double precision, lon1 double precision,
+    lat2 double precision, lon2 double precision
+) RETURNS double precision
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT 2 * {EARTH_RADIUS_KM} * asin(sqrt(least(1.0,
+        sin(radians(lat2 - lat1) / 2) ^ 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ^ 2
+    )))
+$$
+"""
+
+def schema_fingerprint() -> str:
+    """Hash of the tables, columns, indexes and SQL functions init_db creates."""
+    digest = hashlib.sha256(POSTGRES_HAVERSINE.encode())
+    for table in Base.metadata.sorted_tables:
+        digest.update(f"table {table.name}\n".encode())
+        for column in table.columns:
+            digest.update(f"column {column.name} {column.type!r} {column.nullable}\n".encode())
+        for name in sorted(str(index.name) for index in table.indexes):
+            digest.update(f"index {name}\n".encode())
+    return digest.hexdigest()[:16]
+
+def stored_schema_version() -> Optional[str]:
+    """The fingerprint recorded by the last full init_db, or None."""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(SchemaVersion.version)).scalar()
+    except DBAPIError:
+        return None  # No schema_version table yet
 
 # Create all tables
-def init_db():
+def init_db(force: bool = False) -> bool:
+    """
+    Create missing tables, columns, indexes and functions. Skipped with a
+    single SELECT when schema_version already matches schema_fingerprint(),
+    unless force. Returns whether the full check ran.
+    """
+    version = schema_fingerprint()
+    if not force and stored_schema_version() == version:
+        return False
+    
+    hours_table_existed = inspect(engine).has_table(ClinicHours.__tablename__)
     Base.metadata.create_all(bind=engine)
+    
+    if not hours_table_existed:
+        with engine.begin() as connection:
+            refresh_clinic_hours(connection)
+    
+    # create_all skips columns and indexes on tables that already exist
+    if "doctor_count" not in {column["name"] for column in inspect(engine).get_columns("specialties")}:
+        with engine.begin() as connection:
+            connection.execute(text(
+                "ALTER TABLE specialties ADD COLUMN doctor_count INTEGER NOT NULL DEFAULT 0"
+            ))
+            refresh_doctor_counts(connection)
+    
+    if "name_normalized" not in {column["name"] for column in inspect(engine).get_columns("doctors")}:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE doctors ADD COLUMN name_normalized VARCHAR"))
+            refresh_normalized_names(connection)
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            connection.execute(text(POSTGRES_HAVERSINE))
+    
+    with engine.begin() as connection:
+        connection.execute(delete(SchemaVersion.__table__))
+        connection.execute(insert(SchemaVersion.__table__).values(version=version))
+    return True
+
+def adjust_doctor_count(db, specialty_id: int, delta: int):
+    """Add delta to a specialty's doctor_count in the current transaction."""
+    db.execute(
+        update(Specialty)
+        .where(Specialty.id == specialty_id)
+        .values(doctor_count=Specialty.doctor_count + delta)
+    )
+
+def refresh_doctor_counts(db):
+    """Recompute every specialty's doctor_count from the doctors table."""
+    count = (
+        select(func.count(Doctor.id))
+        .where(Doctor.specialty_id == Specialty.id)
+        .scalar_subquery()
+    )
+    db.execute(update(Specialty).values(doctor_count=count))
+
+def reset_id_sequences(db, models):
+    """
+    Move the id sequences of models past their largest id, after rows were
+    inserted with explicit ids, which do not advance them. PostgreSQL only.
+    """
+    if db.bind.dialect.name != "postgresql":
+        return
+    for model in models:
+        name = model.__tablename__
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {name}), 0) + 1, false)"
+        ))
+
+def refresh_normalized_names(db, batch_size: int = 1000):
+    """Recompute doctors.name_normalized for every doctor."""
+    rows = db.execute(select(Doctor.id, Doctor.name)).all()
+    for start in range(0, len(rows), batch_size):
+        db.execute(
+            update(Doctor.__table__)
+            .where(Doctor.__table__.c.id == bindparam("doctor_id"))
+            .values(name_normalized=bindparam("normalized")),
+            [
+                {"doctor_id": doctor_id, "normalized": normalize_arabic(name)}
+                for doctor_id, name in rows[start:start + batch_size]
+            ],
+        )
+
+# Clinic ids per DELETE ... WHERE clinic_id IN (...) statement
+HOURS_BATCH_SIZE = 500
+
+def delete_clinic_hours(db, clinic_ids):
+    """Remove the clinic_hours rows of the given clinics (before deleting the clinics)."""
+    clinic_ids = list(clinic_ids)
+    for start in range(0, len(clinic_ids), HOURS_BATCH_SIZE):
+        db.execute(delete(ClinicHours.__table__).where(
+            ClinicHours.__table__.c.clinic_id.in_(clinic_ids[start:start + HOURS_BATCH_SIZE])
+        ))
+
+def store_clinic_hours(db, clinics, replace: bool = True):
+    """
+    Parse (clinic_id, working_hours) pairs into clinic_hours rows in the current
+    transaction. With replace, the clinics' previous intervals are removed first.
+    """
+    clinics = list(clinics)
+    if replace:
+        delete_clinic_hours(db, [clinic_id for clinic_id, _ in clinics])
+    rows = [
+        {"clinic_id": clinic_id, "opens_at": opens_at, "closes_at": closes_at}
+        for clinic_id, working_hours in clinics
+        for opens_at, closes_at in parse_working_hours(working_hours)
+    ]
+    if rows:
+        db.execute(insert(ClinicHours.__table__), rows)
+
+def refresh_clinic_hours(db, batch_size: int = 1000):
+    """Rebuild clinic_hours from every clinic's working_hours."""
+    db.execute(delete(ClinicHours.__table__))
+    rows = db.execute(select(Clinic.id, Clinic.working_hours)).all()
+    for start in range(0, len(rows), batch_size):
+        store_clinic_hours(db, rows[start:start + batch_size], replace=False)
+
+def clinic_open_at(minute: int):
+    """Filter for clinics open at the given minute of the week (see opening_hours.week_minute)."""
+    return exists().where(
+        ClinicHours.clinic_id == Clinic.id,
+        ClinicHours.opens_at <= minute,
+        ClinicHours.closes_at > minute,
+    )
+
+def doctor_load_options():
+    """Loader options for queries returning DoctorResponse."""
+    if LOAD_STRATEGY == "joined":
+        return [joinedload(Doctor.specialty)]
+    if LOAD_STRATEGY == "selectin":
+        return [selectinload(Doctor.specialty)]
+    return []
+
+def clinic_load_options():
+    """Loader options for queries returning ClinicWithDoctorResponse."""
+    if LOAD_STRATEGY == "joined":
+        return [joinedload(Clinic.doctor).joinedload(Doctor.specialty)]
+    if LOAD_STRATEGY == "selectin":
+        return [selectinload(Clinic.doctor).selectinload(Doctor.specialty)]
+    return []
+
+class QueryCounter:
+    """Counts SQL statements executed on the engine while active."""
+    
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.count += 1
+            self.statements.append(statement)
+
+@contextmanager
+def count_queries():
+    """Context manager yielding a QueryCounter for statements run inside it."""
+    counter = QueryCounter()
+    engines = all_engines()
+    for counted_engine in engines:
+        event.listen(counted_engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        for counted_engine in engines:
+            event.remove(counted_engine, "before_cursor_execute", counter)
+
+class SessionStats:
+    """How many request sessions were handed out and how many were actually opened."""
+    
+    def __init__(self):
+        self.requested = 0
+        self.opened = 0
+        self._lock = threading.Lock()
+    
+    def count(self, opened: bool):
+        with self._lock:
+            self.requested += 1
+            if opened:
+                self.opened += 1
+
+session_stats = SessionStats()
+
+class LazySession:
+    """
+    Stand-in for a Session or AsyncSession that only creates it on first use.
+    
+    Requests answered without touching the database (for example from a
+    cache) never create a session or check out a connection.
+    """
+    
+    def __init__(self, factory, is_async: bool = False, replica: Optional[Replica] = None):
+        self._factory = factory
+        self.is_async = is_async
+        self.replica = replica
+        self.session = None
+    
+    def __getattr__(self, name):
+        if self.session is None:
+            self.session = self._factory()
+        return getattr(self.session, name)
+    
+    async def use_primary(self):
+        """Drop the replica session; the next use opens one on the primary."""
+        if self.session is not None:
+            if self.is_async:
+                await self.session.close()
+            else:
+                self.session.close()
+        self.session = None
+        self.replica = None
+        self._factory = AsyncSessionLocal if self.is_async else SessionLocal
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    db = LazySession(SessionLocal)
+    try:
+        yield db
+    finally:
+        session_stats.count(db.session is not None)
+        if db.session is not None:
+            if db.session.info.get("committed"):
+                read_router.remember_write(request.headers.get("authorization"))
+            db.session.close()
+
+# Dependency to get an async database session (DB_MODE=async)
+async def get_async_db():
+    db = LazySession(AsyncSessionLocal, is_async=True)
     try:
         yield db
     finally:
-        db.close()
+        session_stats.count(db.session is not None)
+        if db.session is not None:
+            await db.session.close()
+
+def _read_session(request: Request, is_async: bool) -> LazySession:
+    replica = read_router.choose(request.headers.get("authorization"))
+    if replica is None:
+        return LazySession(AsyncSessionLocal if is_async else SessionLocal, is_async)
+    return LazySession(replica.AsyncSessionLocal if is_async else replica.SessionLocal, is_async, replica)
+
+async def get_async_read_db(request: Request):
+    db = _read_session(request, is_async=True)
+    try:
+        yield db
+    finally:
+        session_stats.count(db.session is not None)
+        if db.session is not None:
+            await db.session.close()
+
+def get_sync_read_db(request: Request):
+    db = _read_session(request, is_async=False)
+    try:
+        yield db
+    finally:
+        session_stats.count(db.session is not None)
+        if db.session is not None:
+            db.session.close()
+
+# Dependency for read endpoints: an AsyncSession or a Session depending on
+# DB_MODE, on a read replica when READ_REPLICA_URLS is set (see ReadRouter)
+get_read_db = get_async_read_db if DB_MODE == "async" else get_sync_read_db
+
+def reads_replica(session) -> bool:
+    """Whether a session from get_read_db (or the Session given to run()'s fn) reads from a replica."""
+    return session.info.get("replica") is not None
+
+def _replica_unavailable(error: DBAPIError) -> bool:
+    return isinstance(error, (OperationalError, InterfaceError)) or error.connection_invalidated
+
+async def run(db, fn, *args, **kwargs):
+    """
+    Run fn(session, *args, **kwargs) for a session from get_read_db or get_db.
+    
+    Query code is written once against the regular Session API: with an
+    AsyncSession it runs through run_sync, so every query awaits the async
+    driver, otherwise it runs on the threadpool.
+    
+    If fn fails on a read replica that cannot be reached, the replica is
+    marked down and fn runs again on the primary.
+    """
+    try:
+        return await _run(db, fn, *args, **kwargs)
+    except DBAPIError as error:
+        if getattr(db, "replica", None) is None or not _replica_unavailable(error):
+            raise
+        read_router.mark_down(db.replica, error)
+        await db.use_primary()
+        return await _run(db, fn, *args, **kwargs)
+
+async def _run(db, fn, *args, **kwargs):
+    if db.is_async:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(profiling.threaded(fn), db, *args, **kwargs)
+
+def run_in_background(name: str, fn, *args) -> threading.Thread:
+    """Run fn(session, *args) on a daemon thread with its own primary session."""
+    def target():
+        db = SessionLocal()
+        try:
+            fn(db, *args)
+        finally:
+            db.close()
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+def pool_stats() -> dict:
+    """Pool occupancy and checkout wait times for every engine."""
+    stats = {
+        "sessions": {
+            "requested": session_stats.requested,
+            "opened": session_stats.opened,
+        }
+    }
+    pool_engines = [("sync", engine), ("async", async_engine and async_engine.sync_engine)]
+    for replica in read_router.replicas:
+        pool_engines.append((replica.name, replica.engine))
+        pool_engines.append((f"{replica.name}_async", replica.async_engine and replica.async_engine.sync_engine))
+    for name, pool_engine in pool_engines:
+        if pool_engine is None:
+            continue
+        pool = pool_engine.pool
+        engine_stats = {"pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            engine_stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+            })
+        wait_stats = getattr(pool, "wait_stats", None)
+        if wait_stats is not None:
+            engine_stats.update({
+                "checkouts": wait_stats.checkouts,
+                "checkout_wait_avg_ms": round(
+                    1000 * wait_stats.total_seconds / wait_stats.checkouts, 3
+                ) if wait_stats.checkouts else 0.0,
+                "checkout_wait_max_ms": round(1000 * wait_stats.max_seconds, 3),
+            })
+        stats[name] = engine_stats
+    return stats
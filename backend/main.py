@@ -1,11 +1,30 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from datetime import datetime
 from typing import List, Optional
 import database
 import schemas
 import auth
-from utils import calculate_distance
+import spatial
+import pagination
+import cache
+import backup
+import batch
+import text_search
+import autocomplete
+import serialization
+import opening_hours
+import metrics
+import profiling
+import startup
+
+startup.timer.record("imports", time.perf_counter() - IMPORT_STARTED)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -14,32 +33,56 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Enable CORS for frontend access
+# Serve catalogue reads from the response cache (see cache.CACHED_ROUTES)
+@app.middleware("http")
+async def response_cache_middleware(request: Request, call_next):
+    return await cache.response_cache.handle(request, call_next)
+
+# Enable CORS for frontend access. Added after the response cache so that it
+# wraps it: cached responses and 304s get the CORS headers too.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, specify exact origins
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, profiling.PROFILE_ID_HEADER],
 )
 
+# Outermost, so cached responses are timed too
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.install()
+metrics.register_cache("response", cache.response_cache.stats)
+metrics.register_cache("nearby", spatial.nearby_cache.stats)
+metrics.register_cache("fragment", serialization.fragment_cache.stats)
+
+# Profiles requests sent with X-Profile by an admin, or sampled (see profiling.py)
+app.add_middleware(profiling.ProfilingMiddleware)
+profiling.install(database.all_engines())
+
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
-    database.init_db()
-    # Create default admin if not exists
-    db = database.SessionLocal()
-    admin = db.query(database.Admin).filter(database.Admin.username == "admin").first()
-    if not admin:
-        default_admin = database.Admin(
-            username="admin",
-            password_hash=auth.get_password_hash("admin123"),
-            email="admin@mydoctor.com"
-        )
-        db.add(default_admin)
-        db.commit()
-        print("✅ Default admin created: username=admin, password=admin123")
-    db.close()
+    if auth.SECRET_KEY_GENERATED:
+        print("⚠️  SECRET_KEY is not set: using a random key, admin tokens will not survive a restart "
+              "or work across workers. Set SECRET_KEY in production")
+    with startup.timer.phase("init_db"):
+        database.init_db()
+    with startup.timer.phase("text_search"):
+        text_search.setup()
+    # Create default admin if not exists (otherwise see create_admin.py)
+    if startup.BOOTSTRAP_ADMIN:
+        with startup.timer.phase("admin"):
+            created = startup.ensure_admin(
+                startup.DEFAULT_ADMIN_USERNAME, startup.DEFAULT_ADMIN_PASSWORD, startup.DEFAULT_ADMIN_EMAIL
+            ) == "created"
+        if created:
+            print("✅ Default admin created: username=admin, password=admin123")
+    print(f"⏱️  Startup: {startup.timer.report()}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await database.dispose_async_engines()
 
 # Root endpoint
 @app.get("/")
@@ -50,93 +93,188 @@ def read_root():
         "version": "1.0.0"
     }
 
+def _rows_changed(db: Session, doctor_ids=(), clinic_ids=(), specialty_ids=()):
+    """Refresh the autocomplete index and drop serialized rows after a write."""
+    autocomplete.index.reload(db, doctor_ids=doctor_ids, clinic_ids=clinic_ids, specialty_ids=specialty_ids)
+    serialization.fragment_cache.invalidate(doctor_ids=doctor_ids, clinic_ids=clinic_ids)
+
 # ==================== Admin Authentication ====================
 
+def _query_admin(db: Session, username: str):
+    admin = db.query(database.Admin).filter(database.Admin.username == username).first()
+    if admin is None:
+        return None
+    return {
+        "id": admin.id,
+        "username": admin.username,
+        "email": admin.email,
+        "password_hash": admin.password_hash,
+    }
+
+def _store_password_hash(db: Session, admin_id: int, password_hash: str):
+    db.query(database.Admin).filter(database.Admin.id == admin_id).update(
+        {database.Admin.password_hash: password_hash}
+    )
+    db.commit()
+
 @app.post("/api/admin/login")
-def admin_login(credentials: schemas.AdminLogin, db: Session = Depends(database.get_db)):
+async def admin_login(credentials: schemas.AdminLogin, request: Request, db: Session = Depends(database.get_db)):
     """Admin login endpoint."""
-    admin = db.query(database.Admin).filter(
-        database.Admin.username == credentials.username
-    ).first()
+    retry_after = auth.login_rate_limiter.hit(credentials.username, auth.client_ip(request))
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="محاولات تسجيل دخول كثيرة، يرجى المحاولة لاحقاً",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
     
-    if not admin or not auth.verify_password(credentials.password, admin.password_hash):
+    admin = await database.run(db, _query_admin, credentials.username)
+    
+    try:
+        valid = admin is not None and await auth.verify_password_async(
+            credentials.password, admin["password_hash"]
+        )
+        if valid and auth.needs_rehash(admin["password_hash"]):
+            new_hash = await auth.get_password_hash_async(credentials.password)
+            await database.run(db, _store_password_hash, admin["id"], new_hash)
+    except auth.HashPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="الخادم مشغول، يرجى المحاولة لاحقاً",
+            headers={"Retry-After": "1"}
+        )
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="اسم المستخدم أو كلمة المرور غير صحيحة"
         )
     
-    access_token = auth.create_access_token(data={"sub": admin.username})
+    access_token = auth.create_access_token(data={"sub": admin["username"]})
     return {
         "access_token": access_token,
         "token_type": "bearer",
         "admin": {
-            "id": admin.id,
-            "username": admin.username,
-            "email": admin.email
+            "id": admin["id"],
+            "username": admin["username"],
+            "email": admin["email"]
         }
     }
 
 # ==================== Specialties ====================
 
 @app.get("/api/specialties")
-def get_specialties(db: Session = Depends(database.get_db)):
+async def get_specialties(db=Depends(database.get_read_db)):
     """Get all medical specialties with doctor count."""
-    specialties = db.query(database.Specialty).all()
-    
-    # Add doctor count to each specialty
-    result = []
-    for specialty in specialties:
-        doctor_count = db.query(database.Doctor).filter(
-            database.Doctor.specialty_id == specialty.id
-        ).count()
-        
-        result.append({
+    return await database.run(db, _query_specialties)
+
+def _query_specialties(db: Session):
+    if database.USE_DOCTOR_COUNT_COLUMN:
+        specialties = db.query(database.Specialty).order_by(database.Specialty.id).all()
+        rows = [(specialty, specialty.doctor_count) for specialty in specialties]
+    else:
+        # Count doctors for every specialty in a single grouped query
+        rows = db.query(
+            database.Specialty,
+            func.count(database.Doctor.id)
+        ).outerjoin(
+            database.Doctor, database.Doctor.specialty_id == database.Specialty.id
+        ).group_by(
+            database.Specialty.id
+        ).order_by(
+            database.Specialty.id
+        ).all()
+    
+    return [
+        {
             "id": specialty.id,
             "name": specialty.name,
             "icon_url": specialty.icon_url,
             "doctor_count": doctor_count
-        })
-    
-    return result
+        }
+        for specialty, doctor_count in rows
+    ]
 
-@app.post("/api/specialties", response_model=schemas.SpecialtyResponse)
+@app.post("/api/specialties", response_model=schemas.SpecialtyResponse, dependencies=[Depends(auth.require_admin)])
 def create_specialty(specialty: schemas.SpecialtyCreate, db: Session = Depends(database.get_db)):
     """Create a new specialty (admin only)."""
     db_specialty = database.Specialty(**specialty.dict())
     db.add(db_specialty)
     db.commit()
     db.refresh(db_specialty)
+    cache.response_cache.invalidate("specialty")
+    _rows_changed(db, specialty_ids=[db_specialty.id])
     return db_specialty
 
 # ==================== Doctors ====================
 
 @app.get("/api/doctors", response_model=List[schemas.DoctorResponse])
-def get_doctors(
+async def get_doctors(
     specialty_id: Optional[int] = None,
     search: Optional[str] = None,
-    db: Session = Depends(database.get_db)
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db=Depends(database.get_read_db)
 ):
-    """Get all doctors with optional filters."""
-    query = db.query(database.Doctor)
+    """
+    Get doctors with optional filters, one page at a time ordered by id
+    (or by relevance when searching by name).
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    return await database.run(db, _query_doctors, specialty_id, search, limit, cursor)
+
+def _query_doctors(db: Session, specialty_id, search, limit, cursor):
+    size = pagination.page_size(limit)
+    term = text_search.normalize(search)
+    if term:
+        return _search_doctors_page(db, term, specialty_id, size, cursor)
+    
+    query = db.query(database.Doctor.id)
     
     if specialty_id:
         query = query.filter(database.Doctor.specialty_id == specialty_id)
     
-    if search:
-        query = query.filter(database.Doctor.name.contains(search))
+    if cursor:
+        (after_id,) = pagination.decode_cursor(cursor, (int,))
+        query = query.filter(database.Doctor.id > after_id)
     
-    doctors = query.all()
-    return doctors
+    ids, has_more = pagination.split_page(
+        [doctor_id for (doctor_id,) in query.order_by(database.Doctor.id).limit(size + 1)], size
+    )
+    page = serialization.json_response(serialization.doctor_list(db, ids))
+    if ids:
+        pagination.set_next_cursor(page, has_more, ids[-1])
+    return page
+
+def _search_doctors_page(db: Session, term, specialty_id, size, cursor):
+    """
+    One page of doctors matching a name search, best match first.
+    The cursor is the (rank, id) key of the last doctor on the page.
+    """
+    after = pagination.decode_cursor(cursor, (float, int)) if cursor else None
+    matches, has_more = pagination.split_page(
+        text_search.backend.search(db, term, specialty_id, size + 1, after), size
+    )
+    
+    page = serialization.json_response(serialization.doctor_list(db, [doctor_id for _, doctor_id in matches]))
+    if matches:
+        pagination.set_next_cursor(page, has_more, *matches[-1])
+    return page
 
 @app.get("/api/doctors/{doctor_id}", response_model=schemas.DoctorResponse)
-def get_doctor(doctor_id: int, db: Session = Depends(database.get_db)):
+async def get_doctor(doctor_id: int, db=Depends(database.get_read_db)):
     """Get a specific doctor by ID."""
-    doctor = db.query(database.Doctor).filter(database.Doctor.id == doctor_id).first()
+    return await database.run(db, _query_doctor, doctor_id)
+
+def _query_doctor(db: Session, doctor_id):
+    doctor = db.query(database.Doctor).options(
+        *database.doctor_load_options()
+    ).filter(database.Doctor.id == doctor_id).first()
     if not doctor:
         raise HTTPException(status_code=404, detail="الطبيب غير موجود")
     return doctor
 
-@app.post("/api/doctors", response_model=schemas.DoctorResponse)
+@app.post("/api/doctors", response_model=schemas.DoctorResponse, dependencies=[Depends(auth.require_admin)])
 def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(database.get_db)):
     """Create a new doctor (admin only)."""
     # Check if specialty exists
@@ -148,11 +286,54 @@ def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(database.g
     
     db_doctor = database.Doctor(**doctor.dict())
     db.add(db_doctor)
+    database.adjust_doctor_count(db, doctor.specialty_id, 1)
     db.commit()
     db.refresh(db_doctor)
+    cache.response_cache.invalidate("doctor")
+    text_search.invalidate()
+    _rows_changed(db, doctor_ids=[db_doctor.id])
     return db_doctor
 
-@app.put("/api/doctors/{doctor_id}", response_model=schemas.DoctorResponse)
+# Batch routes are registered before /api/doctors/{doctor_id} so "batch" is not read as an id
+
+@app.post("/api/doctors/batch", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def create_doctors_batch(doctors: List[schemas.DoctorCreate], db: Session = Depends(database.get_db)):
+    """Create many doctors in one transaction (admin only). Returns a result per item."""
+    batch.check_size(doctors)
+    result = batch.create_doctors(db, doctors)
+    if result.succeeded:
+        cache.response_cache.invalidate("doctor")
+        text_search.invalidate()
+        _rows_changed(db, doctor_ids=result.succeeded_ids)
+    return result.as_dict()
+
+@app.put("/api/doctors/batch", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def update_doctors_batch(doctors: List[schemas.DoctorBatchUpdate], db: Session = Depends(database.get_db)):
+    """Update many doctors in one transaction (admin only). Returns a result per item."""
+    batch.check_size(doctors)
+    result = batch.update_doctors(db, doctors)
+    if result.succeeded:
+        cache.response_cache.invalidate("doctor")
+        text_search.invalidate()
+        _rows_changed(db, doctor_ids=result.succeeded_ids)
+        spatial.nearby_cache.invalidate()
+    return result.as_dict()
+
+@app.post("/api/doctors/batch-delete", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def delete_doctors_batch(request: schemas.BatchDelete, db: Session = Depends(database.get_db)):
+    """Delete many doctors and their clinics in one transaction (admin only)."""
+    batch.check_size(request.ids)
+    result = batch.delete_doctors(db, request.ids)
+    for clinic_id in result.removed_clinics:
+        spatial.clinic_index.remove(clinic_id)
+    if result.succeeded:
+        cache.response_cache.invalidate("doctor", "clinic")
+        text_search.invalidate()
+        _rows_changed(db, doctor_ids=result.succeeded_ids, clinic_ids=result.removed_clinics)
+        spatial.nearby_cache.invalidate()
+    return result.as_dict()
+
+@app.put("/api/doctors/{doctor_id}", response_model=schemas.DoctorResponse, dependencies=[Depends(auth.require_admin)])
 def update_doctor(
     doctor_id: int,
     doctor: schemas.DoctorUpdate,
@@ -163,42 +344,85 @@ def update_doctor(
     if not db_doctor:
         raise HTTPException(status_code=404, detail="الطبيب غير موجود")
     
+    updates = doctor.dict(exclude_unset=True)
+    new_specialty_id = updates.get("specialty_id")
+    if new_specialty_id is not None and new_specialty_id != db_doctor.specialty_id:
+        database.adjust_doctor_count(db, db_doctor.specialty_id, -1)
+        database.adjust_doctor_count(db, new_specialty_id, 1)
+    
     # Update only provided fields
-    for field, value in doctor.dict(exclude_unset=True).items():
+    for field, value in updates.items():
         setattr(db_doctor, field, value)
     
     db.commit()
     db.refresh(db_doctor)
+    cache.response_cache.invalidate("doctor")
+    text_search.invalidate()
+    _rows_changed(db, doctor_ids=[doctor_id])
+    spatial.nearby_cache.invalidate()
     return db_doctor
 
-@app.delete("/api/doctors/{doctor_id}")
+@app.delete("/api/doctors/{doctor_id}", dependencies=[Depends(auth.require_admin)])
 def delete_doctor(doctor_id: int, db: Session = Depends(database.get_db)):
     """Delete a doctor (admin only)."""
     db_doctor = db.query(database.Doctor).filter(database.Doctor.id == doctor_id).first()
     if not db_doctor:
         raise HTTPException(status_code=404, detail="الطبيب غير موجود")
     
+    # Clinics are deleted with the doctor, so drop them from the spatial index too
+    clinic_ids = [clinic.id for clinic in db_doctor.clinics]
+    
+    database.delete_clinic_hours(db, clinic_ids)
     db.delete(db_doctor)
+    database.adjust_doctor_count(db, db_doctor.specialty_id, -1)
     db.commit()
+    for clinic_id in clinic_ids:
+        spatial.clinic_index.remove(clinic_id)
+    cache.response_cache.invalidate("doctor", "clinic")
+    text_search.invalidate()
+    _rows_changed(db, doctor_ids=[doctor_id], clinic_ids=clinic_ids)
+    spatial.nearby_cache.invalidate()
     return {"message": "تم حذف الطبيب بنجاح"}
 
 # ==================== Clinics ====================
 
 @app.get("/api/clinics", response_model=List[schemas.ClinicWithDoctorResponse])
-def get_clinics(
+async def get_clinics(
     doctor_id: Optional[int] = None,
-    db: Session = Depends(database.get_db)
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db=Depends(database.get_read_db)
 ):
-    """Get all clinics with optional filters."""
-    query = db.query(database.Clinic)
+    """
+    Get clinics with optional filters, one page at a time ordered by id.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    return await database.run(db, _query_clinics, doctor_id, limit, cursor)
+
+def _query_clinics(db: Session, doctor_id, limit, cursor):
+    size = pagination.page_size(limit)
+    query = db.query(database.Clinic.id)
     
     if doctor_id:
         query = query.filter(database.Clinic.doctor_id == doctor_id)
     
-    clinics = query.all()
-    return clinics
+    if cursor:
+        (after_id,) = pagination.decode_cursor(cursor, (int,))
+        query = query.filter(database.Clinic.id > after_id)
+    
+    return _clinic_id_page(query, db, size)
+
+def _clinic_id_page(id_query, db: Session, size):
+    """One page of clinics from a query on Clinic.id, ordered by id."""
+    ids, has_more = pagination.split_page(
+        [clinic_id for (clinic_id,) in id_query.order_by(database.Clinic.id).limit(size + 1)], size
+    )
+    page = serialization.json_response(serialization.clinic_list(db, [(clinic_id, None) for clinic_id in ids]))
+    if ids:
+        pagination.set_next_cursor(page, has_more, ids[-1])
+    return page
 
-@app.post("/api/clinics", response_model=schemas.ClinicResponse)
+@app.post("/api/clinics", response_model=schemas.ClinicResponse, dependencies=[Depends(auth.require_admin)])
 def create_clinic(clinic: schemas.ClinicCreate, db: Session = Depends(database.get_db)):
     """Create a new clinic (admin only)."""
     # Check if doctor exists
@@ -208,11 +432,54 @@ def create_clinic(clinic: schemas.ClinicCreate, db: Session = Depends(database.g
     
     db_clinic = database.Clinic(**clinic.dict())
     db.add(db_clinic)
+    db.flush()
+    database.store_clinic_hours(db, [(db_clinic.id, db_clinic.working_hours)])
     db.commit()
     db.refresh(db_clinic)
+    spatial.clinic_index.upsert(db_clinic.id, db_clinic.latitude, db_clinic.longitude)
+    cache.response_cache.invalidate("clinic")
+    _rows_changed(db, clinic_ids=[db_clinic.id])
+    spatial.nearby_cache.invalidate()
     return db_clinic
 
-@app.put("/api/clinics/{clinic_id}", response_model=schemas.ClinicResponse)
+# Batch routes are registered before /api/clinics/{clinic_id} so "batch" is not read as an id
+
+@app.post("/api/clinics/batch", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def create_clinics_batch(clinics: List[schemas.ClinicCreate], db: Session = Depends(database.get_db)):
+    """Create many clinics in one transaction (admin only). Returns a result per item."""
+    batch.check_size(clinics)
+    result = batch.create_clinics(db, clinics)
+    _apply_clinic_batch(db, result)
+    return result.as_dict()
+
+@app.put("/api/clinics/batch", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def update_clinics_batch(clinics: List[schemas.ClinicBatchUpdate], db: Session = Depends(database.get_db)):
+    """Update many clinics in one transaction (admin only). Returns a result per item."""
+    batch.check_size(clinics)
+    result = batch.update_clinics(db, clinics)
+    _apply_clinic_batch(db, result)
+    return result.as_dict()
+
+@app.post("/api/clinics/batch-delete", response_model=schemas.BatchResponse, dependencies=[Depends(auth.require_admin)])
+def delete_clinics_batch(request: schemas.BatchDelete, db: Session = Depends(database.get_db)):
+    """Delete many clinics in one transaction (admin only)."""
+    batch.check_size(request.ids)
+    result = batch.delete_clinics(db, request.ids)
+    _apply_clinic_batch(db, result)
+    return result.as_dict()
+
+def _apply_clinic_batch(db: Session, result: batch.BatchResult):
+    """Bring the spatial and autocomplete indexes and caches up to date after a clinic batch."""
+    for clinic_id, latitude, longitude in result.upserted_clinics:
+        spatial.clinic_index.upsert(clinic_id, latitude, longitude)
+    for clinic_id in result.removed_clinics:
+        spatial.clinic_index.remove(clinic_id)
+    if result.succeeded:
+        cache.response_cache.invalidate("clinic")
+        _rows_changed(db, clinic_ids=result.succeeded_ids)
+        spatial.nearby_cache.invalidate()
+
+@app.put("/api/clinics/{clinic_id}", response_model=schemas.ClinicResponse, dependencies=[Depends(auth.require_admin)])
 def update_clinic(
     clinic_id: int,
     clinic: schemas.ClinicUpdate,
@@ -223,93 +490,167 @@ def update_clinic(
     if not db_clinic:
         raise HTTPException(status_code=404, detail="العيادة غير موجودة")
     
-    for field, value in clinic.dict(exclude_unset=True).items():
+    updates = clinic.dict(exclude_unset=True)
+    for field, value in updates.items():
         setattr(db_clinic, field, value)
+    if "working_hours" in updates:
+        database.store_clinic_hours(db, [(clinic_id, db_clinic.working_hours)])
     
     db.commit()
     db.refresh(db_clinic)
+    spatial.clinic_index.upsert(db_clinic.id, db_clinic.latitude, db_clinic.longitude)
+    cache.response_cache.invalidate("clinic")
+    _rows_changed(db, clinic_ids=[db_clinic.id])
+    spatial.nearby_cache.invalidate()
     return db_clinic
 
-@app.delete("/api/clinics/{clinic_id}")
+@app.delete("/api/clinics/{clinic_id}", dependencies=[Depends(auth.require_admin)])
 def delete_clinic(clinic_id: int, db: Session = Depends(database.get_db)):
     """Delete a clinic (admin only)."""
     db_clinic = db.query(database.Clinic).filter(database.Clinic.id == clinic_id).first()
     if not db_clinic:
         raise HTTPException(status_code=404, detail="العيادة غير موجودة")
     
+    database.delete_clinic_hours(db, [clinic_id])
     db.delete(db_clinic)
     db.commit()
+    spatial.clinic_index.remove(clinic_id)
+    cache.response_cache.invalidate("clinic")
+    _rows_changed(db, clinic_ids=[clinic_id])
+    spatial.nearby_cache.invalidate()
     return {"message": "تم حذف العيادة بنجاح"}
 
+# ==================== Autocomplete ====================
+
+@app.get("/api/autocomplete", response_model=List[schemas.Suggestion])
+async def autocomplete_names(
+    q: str,
+    limit: int = Query(autocomplete.DEFAULT_SUGGESTIONS, ge=1, le=autocomplete.MAX_SUGGESTIONS),
+    type: Optional[str] = Query(None, pattern="^(doctor|clinic)$"),
+    db=Depends(database.get_read_db)
+):
+    """
+    Typeahead suggestions: doctors and clinics whose name, or a word of it,
+    starts with q. Served from memory; the database is only read when the
+    index is built or refreshed.
+    """
+    if autocomplete.index.needs_build:
+        await database.run(db, autocomplete.index.ensure_built)
+    else:
+        autocomplete.index.refresh_if_stale()
+    prefix = text_search.normalize(q)
+    if not prefix:
+        return []
+    return autocomplete.index.suggest(prefix, limit, type)
+
 # ==================== Search & Location ====================
 
+def _nearby_page(db, query, latitude, longitude, max_distance, limit, cursor, cache_scope):
+    """One page of clinics within max_distance, keyed by (distance, id)."""
+    size = pagination.page_size(limit)
+    after = pagination.decode_cursor(cursor, (float, int)) if cursor else None
+    
+    nearby, has_more = pagination.split_page(
+        spatial.find_nearby_ids(
+            db, query, latitude, longitude, max_distance,
+            limit=size + 1, after=after, cache_scope=cache_scope
+        ),
+        size
+    )
+    
+    page = serialization.json_response(serialization.clinic_list(
+        db, [(clinic_id, round(distance, 2)) for distance, clinic_id in nearby]
+    ))
+    if nearby:
+        last_distance, last_clinic_id = nearby[-1]
+        pagination.set_next_cursor(page, has_more, last_distance, last_clinic_id)
+    return page
+
 @app.get("/api/clinics/nearby", response_model=List[schemas.ClinicWithDoctorResponse])
-def get_nearby_clinics(
+async def get_nearby_clinics(
     latitude: float,
     longitude: float,
     specialty_id: Optional[int] = None,
     max_distance: float = 50.0,
-    db: Session = Depends(database.get_db)
+    open_now: bool = False,
+    open_at: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    db=Depends(database.get_read_db)
 ):
     """
     Find nearby clinics based on user location.
-    Returns clinics sorted by distance.
+    Returns clinics sorted by distance, one page at a time.
+    open_now or open_at (clinic local time unless it carries an offset) keep
+    only clinics whose working hours include that moment.
+    The cursor for the next page is returned in the X-Next-Cursor header.
     """
-    query = db.query(database.Clinic)
+    minute = opening_hours.requested_minute(open_at, open_now)
+    return await database.run(
+        db, _query_nearby_clinics,
+        latitude, longitude, specialty_id, max_distance, minute, limit, cursor
+    )
+
+def _query_nearby_clinics(db: Session, latitude, longitude, specialty_id, max_distance, minute, limit, cursor):
+    query = db.query(database.Clinic).options(*database.clinic_load_options())
     
     if specialty_id:
         query = query.join(database.Doctor).filter(database.Doctor.specialty_id == specialty_id)
     
-    clinics = query.all()
-    
-    # Calculate distance for each clinic
-    clinics_with_distance = []
-    for clinic in clinics:
-        distance = calculate_distance(latitude, longitude, clinic.latitude, clinic.longitude)
-        if distance <= max_distance:
-            clinic_dict = schemas.ClinicWithDoctorResponse.from_orm(clinic).dict()
-            clinic_dict['distance'] = round(distance, 2)
-            clinics_with_distance.append(clinic_dict)
-    
-    # Sort by distance
-    clinics_with_distance.sort(key=lambda x: x['distance'])
+    if minute is not None:
+        query = query.filter(database.clinic_open_at(minute))
     
-    return clinics_with_distance
+    return _nearby_page(
+        db, query, latitude, longitude, max_distance, limit, cursor,
+        cache_scope=("nearby", specialty_id, minute)
+    )
 
 @app.post("/api/search", response_model=List[schemas.ClinicWithDoctorResponse])
-def search_clinics(search_req: schemas.SearchRequest, db: Session = Depends(database.get_db)):
+async def search_clinics(
+    search_req: schemas.SearchRequest,
+    db=Depends(database.get_read_db)
+):
     """
-    Advanced search for clinics by specialty, doctor name, or location.
+    Advanced search for clinics by specialty, doctor name, location, or
+    whether they are open (open_now / open_at).
+    Results are paginated with search_req.limit and search_req.cursor; the
+    cursor for the next page is returned in the X-Next-Cursor header.
     """
-    query = db.query(database.Clinic).join(database.Doctor)
+    minute = opening_hours.requested_minute(search_req.open_at, search_req.open_now)
+    return await database.run(db, _query_search_clinics, search_req, minute)
+
+def _query_search_clinics(db: Session, search_req, minute):
+    query = db.query(database.Clinic).join(database.Doctor).options(*database.clinic_load_options())
     
     if search_req.specialty_id:
         query = query.filter(database.Doctor.specialty_id == search_req.specialty_id)
     
-    if search_req.doctor_name:
-        query = query.filter(database.Doctor.name.contains(search_req.doctor_name))
+    term = text_search.normalize(search_req.doctor_name)
+    if term:
+        query = query.filter(text_search.backend.condition(db, term))
     
-    clinics = query.all()
+    if minute is not None:
+        query = query.filter(database.clinic_open_at(minute))
     
-    # If location provided, calculate distances
+    # If location provided, return clinics within max_distance sorted by distance
     if search_req.latitude and search_req.longitude:
-        clinics_with_distance = []
-        for clinic in clinics:
-            distance = calculate_distance(
-                search_req.latitude,
-                search_req.longitude,
-                clinic.latitude,
-                clinic.longitude
-            )
-            if distance <= search_req.max_distance:
-                clinic_dict = schemas.ClinicWithDoctorResponse.from_orm(clinic).dict()
-                clinic_dict['distance'] = round(distance, 2)
-                clinics_with_distance.append(clinic_dict)
-        
-        clinics_with_distance.sort(key=lambda x: x['distance'])
-        return clinics_with_distance
+        return _nearby_page(
+            db,
+            query,
+            search_req.latitude,
+            search_req.longitude,
+            search_req.max_distance,
+            search_req.limit,
+            search_req.cursor,
+            cache_scope=("search", search_req.specialty_id, search_req.doctor_name, minute)
+        )
+    
+    size = pagination.page_size(search_req.limit)
+    if search_req.cursor:
+        (after_id,) = pagination.decode_cursor(search_req.cursor, (int,))
+        query = query.filter(database.Clinic.id > after_id)
     
-    return clinics
+    return _clinic_id_page(query.with_entities(database.Clinic.id), db, size)
 
 # ==================== Health Check ====================
 
@@ -318,37 +659,90 @@ def health_check():
     """Health check endpoint for monitoring."""
     return {"status": "healthy", "service": "My Doctor API"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """Request, SQL, serialization, cache and pool metrics in the Prometheus text format."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="المقاييس غير مفعلة")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/cache-stats", dependencies=[Depends(auth.require_admin)])
+def cache_stats():
+    """Hit/miss counters for the response, nearby-clinics and serialized-row caches."""
+    return {
+        "response_cache": cache.response_cache.stats(),
+        "nearby_cache": spatial.nearby_cache.stats(),
+        "fragment_cache": serialization.fragment_cache.stats()
+    }
+
+@app.get("/api/admin/pool-stats", dependencies=[Depends(auth.require_admin)])
+def get_pool_stats():
+    """Connection pool occupancy, checkout wait times, session counts and read replica health."""
+    return {**database.pool_stats(), "read_routing": database.read_router.stats()}
+
+@app.get("/api/admin/profiles", dependencies=[Depends(auth.require_admin)])
+def list_profiles():
+    """Recent request profiles, newest first, without their SQL and function breakdowns."""
+    return profiling.profile_buffer.summaries()
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(auth.require_admin)])
+def get_profile(profile_id: int):
+    """A request profile: SQL statements with timings and EXPLAIN plans, and the slowest functions."""
+    entry = profiling.profile_buffer.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="الملف التعريفي غير موجود")
+    return entry
+
+@app.delete("/api/admin/profiles", dependencies=[Depends(auth.require_admin)])
+def clear_profiles():
+    profiling.profile_buffer.clear()
+    return {"message": "تم حذف الملفات التعريفية"}
+
 # ==================== Database Management (Dev Only) ====================
 
-@app.post("/api/admin/reset-database")
+@app.post("/api/admin/reset-database", dependencies=[Depends(auth.require_admin)])
 def reset_database(db: Session = Depends(database.get_db)):
     """
     Reset database - DELETE ALL DATA and recreate admin.
     ⚠️ USE WITH CAUTION - THIS WILL DELETE EVERYTHING!
     """
+    # Hash first: if the pool is busy nothing has been deleted yet
     try:
-        # Delete all data
+        password_hash = auth.hash_password_in_pool(startup.DEFAULT_ADMIN_PASSWORD)
+    except auth.HashPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="الخادم مشغول، يرجى المحاولة لاحقاً",
+            headers={"Retry-After": "1"}
+        )
+    
+    try:
+        # Delete all data and recreate the default admin in one transaction,
+        # so a failure never leaves the database without an admin
+        db.query(database.ClinicHours).delete()
         db.query(database.Clinic).delete()
         db.query(database.Doctor).delete()
         db.query(database.Specialty).delete()
         db.query(database.Admin).delete()
+        db.add(database.Admin(
+            username=startup.DEFAULT_ADMIN_USERNAME,
+            password_hash=password_hash,
+            email=startup.DEFAULT_ADMIN_EMAIL
+        ))
         db.commit()
-        
-        # Recreate default admin
-        default_admin = database.Admin(
-            username="admin",
-            password_hash=auth.get_password_hash("admin123"),
-            email="admin@mydoctor.com"
-        )
-        db.add(default_admin)
-        db.commit()
+        spatial.clinic_index.clear()
+        autocomplete.index.clear()
+        serialization.fragment_cache.clear()
+        cache.response_cache.invalidate()
+        text_search.invalidate()
+        spatial.nearby_cache.invalidate()
         
         return {
             "status": "success",
             "message": "تم مسح جميع البيانات وإعادة إنشاء المدير الافتراضي",
             "admin": {
-                "username": "admin",
-                "password": "admin123"
+                "username": startup.DEFAULT_ADMIN_USERNAME,
+                "password": startup.DEFAULT_ADMIN_PASSWORD
             }
         }
     except Exception as e:
@@ -358,82 +752,43 @@ def reset_database(db: Session = Depends(database.get_db)):
             detail=f"فشل مسح البيانات: {str(e)}"
         )
 
-@app.get("/api/admin/export-database")
-def export_database(db: Session = Depends(database.get_db)):
+@app.get("/api/admin/export-database", dependencies=[Depends(auth.require_admin)])
+def export_database(
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    gzip: bool = False
+):
     """
-    Export all database data as JSON.
+    Export all database data as JSON or NDJSON.
     Useful for backups and data migration.
+    The export is streamed, optionally gzip-compressed, so memory stays flat.
     """
-    try:
-        # Get all data
-        admins = db.query(database.Admin).all()
-        specialties = db.query(database.Specialty).all()
-        doctors = db.query(database.Doctor).all()
-        clinics = db.query(database.Clinic).all()
-        
-        # Convert to dict
-        export_data = {
-            "export_date": datetime.utcnow().isoformat(),
-            "version": "1.0",
-            "data": {
-                "admins": [
-                    {
-                        "id": a.id,
-                        "username": a.username,
-                        "email": a.email,
-                        "created_at": a.created_at.isoformat() if a.created_at else None
-                    }
-                    for a in admins
-                ],
-                "specialties": [
-                    {
-                        "id": s.id,
-                        "name": s.name,
-                        "icon_url": s.icon_url
-                    }
-                    for s in specialties
-                ],
-                "doctors": [
-                    {
-                        "id": d.id,
-                        "name": d.name,
-                        "specialty_id": d.specialty_id,
-                        "phone": d.phone,
-                        "email": d.email,
-                        "bio": d.bio,
-                        "rating": d.rating,
-                        "created_at": d.created_at.isoformat() if d.created_at else None
-                    }
-                    for d in doctors
-                ],
-                "clinics": [
-                    {
-                        "id": c.id,
-                        "doctor_id": c.doctor_id,
-                        "name": c.name,
-                        "address": c.address,
-                        "latitude": c.latitude,
-                        "longitude": c.longitude,
-                        "phone": c.phone,
-                        "working_hours": c.working_hours,
-                        "created_at": c.created_at.isoformat() if c.created_at else None
-                    }
-                    for c in clinics
-                ]
-            },
-            "stats": {
-                "total_admins": len(admins),
-                "total_specialties": len(specialties),
-                "total_doctors": len(doctors),
-                "total_clinics": len(clinics)
-            }
-        }
-        
-        return export_data
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"فشل تصدير البيانات: {str(e)}"
-        )
+    media_type = "application/gzip" if gzip else (
+        "application/x-ndjson" if format == "ndjson" else "application/json"
+    )
+    filename = backup.export_filename(format, gzip)
+    return StreamingResponse(
+        backup.stream_export(format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
+@app.post("/api/admin/import-database", dependencies=[Depends(auth.require_admin)])
+def import_database(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """
+    Import a file produced by export-database (JSON or NDJSON, optionally gzip).
+    Rows are validated and inserted in batches; invalid rows are reported and skipped.
+    Admins in the file are skipped because exports contain no password hashes.
+    """
+    report = backup.import_stream(file.file, format or backup.format_for(file.filename))
+    database.read_router.remember_write(request.headers.get("authorization"))
+    spatial.clinic_index.clear()
+    autocomplete.index.clear()
+    serialization.fragment_cache.clear()
+    cache.response_cache.invalidate()
+    text_search.invalidate()
+    spatial.nearby_cache.invalidate()
+    return report
@@ -0,0 +1,308 @@
+"""
+Prometheus metrics, served in the text exposition format at /metrics.
+
+Recorded without a client library, with one lock per metric:
+- request count and latency per route template, method and status
+- SQL statements and time per request, from cursor events on the engines
+- ORM rows hydrated per request, from the mapper load event
+- time spent turning rows into JSON in serialization.py
+- cache hit/miss counters and pool occupancy, read when /metrics is scraped
+- seconds spent in each startup phase (startup.timer)
+
+Per-request figures are accumulated in a RequestStats object held in a
+context variable; sync endpoints and the async engine see the same object
+because the threadpool and greenlets run with a copy of the request's
+context.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+import database
+import startup
+
+METRICS_ENABLED = database.env_flag("METRICS_ENABLED", True)
+
+PREFIX = "mydoctor_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SERIALIZATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 200, 500, 1000, 5000)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+requests_total = Counter("http_requests_total", "HTTP requests by route, method and status.", ("method", "route", "status"))
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+sql_statements_total = Counter("sql_statements_total", "SQL statements executed.")
+sql_seconds_total = Counter("sql_seconds_total", "Time spent executing SQL statements.")
+request_sql_statements = Histogram(
+    "http_request_sql_statements", "SQL statements per request.", ("method", "route"), COUNT_BUCKETS
+)
+request_sql_seconds = Histogram(
+    "http_request_sql_seconds", "SQL time per request.", ("method", "route"), SQL_TIME_BUCKETS
+)
+rows_hydrated_total = Counter("orm_rows_hydrated_total", "ORM objects loaded from query results.", ("model",))
+request_rows_hydrated = Histogram(
+    "http_request_rows_hydrated", "ORM objects loaded per request.", ("method", "route"), ROW_BUCKETS
+)
+serialization_seconds = Histogram(
+    "serialization_seconds", "Time spent serializing response rows (stage rows: Pydantic and JSON for uncached rows, list: joining fragments).", ("kind", "stage"), SERIALIZATION_BUCKETS
+)
+
+REGISTRY = [
+    requests_total, request_seconds, sql_statements_total, sql_seconds_total,
+    request_sql_statements, request_sql_seconds, rows_hydrated_total,
+    request_rows_hydrated, serialization_seconds,
+]
+
+# name -> callable returning a stats dict with "hits" and "misses"
+_caches: Dict[str, Callable[[], dict]] = {}
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Report a cache's hits and misses (its stats() dict) on every scrape."""
+    _caches[name] = stats
+
+class RequestStats:
+    __slots__ = ("sql_statements", "sql_seconds", "rows")
+
+    def __init__(self):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    sql_statements_total.inc()
+    sql_seconds_total.inc(amount=elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += elapsed
+
+def _on_load(target, context):
+    rows_hydrated_total.inc(type(target).__name__)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.rows += 1
+
+_installed = False
+
+def install():
+    """Attach the SQL and ORM event hooks (once)."""
+    global _installed
+    if _installed or not METRICS_ENABLED:
+        return
+    for instrumented_engine in database.all_engines():
+        event.listen(instrumented_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(instrumented_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(database.Base, "load", _on_load, propagate=True)
+    _installed = True
+
+def observe_serialization(kind: str, stage: str, seconds: float):
+    if METRICS_ENABLED:
+        serialization_seconds.observe(seconds, kind, stage)
+
+def _route_path(scope) -> str:
+    """Route template for the request, also for responses served before routing (cache hits)."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    app = scope.get("app")
+    for candidate in getattr(app, "routes", ()):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return candidate.path
+    return "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and collecting its RequestStats."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            route = _route_path(scope)
+            method = scope["method"]
+            requests_total.inc(method, route, str(status))
+            request_seconds.observe(elapsed, method, route)
+            request_sql_statements.observe(stats.sql_statements, method, route)
+            request_sql_seconds.observe(stats.sql_seconds, method, route)
+            request_rows_hydrated.observe(stats.rows, method, route)
+
+def _gauge(name: str, help: str, samples: List[Tuple[str, float]], kind: str = "gauge") -> List[str]:
+    lines = [f"# HELP {PREFIX}{name} {help}", f"# TYPE {PREFIX}{name} {kind}"]
+    lines.extend(f"{PREFIX}{name}{labels} {_number(value)}" for labels, value in samples)
+    return lines
+
+def _cache_lines() -> List[str]:
+    hits, misses, ratios = [], [], []
+    for name, stats in sorted(_caches.items()):
+        values = stats()
+        labels = _labels(("cache",), (name,))
+        hits.append((labels, values.get("hits", 0)))
+        misses.append((labels, values.get("misses", 0)))
+        ratios.append((labels, values.get("hit_rate", 0.0)))
+    return (
+        _gauge("cache_hits_total", "Cache lookups answered from the cache.", hits, "counter")
+        + _gauge("cache_misses_total", "Cache lookups that missed.", misses, "counter")
+        + _gauge("cache_hit_ratio", "Hits over lookups since start.", ratios)
+    )
+
+def _pool_lines() -> List[str]:
+    stats = database.pool_stats()
+    sessions = stats.pop("sessions")
+    lines = _gauge("db_sessions_requested_total", "Request sessions handed out.", [("", sessions["requested"])], "counter")
+    lines += _gauge("db_sessions_opened_total", "Request sessions that were actually opened.", [("", sessions["opened"])], "counter")
+    gauges = (
+        ("size", "db_pool_size", "Connections kept open by the pool.", "gauge", 1),
+        ("checked_out", "db_pool_checked_out", "Connections currently in use.", "gauge", 1),
+        ("overflow", "db_pool_overflow", "Connections open beyond the pool size.", "gauge", 1),
+        ("idle", "db_pool_idle", "Idle connections in the pool.", "gauge", 1),
+        ("checkouts", "db_pool_checkouts_total", "Connection checkouts.", "counter", 1),
+        ("checkout_wait_avg_ms", "db_pool_checkout_wait_avg_seconds", "Average wait for a connection.", "gauge", 0.001),
+        ("checkout_wait_max_ms", "db_pool_checkout_wait_max_seconds", "Longest wait for a connection.", "gauge", 0.001),
+    )
+    for key, name, help, kind, scale in gauges:
+        samples = [
+            (_labels(("engine",), (engine_name,)), engine_stats[key] * scale)
+            for engine_name, engine_stats in sorted(stats.items())
+            if key in engine_stats
+        ]
+        if samples:
+            lines += _gauge(name, help, samples, kind)
+    return lines
+
+def _replica_lines() -> List[str]:
+    routing = database.read_router.stats()
+    if not routing["replicas"]:
+        return []
+    sessions = [(_labels(("target",), ("primary",)), routing["primary_sessions"])]
+    up, failures = [], []
+    for replica in routing["replicas"]:
+        labels = _labels(("target",), (replica["name"],))
+        sessions.append((labels, replica["sessions"]))
+        up.append((labels, int(replica["healthy"])))
+        failures.append((labels, replica["failures"]))
+    return (
+        _gauge("db_read_sessions_total", "Read sessions routed to the primary or a replica.", sessions, "counter")
+        + _gauge("db_replica_up", "1 while a read replica is in rotation.", up)
+        + _gauge("db_replica_failures_total", "Times a read replica was taken out of rotation.", failures, "counter")
+    )
+
+def _startup_lines() -> List[str]:
+    samples = [(_labels(("phase",), (name,)), seconds) for name, seconds in startup.timer.phases.items()]
+    if not samples:
+        return []
+    return _gauge("startup_seconds", "Time spent in each startup phase.", samples)
+
+def render() -> str:
+    """All metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(_cache_lines())
+    lines.extend(_pool_lines())
+    lines.extend(_replica_lines())
+    lines.extend(_startup_lines())
+    return "\n".join(lines) + "\n"
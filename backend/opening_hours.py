@@ -0,0 +1,202 @@
+"""
+Working hours parsed into weekly intervals.
+
+Clinic.working_hours is free text such as "8:00 ص - 4:00 م" or
+"السبت - الخميس 9:00 AM - 5:00 PM، الجمعة مغلق". parse_working_hours turns
+it into (opens_at, closes_at) pairs counted in minutes since Monday 00:00
+in the clinics' local time (CLINIC_TIMEZONE), which database.ClinicHours
+stores one row per interval so "open at" becomes an indexed range check.
+
+Recognized:
+- times: 8, 8:30, ٨:٣٠, with ص/م, صباحاً/مساءً, AM/PM or on a 24-hour clock
+- ranges: "-", "–", "إلى", "حتى", "to"
+- days: Arabic or English names (السبت, Sat, Saturday), alone or as a
+  range ("السبت - الخميس", "Sat-Thu"); times without days apply to every day
+- closed days ("الجمعة مغلق", "Fri closed") and all-day markers ("24 ساعة", "24/7")
+
+Times that cannot be parsed give no intervals, so such clinics are never
+reported as open.
+"""
+import os
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import List, Optional, Set, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python 3.8: only UTC offsets are supported
+    ZoneInfo = None
+
+# Time zone the clinics' working hours are written in: an IANA name or a UTC offset such as +02:00
+CLINIC_TIMEZONE = os.getenv("CLINIC_TIMEZONE", "Asia/Gaza")
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+ALL_DAYS = frozenset(range(7))
+
+# Day numbers follow datetime.weekday(): Monday is 0
+_DAY_NAMES = [
+    (0, "الاثنين|الإثنين|اثنين|الأثنين|mon(?:day)?"),
+    (1, "الثلاثاء|ثلاثاء|tue(?:s|sday)?"),
+    (2, "الأربعاء|الاربعاء|أربعاء|اربعاء|wed(?:nesday)?"),
+    (3, "الخميس|خميس|thu(?:r|rs|rsday)?"),
+    (4, "الجمعة|الجمعه|جمعة|fri(?:day)?"),
+    (5, "السبت|سبت|sat(?:urday)?"),
+    (6, "الأحد|الاحد|أحد|احد|sun(?:day)?"),
+]
+
+_TOKEN = re.compile(
+    r"(?P<all_day>24\s*/\s*7|24\s*ساعة|24\s*hours?|طوال اليوم|على مدار الساعة)"
+    r"|(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2}))?\s*"
+    r"(?P<suffix>صباحاً|صباحا|ص|مساءً|مساء|ظهراً|ظهرا|م|a\.?m\.?|p\.?m\.?)?(?!\w)"
+    + "".join(f"|(?P<day{day}>(?<!\\w)(?:{names})(?!\\w))" for day, names in _DAY_NAMES)
+    + r"|(?P<closed>مغلقة|مغلق|عطلة|closed|off)"
+    r"|(?P<range>-|–|—|إلى|الى|حتى|to|until|till)",
+    re.IGNORECASE,
+)
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+_PM_SUFFIXES = ("م", "مساء", "مساءً", "ظهرا", "ظهراً")
+
+def _tokens(text: str) -> List[Tuple[str, object]]:
+    tokens = []
+    for match in _TOKEN.finditer(text.translate(_ARABIC_DIGITS)):
+        if match.group("all_day"):
+            tokens.append(("all_day", None))
+        elif match.group("hour"):
+            suffix = (match.group("suffix") or "").lower().replace(".", "")
+            meridiem = None
+            if suffix:
+                meridiem = "pm" if suffix == "pm" or suffix in _PM_SUFFIXES else "am"
+            tokens.append(("time", (int(match.group("hour")), int(match.group("minute") or 0), meridiem)))
+        elif match.group("closed"):
+            tokens.append(("closed", None))
+        elif match.group("range"):
+            tokens.append(("range", None))
+        else:
+            day = next(day for day, _ in _DAY_NAMES if match.group(f"day{day}"))
+            tokens.append(("day", day))
+    return tokens
+
+def _to_minutes(hour: int, minute: int, meridiem: Optional[str]) -> Optional[int]:
+    if hour > 24 or minute > 59:
+        return None
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+def _daily_interval(start, end) -> Optional[Tuple[int, int]]:
+    """Minutes since midnight for a start/end time pair; end may run past midnight."""
+    (start_hour, start_minute, start_meridiem), (end_hour, end_minute, end_meridiem) = start, end
+    if start_meridiem is None and end_meridiem is not None:
+        # "4 - 8 م": the start takes the end's suffix unless that puts it after the end
+        start_meridiem = end_meridiem
+        if _to_minutes(start_hour, start_minute, start_meridiem) >= _to_minutes(end_hour, end_minute, end_meridiem):
+            start_meridiem = "am"
+    opens = _to_minutes(start_hour, start_minute, start_meridiem)
+    closes = _to_minutes(end_hour, end_minute, end_meridiem)
+    if opens is None or closes is None:
+        return None
+    if closes <= opens and end_meridiem is None and start_hour <= 12 and closes < 12 * 60:
+        # "8 - 4" on a 12-hour clock means until the afternoon
+        closes += 12 * 60
+    if closes <= opens:
+        # Open past midnight ("6 م - 2 ص")
+        closes += MINUTES_PER_DAY
+    return opens, min(closes, opens + MINUTES_PER_DAY)
+
+def _merge(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for opens, closes in sorted(intervals):
+        if merged and opens <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], closes))
+        else:
+            merged.append((opens, closes))
+    return merged
+
+def parse_working_hours(text: Optional[str]) -> List[Tuple[int, int]]:
+    """
+    Weekly opening intervals for a working-hours string.
+
+    Returns sorted, non-overlapping (opens_at, closes_at) pairs in minutes
+    since Monday 00:00, with 0 <= opens_at < closes_at <= MINUTES_PER_WEEK.
+    Intervals running past Sunday midnight are split in two.
+    """
+    if not text:
+        return []
+    tokens = _tokens(text)
+
+    # (days or None for "every day", opens, closes) in minutes since midnight
+    specs: List[Tuple[Optional[Set[int]], int, int]] = []
+    closed_days: Set[int] = set()
+    pending_days: Set[int] = set()
+    last_days: Optional[Set[int]] = None
+
+    position = 0
+    while position < len(tokens):
+        kind, value = tokens[position]
+        following = tokens[position + 1:position + 3]
+        is_range = len(following) == 2 and following[0][0] == "range"
+
+        if kind == "day":
+            if is_range and following[1][0] == "day":
+                # Day ranges may wrap around the week ("السبت - الخميس")
+                last = following[1][1]
+                pending_days.update((value + offset) % 7 for offset in range((last - value) % 7 + 1))
+                position += 3
+                continue
+            pending_days.add(value)
+        elif kind == "closed":
+            closed_days.update(pending_days)
+            pending_days = set()
+        elif kind == "all_day" or (kind == "time" and is_range and following[1][0] == "time"):
+            interval = (0, MINUTES_PER_DAY) if kind == "all_day" else _daily_interval(value, following[1][1])
+            days = pending_days or last_days
+            if interval is not None:
+                specs.append((set(days) if days else None, interval[0], interval[1]))
+            last_days = days
+            pending_days = set()
+            if kind == "time":
+                position += 3
+                continue
+        position += 1
+
+    intervals = []
+    for days, opens, closes in specs:
+        for day in sorted(days if days is not None else ALL_DAYS - closed_days):
+            start, end = day * MINUTES_PER_DAY + opens, day * MINUTES_PER_DAY + closes
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+    return _merge(intervals)
+
+def _timezone(name: str) -> tzinfo:
+    offset = re.fullmatch(r"(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?", name.strip(), re.IGNORECASE)
+    if offset:
+        delta = timedelta(hours=int(offset.group(2)), minutes=int(offset.group(3) or 0))
+        return timezone(-delta if offset.group(1) == "-" else delta)
+    if name.upper() == "UTC":
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError(f"CLINIC_TIMEZONE={name} requires Python 3.9+; use a UTC offset such as +02:00")
+    return ZoneInfo(name)
+
+clinic_timezone = _timezone(CLINIC_TIMEZONE)
+
+def week_minute(moment: datetime) -> int:
+    """Minutes since Monday 00:00 clinic time; naive datetimes are read as clinic time."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(clinic_timezone)
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+def requested_minute(open_at: Optional[datetime], open_now: bool) -> Optional[int]:
+    """Week minute an open filter asks for: open_at if given, now for open_now, else None."""
+    if open_at is not None:
+        return week_minute(open_at)
+    if open_now:
+        return week_minute(datetime.now(clinic_timezone))
+    return None
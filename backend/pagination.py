@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination helpers.
+
+List endpoints return at most one page of rows ordered by a unique key, and
+send an opaque cursor for the next page in the X-Next-Cursor header. The
+cursor encodes the key of the last row, so the next page starts right after
+it without OFFSET scans.
+"""
+import base64
+import json
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+
+# Page size used when the client does not send a limit
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+
+# Largest page the server will return, whatever limit the client asks for
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def page_size(limit: Optional[int]) -> int:
+    """Requested page size clamped to MAX_PAGE_SIZE."""
+    if limit is None:
+        return min(DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(*key: Any) -> str:
+    """Opaque cursor for the row with the given sort key."""
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> Tuple:
+    """Decode a cursor into a sort key, checking its length and value types."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise ValueError(cursor)
+        return tuple(kind(value) for kind, value in zip(types, key))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="مؤشر الصفحة غير صالح")
+
+def split_page(rows: List, size: int) -> Tuple[List, bool]:
+    """Split rows fetched with limit size + 1 into the page and a has-more flag."""
+    return rows[:size], len(rows) > size
+
+def set_next_cursor(response: Response, has_more: bool, *key: Any):
+    """Send the cursor for the next page if there is one."""
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key)
@@ -0,0 +1,349 @@
+"""
+Per-request profiling for admins, and a slow-query log.
+
+A request is profiled when it carries an admin bearer token and the
+X-Profile header, or when it is picked by PROFILE_SAMPLE_RATE. The profile
+holds a cProfile breakdown of the request (the event loop thread, plus work
+sent to the threadpool through database.run) and every SQL statement with
+its parameters, duration and EXPLAIN plan. Profiles are kept in a ring
+buffer of PROFILE_BUFFER_SIZE entries read from /api/admin/profiles; the
+response of a profiled request carries its id in X-Profile-Id.
+
+Only one request per worker is profiled at a time. Under concurrent load
+the event loop thread also runs other requests, so their Python work can
+show up in the breakdown; the SQL list only has the profiled request's
+statements.
+
+Independently of profiling, statements slower than SLOW_QUERY_MS are
+logged with their bind parameters to the "mydoctor.slow_query" logger.
+"""
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+
+import auth
+from utils import LazyModule
+
+# Only needed once a request is profiled
+cProfile = LazyModule("cProfile")
+pstats = LazyModule("pstats")
+
+# Fraction of requests profiled without the header (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+# Functions listed in a profile, by cumulative time
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+# Distinct SELECT statements explained per profile (0 disables EXPLAIN)
+PROFILE_EXPLAIN_LIMIT = int(os.getenv("PROFILE_EXPLAIN_LIMIT", "20"))
+# Statements at least this slow are logged with their parameters (0 disables)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Profiling the profile endpoints themselves would only fill the buffer
+EXCLUDED_PREFIXES = ("/api/admin/profiles", "/metrics")
+
+PARAMETERS_MAX_LENGTH = 500
+
+slow_query_logger = logging.getLogger("mydoctor.slow_query")
+
+def _format_parameters(parameters) -> str:
+    text = repr(parameters)
+    if len(text) > PARAMETERS_MAX_LENGTH:
+        text = text[:PARAMETERS_MAX_LENGTH] + "..."
+    return text
+
+class RequestProfile:
+    """Statements and cProfile data collected for one request."""
+
+    def __init__(self, method: str, path: str, query_string: str, trigger: str):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.loop_thread = threading.get_ident()
+        self.statements: List[dict] = []
+        self.profiler = cProfile.Profile()
+        self.thread_profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add_statement(self, engine, statement: str, parameters, executemany: bool, seconds: float):
+        with self._lock:
+            self.statements.append({
+                "engine": engine,
+                "statement": statement,
+                "parameters": None if executemany else parameters,
+                "executemany": executemany,
+                "duration_ms": seconds * 1000,
+            })
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """Call fn with a profiler of its own when it runs off the event loop thread."""
+        if threading.get_ident() == self.loop_thread:
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self.thread_profilers.append(profiler)
+
+    def functions(self) -> List[dict]:
+        stats = pstats.Stats(self.profiler)
+        for profiler in self.thread_profilers:
+            stats.add(profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": _function_name(key),
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for key, (_, calls, own, cumulative, _) in rows[:PROFILE_TOP_FUNCTIONS]
+        ]
+
+def _function_name(key) -> str:
+    filename, line, name = key
+    if filename == "~":
+        # Built-ins such as {method 'execute' of 'sqlite3.Cursor' objects}
+        return name
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        filename = filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{line}({name})"
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+# One profiled request per worker: cProfile allows one profiler per thread
+_profiling = threading.Lock()
+
+def threaded(fn):
+    """fn, profiled when it runs on the threadpool for a profiled request (see database.run)."""
+    profile = _current.get()
+    if profile is None:
+        return fn
+    return lambda *args, **kwargs: profile.run_in_thread(fn, *args, **kwargs)
+
+class ProfileBuffer:
+    """The last PROFILE_BUFFER_SIZE profiles, newest last."""
+
+    def __init__(self, size: int = PROFILE_BUFFER_SIZE):
+        self._entries: deque = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict) -> int:
+        with self._lock:
+            entry["id"] = next(self._ids)
+            self._entries.append(entry)
+            return entry["id"]
+
+    def summaries(self) -> List[dict]:
+        with self._lock:
+            entries = list(self._entries)
+        return [
+            {key: value for key, value in entry.items() if key not in ("sql", "functions")}
+            for entry in reversed(entries)
+        ]
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            return next((entry for entry in self._entries if entry["id"] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+profile_buffer = ProfileBuffer()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.profile_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "profile_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    profile = _current.get()
+    if profile is not None:
+        profile.add_statement(conn.engine, statement, parameters, executemany, elapsed)
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning(
+            "Slow query (%.1f ms): %s | parameters: %s",
+            elapsed * 1000, " ".join(statement.split()), _format_parameters(parameters)
+        )
+
+_installed_engines = set()
+
+def install(engines):
+    """Attach the statement hooks to engines (once per engine)."""
+    for hooked_engine in engines:
+        if id(hooked_engine) in _installed_engines:
+            continue
+        event.listen(hooked_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(hooked_engine, "after_cursor_execute", _after_cursor_execute)
+        _installed_engines.add(id(hooked_engine))
+
+def _explain_prefix(dialect_name: str) -> str:
+    return "EXPLAIN QUERY PLAN " if dialect_name == "sqlite" else "EXPLAIN "
+
+def _explainable(entry: dict) -> bool:
+    first_word = entry["statement"].lstrip().split(None, 1)[0].upper() if entry["statement"].strip() else ""
+    return not entry["executemany"] and first_word in ("SELECT", "WITH")
+
+def _plan_lines(rows) -> List[str]:
+    # SQLite: (id, parent, notused, detail); PostgreSQL: one text column per line
+    return [str(row[-1]) for row in rows]
+
+def _explain_sync(explained_engine, statements: Dict[str, object]) -> Dict[str, List[str]]:
+    prefix = _explain_prefix(explained_engine.dialect.name)
+    plans = {}
+    with explained_engine.connect() as conn:
+        for statement, parameters in statements.items():
+            try:
+                plans[statement] = _plan_lines(conn.exec_driver_sql(prefix + statement, parameters or ()).fetchall())
+            except Exception as exc:
+                plans[statement] = [f"EXPLAIN failed: {exc}"]
+                conn.rollback()
+    return plans
+
+async def _explain_async(explained_engine, statements: Dict[str, object]) -> Dict[str, List[str]]:
+    prefix = _explain_prefix(explained_engine.dialect.name)
+    plans = {}
+    async with AsyncEngine(explained_engine).connect() as conn:
+        for statement, parameters in statements.items():
+            try:
+                result = await conn.exec_driver_sql(prefix + statement, parameters or ())
+                plans[statement] = _plan_lines(result.fetchall())
+            except Exception as exc:
+                plans[statement] = [f"EXPLAIN failed: {exc}"]
+                await conn.rollback()
+    return plans
+
+async def _explain(entries: List[dict]) -> Dict[str, List[str]]:
+    """EXPLAIN plans for the distinct SELECT statements, on the engine that ran them."""
+    by_engine: Dict[object, Dict[str, object]] = {}
+    explained = 0
+    for entry in entries:
+        if explained >= PROFILE_EXPLAIN_LIMIT:
+            break
+        if not _explainable(entry):
+            continue
+        statements = by_engine.setdefault(entry["engine"], {})
+        if entry["statement"] not in statements:
+            statements[entry["statement"]] = entry["parameters"]
+            explained += 1
+    plans = {}
+    for explained_engine, statements in by_engine.items():
+        if explained_engine.dialect.is_async:
+            plans.update(await _explain_async(explained_engine, statements))
+        else:
+            plans.update(await run_in_threadpool(_explain_sync, explained_engine, statements))
+    return plans
+
+def _is_admin_request(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return False
+            try:
+                return bool(auth.decode_access_token(token).get("sub"))
+            except auth.JWTError:
+                return False
+    return False
+
+def _trigger(scope) -> Optional[str]:
+    """Why this request should be profiled: "header", "sample" or None."""
+    if scope["path"].startswith(EXCLUDED_PREFIXES):
+        return None
+    requested = any(name == PROFILE_HEADER.encode() and value not in (b"", b"0", b"false") for name, value in scope["headers"])
+    if requested and _is_admin_request(scope):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests picked by the X-Profile header or sampling."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = _trigger(scope)
+        if trigger is None or not _profiling.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self._profile(scope, receive, send, trigger)
+        finally:
+            _profiling.release()
+
+    async def _profile(self, scope, receive, send, trigger):
+        profile = RequestProfile(scope["method"], scope["path"], scope["query_string"].decode("latin-1"), trigger)
+        entry = {"started_at": profile.started_at.isoformat() + "Z", "method": profile.method, "path": profile.path,
+                 "query": profile.query_string, "trigger": trigger, "status": 500}
+        # Reserve the id up front so it can go out in the response headers
+        profile_id = profile_buffer.add(entry)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode(), str(profile_id).encode())
+                ]
+            await send(message)
+
+        token = _current.set(profile)
+        start = time.perf_counter()
+        profile.profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.profiler.disable()
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            await self._finish(entry, profile, elapsed)
+
+    async def _finish(self, entry: dict, profile: RequestProfile, elapsed: float):
+        sql_seconds = sum(statement["duration_ms"] for statement in profile.statements) / 1000
+        plans = await _explain(profile.statements) if PROFILE_EXPLAIN_LIMIT > 0 else {}
+        entry.update({
+            "duration_ms": round(elapsed * 1000, 3),
+            "sql_count": len(profile.statements),
+            "sql_ms": round(sql_seconds * 1000, 3),
+            "python_ms": round(max(elapsed - sql_seconds, 0) * 1000, 3),
+            "sql": [
+                {
+                    "statement": statement["statement"],
+                    "parameters": _format_parameters(statement["parameters"]),
+                    "duration_ms": round(statement["duration_ms"], 3),
+                    "plan": plans.get(statement["statement"]),
+                }
+                for statement in profile.statements
+            ],
+            "functions": profile.functions(),
+        })
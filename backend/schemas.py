@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -94,6 +94,47 @@ class ClinicWithDoctorResponse(ClinicResponse):
     class Config:
         from_attributes = True
 
+# Autocomplete schemas
+class Suggestion(BaseModel):
+    type: str  # doctor or clinic
+    id: int
+    name: str
+    specialty: Optional[str] = None
+
+# Batch schemas
+class DoctorBatchUpdate(DoctorUpdate):
+    id: int
+
+class ClinicBatchUpdate(ClinicUpdate):
+    id: int
+
+class BatchDelete(BaseModel):
+    ids: List[int]
+
+class BatchItemResult(BaseModel):
+    index: int  # Position in the request list
+    id: Optional[int] = None
+    status: str  # created, updated, deleted or error
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+# Import schemas (rows of an export-database file)
+class SpecialtyImport(SpecialtyBase):
+    id: int
+
+class DoctorImport(DoctorBase):
+    id: int
+    rating: float = 0.0
+    created_at: Optional[datetime] = None
+
+class ClinicImport(ClinicCreate):
+    id: int
+    created_at: Optional[datetime] = None
+
 # Search request
 class SearchRequest(BaseModel):
     specialty_id: Optional[int] = None
@@ -101,3 +142,7 @@ class SearchRequest(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     max_distance: Optional[float] = 50.0  # km
+    limit: Optional[int] = Field(None, ge=1)  # Page size, capped by the server
+    cursor: Optional[str] = None  # X-Next-Cursor from the previous page
+    open_now: bool = False  # Only clinics open right now
+    open_at: Optional[datetime] = None  # Only clinics open at this time (clinic local time unless it has an offset)
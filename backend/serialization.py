@@ -0,0 +1,179 @@
+"""
+Pre-serialized JSON for the clinic and doctor list endpoints.
+
+Each clinic (ClinicWithDoctorResponse without distance) and doctor
+(DoctorResponse) is serialized once and kept as JSON bytes in
+fragment_cache. A list response is then built by joining those bytes,
+splicing in the per-request distance, and returned as a Response so
+FastAPI does not validate and serialize the rows again. Only rows missing
+from the cache are loaded through the ORM and Pydantic.
+
+Writes invalidate the fragments of the rows they touch; a doctor's
+fragments are dropped together with those of its clinics, which embed it.
+Entries also expire after FRAGMENT_CACHE_TTL seconds so that multiple
+workers converge. Rows read from a read replica shortly after a write are
+served but not cached, since the replica may not have the write yet. orjson is used for encoding when it is installed.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import Response
+from sqlalchemy.orm import Session
+
+import database
+import metrics
+import schemas
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library
+    orjson = None
+
+# Number of serialized rows kept per worker; 0 serializes every row on every request
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "20000"))
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", "60"))
+
+CLINIC = "clinic"
+DOCTOR = "doctor"
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON, the same bytes FastAPI's JSONResponse would produce."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FragmentCache:
+    """LRU of serialized rows keyed by (kind, id), with a doctor -> fragments index."""
+
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_MAX_ENTRIES, ttl: float = FRAGMENT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, bytes, int]]" = OrderedDict()
+        self._by_doctor: Dict[int, Set[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_many(self, kind: str, ids: Iterable[int]) -> Dict[int, bytes]:
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for item_id in ids:
+                entry = self._entries.get((kind, item_id))
+                if entry is None or entry[0] < now:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end((kind, item_id))
+                found[item_id] = entry[1]
+                self.hits += 1
+        return found
+
+    def set(self, kind: str, item_id: int, fragment: bytes, doctor_id: int):
+        if not self.enabled:
+            return
+        key = (kind, item_id)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, fragment, doctor_id)
+            self._by_doctor.setdefault(doctor_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Tuple[str, int]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_doctor.get(entry[2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doctor[entry[2]]
+
+    def invalidate(self, doctor_ids: Iterable[int] = (), clinic_ids: Iterable[int] = ()):
+        """Drop the given clinics, and the given doctors with all of their clinics."""
+        with self._lock:
+            for clinic_id in clinic_ids:
+                self._drop((CLINIC, clinic_id))
+            for doctor_id in doctor_ids:
+                for key in list(self._by_doctor.get(doctor_id, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_doctor.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def _load(db: Session, kind: str, ids: List[int]) -> Dict[int, bytes]:
+    """Serialize rows that are not cached, and cache them."""
+    if kind == CLINIC:
+        model, schema, options = database.Clinic, schemas.ClinicWithDoctorResponse, database.clinic_load_options()
+    else:
+        model, schema, options = database.Doctor, schemas.DoctorResponse, database.doctor_load_options()
+
+    # A lagging replica would otherwise refill the cache with the rows a write just dropped
+    store = not (database.reads_replica(db) and database.read_router.replicas_may_lag())
+    fragments = {}
+    elapsed = 0.0
+    for row in db.query(model).options(*options).filter(model.id.in_(ids)):
+        start = time.perf_counter()
+        data = schema.model_validate(row).model_dump(mode="json", exclude={"distance"})
+        fragment = dumps(data)
+        elapsed += time.perf_counter() - start
+        doctor_id = row.doctor_id if kind == CLINIC else row.id
+        if store:
+            fragment_cache.set(kind, row.id, fragment, doctor_id)
+        fragments[row.id] = fragment
+    metrics.observe_serialization(kind, "rows", elapsed)
+    return fragments
+
+def fragments(db: Session, kind: str, ids: Sequence[int]) -> Dict[int, bytes]:
+    """Serialized rows for ids, from the cache where possible (missing rows are left out)."""
+    found = fragment_cache.get_many(kind, ids) if fragment_cache.enabled else {}
+    missing = [item_id for item_id in ids if item_id not in found]
+    if missing:
+        found.update(_load(db, kind, missing))
+    return found
+
+def clinic_list(db: Session, rows: Sequence[Tuple[int, Optional[float]]]) -> bytes:
+    """JSON array of ClinicWithDoctorResponse for (id, distance) rows, in order."""
+    found = fragments(db, CLINIC, [clinic_id for clinic_id, _ in rows])
+    start = time.perf_counter()
+    parts = []
+    for clinic_id, distance in rows:
+        fragment = found.get(clinic_id)
+        if fragment is not None:
+            # Fragments end with "}"; distance is the model's last field
+            parts.append(fragment[:-1] + b',"distance":' + dumps(distance) + b"}")
+    body = b"[" + b",".join(parts) + b"]"
+    metrics.observe_serialization(CLINIC, "list", time.perf_counter() - start)
+    return body
+
+def doctor_list(db: Session, ids: Sequence[int]) -> bytes:
+    """JSON array of DoctorResponse for ids, in order."""
+    found = fragments(db, DOCTOR, ids)
+    start = time.perf_counter()
+    body = b"[" + b",".join(found[doctor_id] for doctor_id in ids if doctor_id in found) + b"]"
+    metrics.observe_serialization(DOCTOR, "list", time.perf_counter() - start)
+    return body
+
+def json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+# Shared cache used by the API
+fragment_cache = FragmentCache()
@@ -0,0 +1,574 @@
+"""
+Distance queries for clinics.
+
+Two strategies are available, selected with GEO_QUERY_MODE:
+
+- "index" (default): clinics are bucketed into an in-memory lat/lon grid.
+  A page of k results is a k-nearest-neighbour search: cells are visited in
+  rings around the user's cell with a bounded heap of the k closest clinics,
+  stopping as soon as no unvisited cell can hold a closer one, so the cost
+  follows k rather than the number of clinics within max_distance.
+- "database": a bounding-box predicate on the lat/lon index narrows the rows,
+  and the database computes haversine(), orders and limits the result.
+
+With the database strategy, NearbyCache remembers the candidate clinics for
+a quantized user location, so repeated queries from the same neighbourhood
+only re-measure that small candidate set. The index strategy does not use
+it: the k-NN search already touches only the cells around the user.
+"""
+import bisect
+import heapq
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Query, Session
+
+import database
+from utils import bounding_box, calculate_distance, calculate_distances, np, EARTH_RADIUS_KM
+
+# Grid cell size in degrees (0.1° is roughly 11 km of latitude)
+CELL_SIZE_DEGREES = float(os.getenv("SPATIAL_CELL_SIZE", "0.1"))
+
+# Rebuild the index from the database after this many seconds, so that
+# workers which did not see a write themselves eventually catch up.
+INDEX_TTL_SECONDS = float(os.getenv("SPATIAL_INDEX_TTL", "300"))
+
+# "index" or "database" (see module docstring)
+QUERY_MODE = os.getenv("GEO_QUERY_MODE", "index")
+
+# Clinic ids are loaded in batches to stay under the database's bind parameter limit
+CLINIC_ID_BATCH_SIZE = 500
+
+# Grid precision in degrees used to quantize user coordinates for the nearby
+# cache (0.01° is roughly 1 km); 0 disables the cache
+GEO_CACHE_PRECISION = float(os.getenv("GEO_CACHE_PRECISION", "0.01"))
+GEO_CACHE_TTL_SECONDS = float(os.getenv("GEO_CACHE_TTL", "60"))
+GEO_CACHE_MAX_ENTRIES = int(os.getenv("GEO_CACHE_MAX_ENTRIES", "2048"))
+
+Cell = Tuple[int, int]
+Point = Tuple[float, float]
+
+class ClinicIndex:
+    """Grid index mapping clinic ids to their coordinates."""
+
+    def __init__(self, cell_size: float = CELL_SIZE_DEGREES, ttl: float = INDEX_TTL_SECONDS):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.columns = int(math.ceil(360.0 / cell_size - 1e-9))
+        self._cells: Dict[Cell, Dict[int, Point]] = {}
+        self._points: Dict[int, Point] = {}
+        self._arrays: "Dict[Cell, Tuple[np.ndarray, np.ndarray]]" = {}
+        self._built_at: Optional[float] = None
+        self._lock = threading.RLock()
+        # Held by the background refresh, so at most one runs at a time
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _column(self, longitude: float) -> int:
+        longitude = (longitude + 180.0) % 360.0
+        return min(int(longitude // self.cell_size), self.columns - 1)
+
+    def _cell(self, latitude: float, longitude: float) -> Cell:
+        return math.floor(latitude / self.cell_size), self._column(longitude)
+
+    # ---------- maintenance ----------
+
+    def rebuild(self, db: Session):
+        """Load every clinic location from the database."""
+        rows = db.query(
+            database.Clinic.id,
+            database.Clinic.latitude,
+            database.Clinic.longitude
+        ).all()
+
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            self._arrays = {}
+            for clinic_id, latitude, longitude in rows:
+                self._insert(clinic_id, latitude, longitude)
+            self._built_at = time.monotonic()
+
+    def ensure_built(self, db: Session):
+        """
+        Build the index on first use. Once it is older than the TTL, a single
+        background thread rebuilds it and queries keep using the current
+        index in the meantime.
+        """
+        built_at = self._built_at
+        if built_at is None:
+            self.rebuild(db)
+        elif time.monotonic() - built_at > self.ttl and self._refresh_lock.acquire(blocking=False):
+            try:
+                database.run_in_background("clinic-index-refresh", self._refresh)
+            except BaseException:
+                self._refresh_lock.release()
+                raise
+
+    def _refresh(self, db: Session):
+        try:
+            self.rebuild(db)
+        finally:
+            self._refresh_lock.release()
+
+    def clear(self):
+        """Drop all entries and force a rebuild on the next query."""
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            self._arrays = {}
+            self._built_at = None
+
+    def upsert(self, clinic_id: int, latitude: float, longitude: float):
+        """Add a clinic or move it to its new location."""
+        with self._lock:
+            if self._built_at is None:
+                # Not built yet - the next rebuild will read it from the database
+                return
+            self._remove(clinic_id)
+            self._insert(clinic_id, latitude, longitude)
+
+    def remove(self, clinic_id: int):
+        """Remove a clinic from the index (no-op if it is not indexed)."""
+        with self._lock:
+            self._remove(clinic_id)
+
+    def _insert(self, clinic_id: int, latitude: float, longitude: float):
+        point = (latitude, longitude)
+        cell = self._cell(latitude, longitude)
+        self._points[clinic_id] = point
+        self._cells.setdefault(cell, {})[clinic_id] = point
+        self._arrays.pop(cell, None)
+
+    def _remove(self, clinic_id: int):
+        point = self._points.pop(clinic_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        self._arrays.pop(cell, None)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(clinic_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _cell_arrays(self, cell: Cell) -> "Optional[Tuple[np.ndarray, np.ndarray]]":
+        """Contiguous (ids, coordinates) arrays for a cell, built on demand."""
+        arrays = self._arrays.get(cell)
+        if arrays is None:
+            bucket = self._cells.get(cell)
+            if not bucket:
+                return None
+            ids = np.fromiter(bucket.keys(), dtype=np.int64, count=len(bucket))
+            coordinates = np.array(list(bucket.values()), dtype=np.float64)
+            arrays = self._arrays[cell] = (ids, coordinates)
+        return arrays
+
+    # ---------- queries ----------
+
+    def _candidate_cells(self, latitude: float, longitude: float, max_distance: float) -> List[Cell]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, max_distance)
+        min_row = math.floor(min_lat / self.cell_size)
+        max_row = math.floor(max_lat / self.cell_size)
+
+        if min_lon is None or max_lon - min_lon >= 360.0:
+            columns = None
+        else:
+            # Split boxes that cross the antimeridian into two longitude ranges
+            if min_lon < -180.0:
+                spans = [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+            elif max_lon > 180.0:
+                spans = [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+            else:
+                spans = [(min_lon, max_lon)]
+            columns = set()
+            for low, high in spans:
+                first = self._column(low)
+                last = self._column(high) if high < 180.0 else self.columns - 1
+                columns.update(range(first, last + 1))
+
+        rows = range(min_row, max_row + 1)
+        wanted = len(rows) * (len(columns) if columns is not None else self.columns)
+
+        # For very large radii it is cheaper to walk the occupied cells
+        if columns is None or wanted > len(self._cells):
+            return [
+                cell for cell in self._cells
+                if min_row <= cell[0] <= max_row and (columns is None or cell[1] in columns)
+            ]
+
+        return [(row, column) for row in rows for column in columns]
+
+    def nearby(self, latitude: float, longitude: float, max_distance: float) -> List[Tuple[float, int]]:
+        """
+        Find indexed clinics within max_distance km of the given point.
+
+        Returns (distance, clinic_id) pairs sorted by distance, then id.
+        """
+        id_parts = []
+        coordinate_parts = []
+        with self._lock:
+            for cell in self._candidate_cells(latitude, longitude, max_distance):
+                arrays = self._cell_arrays(cell)
+                if arrays is not None:
+                    id_parts.append(arrays[0])
+                    coordinate_parts.append(arrays[1])
+
+        if not id_parts:
+            return []
+
+        ids = np.concatenate(id_parts)
+        distances = calculate_distances(latitude, longitude, np.concatenate(coordinate_parts), max_distance)
+        within = distances <= max_distance
+        ids = ids[within]
+        distances = distances[within]
+
+        order = np.lexsort((ids, distances))
+        return [(float(distances[i]), int(ids[i])) for i in order]
+
+    def nearest(self, latitude: float, longitude: float, k: int, max_distance: float = math.inf,
+                after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int]]:
+        """
+        The k indexed clinics closest to the given point within max_distance km.
+
+        Returns (distance, clinic_id) pairs sorted by distance, then id, that
+        sort after the (distance, id) key in after. Cells are visited in
+        square rings of growing size around the point's cell while a bounded
+        heap keeps the best k; the walk ends once the heap's worst distance is
+        below the distance to every unvisited cell.
+        """
+        # Max-heap of the best k as (-distance, -id): heap[0] is the worst kept match
+        heap: List[Tuple[float, int]] = []
+        with self._lock:
+            row, column = self._cell(latitude, longitude)
+            visited = 0
+            ring = 0
+            while True:
+                cells = self._ring(row, column, ring)
+                last_ring = cells is None
+                if last_ring:
+                    # The ring is larger than what is left: scan the remaining occupied cells
+                    cells = [
+                        cell for cell in self._cells
+                        if max(abs(cell[0] - row), self._column_gap(cell[1], column)) >= ring
+                    ]
+                for cell in cells:
+                    arrays = self._cell_arrays(cell)
+                    if arrays is None:
+                        continue
+                    visited += 1
+                    self._push_nearest(heap, k, arrays, latitude, longitude, max_distance, after)
+                if last_ring or visited >= len(self._cells):
+                    break
+                bound = self._ring_bound(latitude, longitude, row, column, ring)
+                if bound > max_distance or (len(heap) == k and -heap[0][0] < bound):
+                    break
+                ring += 1
+
+        return sorted((-distance, -clinic_id) for distance, clinic_id in heap)
+
+    @staticmethod
+    def _push_nearest(heap, k: int, arrays, latitude: float, longitude: float, max_distance: float,
+                      after: Optional[Tuple[float, int]]):
+        ids, coordinates = arrays
+        distances = calculate_distances(latitude, longitude, coordinates)
+        worst = -heap[0][0] if len(heap) == k else max_distance
+        mask = distances <= min(worst, max_distance)
+        if after is not None:
+            after_distance, after_id = after
+            mask &= (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+        for distance, clinic_id in zip(distances[mask].tolist(), ids[mask].tolist()):
+            item = (-distance, -clinic_id)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def _column_gap(self, column: int, other: int) -> int:
+        gap = abs(column - other) % self.columns
+        return min(gap, self.columns - gap)
+
+    def _ring(self, row: int, column: int, ring: int) -> Optional[List[Cell]]:
+        """
+        Cells at Chebyshev distance ring from (row, column), or None once the
+        ring wraps around the globe or has more cells than are occupied.
+        """
+        if ring == 0:
+            return [(row, column)]
+        if 2 * ring + 1 > self.columns or 8 * ring > len(self._cells):
+            return None
+        first_row = math.floor(-90.0 / self.cell_size)
+        last_row = math.floor(90.0 / self.cell_size)
+        cells = []
+        for ring_row in range(row - ring, row + ring + 1):
+            if not first_row <= ring_row <= last_row:
+                continue
+            if abs(ring_row - row) == ring:
+                offsets = range(-ring, ring + 1)
+            else:
+                offsets = (-ring, ring)
+            cells.extend((ring_row, (column + offset) % self.columns) for offset in offsets)
+        return cells
+
+    def _west_edge(self, column: int) -> float:
+        """Western longitude of a column, unwrapped so that edges keep increasing past +-180."""
+        turns, column = divmod(column, self.columns)
+        return turns * 360.0 + min(column * self.cell_size, 360.0) - 180.0
+
+    def _ring_bound(self, latitude: float, longitude: float, row: int, column: int, ring: int) -> float:
+        """Lower bound in km on the distance from the point to any cell outside the first ring + 1 rings."""
+        south = (row - ring) * self.cell_size
+        north = (row + ring + 1) * self.cell_size
+        bounds = []
+        if south > -90.0:
+            bounds.append(math.radians(latitude - south) * EARTH_RADIUS_KM)
+        if north < 90.0:
+            bounds.append(math.radians(north - latitude) * EARTH_RADIUS_KM)
+        if 2 * ring + 1 < self.columns:
+            longitude = (longitude + 180.0) % 360.0 - 180.0
+            gap = min(longitude - self._west_edge(column - ring), self._west_edge(column + ring + 1) - longitude)
+            if gap >= 90.0:
+                # The closest point of a meridian this far away is the pole
+                bounds.append(math.radians(90.0 - abs(latitude)) * EARTH_RADIUS_KM)
+            else:
+                # Great-circle distance from the point to the meridian gap degrees away
+                bounds.append(math.asin(min(1.0, math.cos(math.radians(latitude)) * math.sin(math.radians(gap)))) * EARTH_RADIUS_KM)
+        return max(0.0, min(bounds)) if bounds else math.inf
+
+class NearbyCache:
+    """
+    Candidate clinics per quantized location, filter scope and distance
+    (database mode only, see find_nearby_ids).
+
+    A location is snapped to a grid of GEO_CACHE_PRECISION degrees. The cache
+    stores every clinic passing the filters within max_distance plus the
+    snapping error of the grid cell's center, which is a superset of the
+    result for any point in that cell. Exact distances are then recomputed
+    for the caller's precise point over just those candidates.
+    """
+
+    def __init__(self, precision: float = GEO_CACHE_PRECISION, ttl: float = GEO_CACHE_TTL_SECONDS,
+                 max_entries: int = GEO_CACHE_MAX_ENTRIES):
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, np.ndarray, np.ndarray]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.precision > 0
+
+    def invalidate(self):
+        """Forget all candidates (called after clinic or doctor writes)."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def matches(self, db: Session, query: Query, latitude: float, longitude: float,
+                max_distance: float, scope: Hashable, limit: Optional[int] = None,
+                after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int]]:
+        """
+        (distance, clinic_id) pairs within max_distance, sorted by distance, then
+        id, starting after the (distance, id) key in after. With a limit only
+        the closest candidates are sorted.
+        """
+        row = round(latitude / self.precision)
+        column = round(longitude / self.precision)
+        key = (row, column, scope, max_distance)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            generation = self._generation
+
+        if entry is None:
+            center_lat = row * self.precision
+            center_lon = column * self.precision
+            half = self.precision / 2
+            slack = max(
+                calculate_distance(center_lat, center_lon, center_lat + dlat, center_lon + half)
+                for dlat in (-half, half)
+            )
+            ids, coordinates = _candidates(db, query, center_lat, center_lon, max_distance + slack)
+            entry = (time.monotonic() + self.ttl, ids, coordinates)
+
+            with self._lock:
+                # Skip storing if a write invalidated the cache meanwhile
+                if generation == self._generation:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        _, ids, coordinates = entry
+        if len(ids) == 0:
+            return []
+        distances = calculate_distances(latitude, longitude, coordinates, max_distance)
+        within = distances <= max_distance
+        if after is not None:
+            after_distance, after_id = after
+            within &= (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+        ids = ids[within]
+        distances = distances[within]
+        if limit is not None and len(ids) > limit:
+            # Partial selection; keep ties with the limit-th distance so ids still break them
+            kth = np.partition(distances, limit - 1)[limit - 1]
+            closest = distances <= kth
+            ids = ids[closest]
+            distances = distances[closest]
+        order = np.lexsort((ids, distances))[:limit]
+        return [(float(distances[i]), int(ids[i])) for i in order]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "precision": self.precision,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+# Shared index and cache used by the API
+clinic_index = ClinicIndex()
+nearby_cache = NearbyCache()
+
+def distance_expression(latitude: float, longitude: float):
+    """SQL expression for the distance in km from the given point to each clinic."""
+    return func.haversine(latitude, longitude, database.Clinic.latitude, database.Clinic.longitude)
+
+def nearby_query(query: Query, latitude: float, longitude: float, max_distance: float,
+                 limit: Optional[int] = None, after: Optional[Tuple[float, int]] = None) -> Query:
+    """
+    Restrict a Clinic query to clinics within max_distance km, closest first.
+
+    The query yields (Clinic, distance) rows. The bounding box is applied
+    before the distance so the database can use ix_clinics_lat_lon. If after
+    is a (distance, id) key, only rows sorting after it are returned.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, max_distance)
+    query = query.filter(database.Clinic.latitude.between(min_lat, max_lat))
+
+    if min_lon is not None:
+        clinic_lon = database.Clinic.longitude
+        if min_lon < -180.0:
+            query = query.filter(or_(clinic_lon >= min_lon + 360.0, clinic_lon <= max_lon))
+        elif max_lon > 180.0:
+            query = query.filter(or_(clinic_lon >= min_lon, clinic_lon <= max_lon - 360.0))
+        else:
+            query = query.filter(clinic_lon.between(min_lon, max_lon))
+
+    distance = distance_expression(latitude, longitude)
+    distance_column = distance.label("distance")
+    query = query.add_columns(distance_column)
+    query = query.filter(distance <= max_distance).order_by(distance_column, database.Clinic.id)
+
+    if after is not None:
+        after_distance, after_id = after
+        query = query.filter(or_(
+            distance > after_distance,
+            and_(distance == after_distance, database.Clinic.id > after_id)
+        ))
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def find_nearby_ids(db: Session, query: Query, latitude: float, longitude: float, max_distance: float,
+                    limit: Optional[int] = None, after: Optional[Tuple[float, int]] = None,
+                    cache_scope: Optional[Hashable] = None) -> List[Tuple[float, int]]:
+    """
+    (distance, id) matches for the clinics of a Clinic query within
+    max_distance km, sorted by distance, then id, starting after the
+    (distance, id) key in after, up to limit.
+
+    In index mode a limit makes this a k-NN search on clinic_index. In
+    database mode cache_scope, which identifies the query's filters, makes
+    candidates come from nearby_cache.
+    """
+    if QUERY_MODE == "index":
+        clinic_index.ensure_built(db)
+        if limit is not None:
+            return _nearest_matches(query, latitude, longitude, max_distance, limit, after)
+        matches = clinic_index.nearby(latitude, longitude, max_distance)
+        if after is not None:
+            matches = matches[bisect.bisect_right(matches, tuple(after)):]
+        return _filter_matches(query, matches)
+
+    if cache_scope is not None and nearby_cache.enabled:
+        return nearby_cache.matches(
+            db, query, latitude, longitude, max_distance, cache_scope, limit=limit, after=after
+        )
+
+    rows = nearby_query(
+        query.with_entities(database.Clinic.id), latitude, longitude, max_distance, limit=limit, after=after
+    )
+    return [(distance, clinic_id) for clinic_id, distance in rows]
+
+def _nearest_matches(query: Query, latitude: float, longitude: float, max_distance: float,
+                     limit: int, after: Optional[Tuple[float, int]]) -> List[Tuple[float, int]]:
+    """
+    The limit closest clinics passing the query's filters, by k-NN on the index.
+    Neighbours are fetched in batches that double until enough pass the filters
+    or none are left within max_distance.
+    """
+    kept = []
+    batch_size = max(limit, CLINIC_ID_BATCH_SIZE)
+    while True:
+        matches = clinic_index.nearest(latitude, longitude, batch_size, max_distance, after)
+        kept.extend(_filter_matches(query, matches, limit - len(kept)))
+        if len(kept) >= limit or len(matches) < batch_size:
+            return kept[:limit]
+        after = matches[-1]
+        batch_size *= 2
+
+def _candidates(db: Session, query: Query, latitude: float, longitude: float,
+                radius: float) -> "Tuple[np.ndarray, np.ndarray]":
+    """Ids and coordinates of the clinics matching query within radius km."""
+    rows = nearby_query(
+        query.with_entities(database.Clinic.id, database.Clinic.latitude, database.Clinic.longitude),
+        latitude, longitude, radius
+    ).all()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    coordinates = np.array([(row[1], row[2]) for row in rows], dtype=np.float64).reshape(-1, 2)
+    return ids, coordinates
+
+def _filter_matches(query: Query, matches: List[Tuple[float, int]],
+                    limit: Optional[int] = None) -> List[Tuple[float, int]]:
+    """
+    Drop (distance, id) matches the query filters out (e.g. by specialty)
+    using id-only queries, stopping once limit matches are kept.
+    """
+    id_query = query.with_entities(database.Clinic.id)
+    kept = []
+    for batch in _batches(matches):
+        allowed = {
+            clinic_id for (clinic_id,)
+            in id_query.filter(database.Clinic.id.in_([clinic_id for _, clinic_id in batch]))
+        }
+        kept.extend(match for match in batch if match[1] in allowed)
+        if limit is not None and len(kept) >= limit:
+            return kept[:limit]
+    return kept
+
+def _batches(matches: List[Tuple[float, int]]):
+    """Split (distance, id) matches into CLINIC_ID_BATCH_SIZE chunks."""
+    for start in range(0, len(matches), CLINIC_ID_BATCH_SIZE):
+        yield matches[start:start + CLINIC_ID_BATCH_SIZE]
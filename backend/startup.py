@@ -0,0 +1,78 @@
+"""
+Startup work for main.py and the one-off admin bootstrap.
+
+Each phase of the startup event is timed by `timer` and reported in one
+line when the app is ready; the same figures are exported as
+mydoctor_startup_seconds by metrics.py. With FAST_START=1 the default
+admin is not created at startup: run create_admin.py once instead (it uses
+ensure_admin below) so that no password is hashed while the server boots.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import auth
+import database
+
+# Skips work that only a fresh database needs (see BOOTSTRAP_ADMIN)
+FAST_START = database.env_flag("FAST_START", False)
+# Create admin/admin123 at startup when no admin named "admin" exists
+BOOTSTRAP_ADMIN = database.env_flag("BOOTSTRAP_ADMIN", not FAST_START)
+
+DEFAULT_ADMIN_USERNAME = "admin"
+DEFAULT_ADMIN_PASSWORD = "admin123"
+DEFAULT_ADMIN_EMAIL = "admin@mydoctor.com"
+
+class StartupTimer:
+    """Seconds spent in each named startup phase, in the order they ran."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def report(self) -> str:
+        parts = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        return f"{self.total() * 1000:.0f}ms ({parts})"
+
+timer = StartupTimer()
+
+def ensure_admin(username: str, password: str, email: Optional[str] = None,
+                 reset_password: bool = False) -> str:
+    """
+    Create the admin if missing. An existing admin keeps its password unless
+    reset_password. Returns "created", "updated" or "exists".
+    """
+    db = database.SessionLocal()
+    try:
+        admin = db.query(database.Admin).filter(database.Admin.username == username).first()
+        if admin is None:
+            db.add(database.Admin(
+                username=username,
+                password_hash=auth.hash_password_in_pool(password),
+                email=email,
+            ))
+            result = "created"
+        elif reset_password:
+            admin.password_hash = auth.hash_password_in_pool(password)
+            if email is not None:
+                admin.email = email
+            result = "updated"
+        else:
+            return "exists"
+        db.commit()
+        return result
+    finally:
+        db.close()
@@ -0,0 +1,286 @@
+"""
+Doctor name search.
+
+Names are compared in their normalize_arabic() form, stored in
+doctors.name_normalized, so "د. محمّد" and "دكتور محمد" find each other.
+Matching is by substring, like the LIKE '%term%' filter it replaces, but
+served by an index and ranked by relevance. Backends:
+
+- fts5: SQLite FTS5 table with the trigram tokenizer, ranked by bm25
+- pg_trgm: GIN trigram index on PostgreSQL, ranked by similarity()
+- ngram: in-process trigram index, for databases without either extension
+- like: plain LIKE on name_normalized (no index)
+
+TEXT_SEARCH_BACKEND=auto picks fts5 or pg_trgm for the current database
+and falls back to ngram when the extension is not available. Terms shorter
+than a trigram are matched with LIKE by every backend.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Integer, and_, column, func, literal_column, or_, select, table, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import database
+from utils import normalize_arabic
+
+# auto, fts5, pg_trgm, ngram or like
+TEXT_SEARCH_BACKEND = os.getenv("TEXT_SEARCH_BACKEND", "auto")
+
+# Seconds before the ngram index is rebuilt, so multiple workers converge after writes
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+NGRAM = 3
+
+# Added to the ngram rank of matches that do not start a word, so they sort
+# after every word-start match
+MID_WORD_RANK = 1_000_000
+
+# Most doctor ids the ngram backend inlines as IN (...) in a query; broader
+# terms are filtered with LIKE instead, which keeps statements small and
+# under SQLite's bound-parameter limit
+NGRAM_MAX_INLINE_IDS = int(os.getenv("NGRAM_MAX_INLINE_IDS", "500"))
+
+_fts = table("doctor_fts", column("rowid", Integer))
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS doctor_fts USING fts5("
+    "name_normalized, content='doctors', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS doctors_fts_insert AFTER INSERT ON doctors BEGIN "
+    "INSERT INTO doctor_fts(rowid, name_normalized) VALUES (new.id, new.name_normalized); END",
+    "CREATE TRIGGER IF NOT EXISTS doctors_fts_delete AFTER DELETE ON doctors BEGIN "
+    "INSERT INTO doctor_fts(doctor_fts, rowid, name_normalized) VALUES ('delete', old.id, old.name_normalized); END",
+    "CREATE TRIGGER IF NOT EXISTS doctors_fts_update AFTER UPDATE OF name_normalized ON doctors BEGIN "
+    "INSERT INTO doctor_fts(doctor_fts, rowid, name_normalized) VALUES ('delete', old.id, old.name_normalized); "
+    "INSERT INTO doctor_fts(rowid, name_normalized) VALUES (new.id, new.name_normalized); END",
+]
+
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_doctors_name_trgm ON doctors USING gin (name_normalized gin_trgm_ops)",
+]
+
+def normalize(term: Optional[str]) -> str:
+    """Search form of a user-supplied term ("" means no name filter)."""
+    return normalize_arabic(term) if term else ""
+
+class LikeBackend:
+    """Substring match on name_normalized without an index."""
+
+    name = "like"
+
+    def setup(self, engine) -> bool:
+        return True
+
+    def invalidate(self):
+        pass
+
+    def condition(self, db, term: str):
+        """Filter on database.Doctor for doctors whose name contains term."""
+        return database.Doctor.name_normalized.contains(term, autoescape=True)
+
+    def search(self, db, term: str, specialty_id: Optional[int], limit: int,
+               after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int]]:
+        """
+        (rank, id) of matching doctors, best match (lowest rank) first,
+        starting after the (rank, id) key in after.
+        """
+        rank, query = self._ranked(db, term)
+        if specialty_id:
+            query = query.where(database.Doctor.specialty_id == specialty_id)
+        if after is not None:
+            after_rank, after_id = after
+            query = query.where(or_(
+                rank > after_rank,
+                and_(rank == after_rank, database.Doctor.id > after_id)
+            ))
+        rows = db.execute(query.order_by(rank, database.Doctor.id).limit(limit))
+        return [(float(doctor_rank), doctor_id) for doctor_rank, doctor_id in rows]
+
+    def _ranked(self, db, term: str):
+        """Rank expression (lower is better) and a select of (rank, id) for the matches."""
+        rank = func.length(database.Doctor.name_normalized)
+        return rank, select(rank, database.Doctor.id).where(self.condition(db, term))
+
+class Fts5Backend(LikeBackend):
+    """SQLite FTS5 trigram index kept in sync with doctors by triggers."""
+
+    name = "fts5"
+
+    def setup(self, engine) -> bool:
+        try:
+            with engine.begin() as connection:
+                existing = set(connection.execute(text(
+                    "SELECT name FROM sqlite_master WHERE name IN "
+                    "('doctor_fts', 'doctors_fts_insert', 'doctors_fts_delete', 'doctors_fts_update')"
+                )).scalars())
+                for statement in SQLITE_FTS:
+                    connection.execute(text(statement))
+                # New table, or triggers lost with a recreated doctors table
+                if len(existing) < 4:
+                    connection.execute(text("INSERT INTO doctor_fts(doctor_fts) VALUES ('rebuild')"))
+        except SQLAlchemyError:
+            return False  # No FTS5 or no trigram tokenizer in this SQLite build
+        return True
+
+    @staticmethod
+    def _match(term: str):
+        phrase = '"' + term.replace('"', '""') + '"'
+        return text("doctor_fts MATCH :fts_query").bindparams(fts_query=phrase)
+
+    def condition(self, db, term: str):
+        if len(term) < NGRAM:
+            return super().condition(db, term)
+        return database.Doctor.id.in_(select(_fts.c.rowid).where(self._match(term)))
+
+    def _ranked(self, db, term: str):
+        if len(term) < NGRAM:
+            return super()._ranked(db, term)
+        rank = literal_column("bm25(doctor_fts)")
+        query = (
+            select(rank, database.Doctor.id)
+            .join(_fts, _fts.c.rowid == database.Doctor.id)
+            .where(self._match(term))
+        )
+        return rank, query
+
+class TrigramBackend(LikeBackend):
+    """PostgreSQL pg_trgm GIN index, which serves LIKE '%term%' directly."""
+
+    name = "pg_trgm"
+
+    def setup(self, engine) -> bool:
+        try:
+            with engine.begin() as connection:
+                for statement in POSTGRES_TRGM:
+                    connection.execute(text(statement))
+        except SQLAlchemyError:
+            return False  # Extension not installed and not creatable by this user
+        return True
+
+    def _ranked(self, db, term: str):
+        if len(term) < NGRAM:
+            return super()._ranked(db, term)
+        rank = -func.similarity(database.Doctor.name_normalized, term)
+        return rank, select(rank, database.Doctor.id).where(self.condition(db, term))
+
+class NgramIndex:
+    """
+    In-process trigram index over normalized doctor names.
+
+    Built from the database on first use and again every SEARCH_INDEX_TTL
+    seconds or after invalidate(). Candidates are the intersection of the
+    term's trigram posting sets, then checked for the full substring.
+    """
+
+    def __init__(self, ttl: int = SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._grams: Dict[str, Set[int]] = {}
+        self._doctors: Dict[int, Tuple[str, int]] = {}  # id -> (name_normalized, specialty_id)
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def ensure_built(self, db):
+        with self._lock:
+            if self._built_at is not None and time.monotonic() - self._built_at < self.ttl:
+                return
+            rows = db.execute(select(
+                database.Doctor.id, database.Doctor.name_normalized, database.Doctor.specialty_id
+            )).all()
+            grams: Dict[str, Set[int]] = {}
+            for doctor_id, name, _ in rows:
+                for gram in _ngrams(name or ""):
+                    grams.setdefault(gram, set()).add(doctor_id)
+            self._grams = grams
+            self._doctors = {doctor_id: (name or "", specialty_id) for doctor_id, name, specialty_id in rows}
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def search(self, term: str, specialty_id: Optional[int] = None) -> List[Tuple[float, int]]:
+        """(rank, id) of matching doctors: word-start matches first, then shorter names."""
+        with self._lock:
+            doctors = self._doctors
+            if len(term) < NGRAM:
+                candidates = doctors.keys()
+            else:
+                postings = sorted((self._grams.get(gram, set()) for gram in _ngrams(term)), key=len)
+                candidates = set.intersection(*postings) if postings else set()
+            matches = []
+            for doctor_id in candidates:
+                name, doctor_specialty = doctors[doctor_id]
+                if specialty_id and doctor_specialty != specialty_id:
+                    continue
+                position = name.find(term)
+                if position < 0:
+                    continue
+                word_start = position == 0 or name[position - 1] == " "
+                matches.append((float(len(name) if word_start else MID_WORD_RANK + len(name)), doctor_id))
+        matches.sort()
+        return matches
+
+def _ngrams(text_value: str) -> Set[str]:
+    return {text_value[i:i + NGRAM] for i in range(len(text_value) - NGRAM + 1)}
+
+class NgramBackend(LikeBackend):
+    """Searches the in-process NgramIndex and filters queries by id."""
+
+    name = "ngram"
+
+    def __init__(self):
+        self.index = NgramIndex()
+
+    def invalidate(self):
+        self.index.invalidate()
+
+    def condition(self, db, term: str):
+        if len(term) < NGRAM:
+            return super().condition(db, term)
+        self.index.ensure_built(db)
+        matches = self.index.search(term)
+        if len(matches) > NGRAM_MAX_INLINE_IDS:
+            return super().condition(db, term)
+        return database.Doctor.id.in_([doctor_id for _, doctor_id in matches])
+
+    def search(self, db, term: str, specialty_id: Optional[int], limit: int,
+               after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int]]:
+        self.index.ensure_built(db)
+        matches = self.index.search(term, specialty_id)
+        if after is not None:
+            matches = matches[bisect.bisect_right(matches, tuple(after)):]
+        return matches[:limit]
+
+BACKENDS = {
+    "like": LikeBackend,
+    "fts5": Fts5Backend,
+    "pg_trgm": TrigramBackend,
+    "ngram": NgramBackend,
+}
+
+# Used until setup() runs (e.g. in scripts that never start the app)
+backend = LikeBackend()
+
+def setup(engine=None, name: str = TEXT_SEARCH_BACKEND):
+    """Create the index for the configured backend and make it the active one."""
+    global backend
+    engine = engine if engine is not None else database.engine
+    if name == "auto":
+        name = {"sqlite": "fts5", "postgresql": "pg_trgm"}.get(engine.dialect.name, "ngram")
+        chosen = BACKENDS[name]()
+        if not chosen.setup(engine):
+            chosen = NgramBackend()
+    else:
+        chosen = BACKENDS[name]()
+        if not chosen.setup(engine):
+            raise RuntimeError(f"TEXT_SEARCH_BACKEND={name} is not available on this database")
+    backend = chosen
+    return backend
+
+def invalidate():
+    """Call after doctor names change (only the ngram backend keeps state)."""
+    backend.invalidate()
@@ -1,4 +1,28 @@
-from math import radians, sin, cos, sqrt, atan2
+import importlib
+import re
+from math import radians, degrees, sin, cos, sqrt, atan2, asin
+from typing import Optional, Tuple
+
+class LazyModule:
+    """
+    Stand-in for a module that imports it on first attribute access, so
+    heavy dependencies (numpy, python-jose's crypto backends) are loaded by
+    the first request that needs them instead of at startup.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        # Later lookups go straight to the module
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+np = LazyModule("numpy")
+
+# Earth's radius in kilometers
+EARTH_RADIUS_KM = 6371.0
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -15,7 +39,7 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
         Distance in kilometers
     """
     # Earth's radius in kilometers
-    R = 6371.0
+    R = EARTH_RADIUS_KM
     
     # Convert coordinates to radians
     lat1_rad = radians(lat1)
@@ -33,3 +57,100 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     
     distance = R * c
     return distance
+
+def bounding_box(lat: float, lon: float, max_distance: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    """
+    Smallest lat/lon box that contains every point within max_distance km.
+    
+    Args:
+        lat: Latitude of the center point
+        lon: Longitude of the center point
+        max_distance: Radius in kilometers
+    
+    Returns:
+        (min_lat, max_lat, min_lon, max_lon). The longitude bounds are None when
+        the circle spans every meridian (near the poles or for huge radii), and
+        may fall outside [-180, 180] when the box crosses the antimeridian.
+    """
+    angular = max_distance / EARTH_RADIUS_KM
+    lat_rad = radians(lat)
+    min_lat = degrees(lat_rad - angular)
+    max_lat = degrees(lat_rad + angular)
+    
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+    
+    ratio = sin(angular) / cos(lat_rad)
+    if ratio >= 1.0:
+        return min_lat, max_lat, None, None
+    
+    delta_lon = degrees(asin(ratio))
+    return min_lat, max_lat, lon - delta_lon, lon + delta_lon
+
+def calculate_distances(lat: float, lon: float, coordinates, max_distance: Optional[float] = None) -> "np.ndarray":
+    """
+    Vectorized Haversine distance from one point to many points.
+    Returns distances in kilometers, in the same order as the input.
+    
+    Args:
+        lat: Latitude of the origin
+        lon: Longitude of the origin
+        coordinates: Array-like of shape (n, 2) holding (latitude, longitude) pairs
+        max_distance: Optional radius in kilometers. Points outside its bounding
+            box skip the trigonometry and get a distance of infinity.
+    
+    Returns:
+        NumPy array of n distances in kilometers
+    """
+    points = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    lats = points[:, 0]
+    lons = points[:, 1]
+    
+    if max_distance is not None:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, max_distance)
+        mask = (lats >= min_lat) & (lats <= max_lat)
+        if min_lon is not None:
+            # Wrapped longitude difference handles boxes across the antimeridian
+            half_width = (max_lon - min_lon) / 2
+            mask &= np.abs((lons - lon + 180.0) % 360.0 - 180.0) <= half_width
+        distances = np.full(len(points), np.inf)
+        if mask.any():
+            distances[mask] = calculate_distances(lat, lon, points[mask])
+        return distances
+    
+    lat1_rad = radians(lat)
+    lon1_rad = radians(lon)
+    lat2_rad = np.radians(lats)
+    lon2_rad = np.radians(lons)
+    
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    
+    # Same Haversine formula as calculate_distance, one pass over the array
+    a = np.sin(dlat / 2)**2 + cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    return EARTH_RADIUS_KM * c
+
+# Tashkeel (harakat, tanween, shadda, sukun, superscript alef) and tatweel
+_ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+# Alef variants -> bare alef, taa marbuta -> haa, alef maqsura -> yaa
+_ARABIC_LETTERS = str.maketrans({
+    "\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627",
+    "\u0629": "\u0647", "\u0649": "\u064a",
+})
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# Titles dropped from the start of a name ("د.", "دكتور", "Dr." ...), already normalized
+_NAME_TITLES = {"د", "دكتور", "الدكتور", "دكتوره", "الدكتوره", "dr", "doctor"}
+
+def normalize_arabic(text: str) -> str:
+    """
+    Normalize a name for searching: strip tashkeel and tatweel, unify alef
+    variants, taa marbuta and alef maqsura, lowercase, drop punctuation and
+    leading titles such as "د." or "دكتور", and collapse whitespace.
+    """
+    text = _ARABIC_MARKS.sub("", text).translate(_ARABIC_LETTERS).lower()
+    words = _PUNCTUATION.sub(" ", text).split()
+    while words and words[0] in _NAME_TITLES:
+        words = words[1:]
+    return " ".join(words)